@@ -0,0 +1,118 @@
+import os
+import sys
+import json
+import time
+import random
+import logging
+import platform
+from app.extrair_texto import (
+    NLP, MAX_CHUNK_TOKENS, MIN_CHUNK_TOKENS, OVERLAP_TOKENS, MAX_CHUNK_BYTES,
+    semantic_segmentation_with_overlap, preprocess_pages, extract_pages_from_pdf
+)
+
+# Benchmark do chunker: compara a segmentação atual (uma passada do SpaCy e somas de prefixo) com a
+# implementação anterior, que re-tokenizava cada sentença e cada janela de sobreposição, e confere
+# que os chunks são idênticos. Sem BENCHMARK_CHUNKING_FILE (um PDF), usa uma lei sintética com
+# BENCHMARK_CHUNKING_ARTICLES artigos (o padrão dá algumas centenas de páginas).
+BENCHMARK_CHUNKING_FILE = os.getenv("BENCHMARK_CHUNKING_FILE", "")
+BENCHMARK_CHUNKING_ARTICLES = int(os.getenv("BENCHMARK_CHUNKING_ARTICLES", "1500"))
+BENCHMARK_CHUNKING_REPEAT = int(os.getenv("BENCHMARK_CHUNKING_REPEAT", "1"))
+BENCHMARK_CHUNKING_OUTPUT = os.getenv("BENCHMARK_CHUNKING_OUTPUT", "benchmark_chunking.json")
+
+WORDS = (
+    "contratação licitação administração pública contrato proposta edital fornecedor órgão entidade "
+    "pregão dispensa inexigibilidade garantia prazo pagamento fiscalização sanção regulamento obra "
+    "serviço aquisição preço valor estimado competência processo julgamento habilitação recurso"
+).split()
+
+def synthetic_law(n_articles, seed=42):
+    """Texto no formato de uma lei (artigos, parágrafos e incisos), já pré-processado."""
+    rng = random.Random(seed)
+
+    def sentence(min_words=8, max_words=40):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+        return " ".join(words).capitalize() + "."
+
+    parts = []
+    for article in range(1, n_articles + 1):
+        parts.append(f"Art. {article}º {sentence()}")
+        for item in range(rng.randint(0, 4)):
+            parts.append(f"{'I' * (item + 1)} - {sentence(4, 20)}")
+        for paragraph in range(1, rng.randint(1, 3)):
+            parts.append(f"§ {paragraph}º {sentence()} {sentence()}")
+    return " ".join(parts)
+
+def legacy_segmentation(text):
+    """Segmentação anterior, mantida só como referência de tempo e de resultado."""
+    doc = NLP(text)
+    sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+    chunks = []
+    current_chunk = []
+    current_token_count = 0
+    for idx, sentence in enumerate(sentences):
+        sentence_tokens = len(list(NLP(sentence)))
+        if current_token_count + sentence_tokens > MAX_CHUNK_TOKENS:
+            chunk_text = " ".join(current_chunk)
+            if len(chunk_text.encode('utf-8')) <= MAX_CHUNK_BYTES and current_token_count >= MIN_CHUNK_TOKENS:
+                chunks.append(chunk_text)
+            overlap_start = max(0, idx - int(OVERLAP_TOKENS / (sentence_tokens or 1)))
+            current_chunk = sentences[overlap_start:idx]
+            current_token_count = sum(len(list(NLP(sent))) for sent in current_chunk)
+        else:
+            current_chunk.append(sentence)
+            current_token_count += sentence_tokens
+    if current_chunk:
+        chunk_text = " ".join(current_chunk)
+        if len(chunk_text.encode('utf-8')) <= MAX_CHUNK_BYTES and current_token_count >= MIN_CHUNK_TOKENS:
+            chunks.append(chunk_text)
+    return chunks
+
+def best_time(segment, text, repeat=1):
+    """Menor tempo (segundos) de repeat execuções e os chunks da última."""
+    best, chunks = None, None
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        chunks = segment(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, chunks
+
+def run_benchmark(text, source, repeat=BENCHMARK_CHUNKING_REPEAT):
+    # O limite padrão do SpaCy (1M caracteres) barraria leis longas numa única chamada
+    NLP.max_length = max(NLP.max_length, len(text) + 1)
+    legacy_seconds, legacy_chunks = best_time(legacy_segmentation, text, repeat)
+    current_seconds, current_chunks = best_time(semantic_segmentation_with_overlap, text, repeat)
+    result = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": source,
+            "characters": len(text),
+            "words": len(text.split()),
+            "repeat": repeat,
+            "spacy_model": NLP.meta.get("name"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+        },
+        "chunks": len(current_chunks),
+        "identical": legacy_chunks == current_chunks,
+        "legacy_seconds": legacy_seconds,
+        "current_seconds": current_seconds,
+        "speedup": legacy_seconds / current_seconds if current_seconds > 0 else None,
+    }
+    logging.info(f"Benchmark de chunking: {result}")
+    return result
+
+if __name__ == "__main__":
+    if BENCHMARK_CHUNKING_FILE:
+        text, _ = preprocess_pages(extract_pages_from_pdf(BENCHMARK_CHUNKING_FILE))
+        source = BENCHMARK_CHUNKING_FILE
+    else:
+        text = synthetic_law(BENCHMARK_CHUNKING_ARTICLES)
+        source = f"synthetic:{BENCHMARK_CHUNKING_ARTICLES} artigos"
+    report = run_benchmark(text, source)
+    with open(BENCHMARK_CHUNKING_OUTPUT, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"Chunks: {report['chunks']} (idênticos: {report['identical']}). "
+          f"Anterior: {report['legacy_seconds']:.2f}s, atual: {report['current_seconds']:.2f}s "
+          f"({report['speedup']:.1f}x). Resultado em {BENCHMARK_CHUNKING_OUTPUT}.")
+    sys.exit(0 if report["identical"] else 1)
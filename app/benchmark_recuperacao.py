@@ -0,0 +1,221 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import tempfile
+import numpy as np
+import faiss
+from concurrent.futures import ThreadPoolExecutor
+from app.indice_faiss import create_index, train_index, exact_neighbors, recall_at_k
+from app.indice_incremental import CHUNK_IDS_FILE, chunk_ids
+from app.indice_sharded import shards_dir_for, shard_rows, shard_path, write_manifest
+from app.recuperacao import RetrievalEngine, close_artifacts
+
+# Benchmark do caminho de busca: constrói cada configuração num diretório temporário, no mesmo
+# layout lido pelo RetrievalEngine, e mede recall@k contra a busca exata, latência por consulta,
+# QPS com N threads, memória e tempo de construção. O resultado é gravado em JSON.
+# Sem BENCHMARK_EMBEDDINGS, usa um corpus sintético de BENCHMARK_N vetores agrupados.
+BENCHMARK_EMBEDDINGS = os.getenv("BENCHMARK_EMBEDDINGS", "")
+BENCHMARK_N = int(os.getenv("BENCHMARK_N", "20000"))
+BENCHMARK_DIM = int(os.getenv("BENCHMARK_DIM", "768"))
+BENCHMARK_QUERIES = int(os.getenv("BENCHMARK_QUERIES", "200"))
+BENCHMARK_K = int(os.getenv("BENCHMARK_K", "10"))
+BENCHMARK_THREADS = [int(t) for t in os.getenv("BENCHMARK_THREADS", "1,4,8").split(",") if t]
+BENCHMARK_OUTPUT = os.getenv("BENCHMARK_OUTPUT", "benchmark_recuperacao.json")
+# Configurações extras (lista JSON) substituem as padrão, ex.: '[{"index_type": "hnsw", "ef_search": 64}]'
+BENCHMARK_CONFIGS = os.getenv("BENCHMARK_CONFIGS", "")
+
+DEFAULT_CONFIGS = [
+    {"index_type": "flat"},
+    {"index_type": "ivf_flat", "nprobe": 8},
+    {"index_type": "ivf_flat", "nprobe": 32},
+    {"index_type": "ivf_pq", "nprobe": 32, "rescore_factor": 4},
+    {"index_type": "hnsw", "ef_search": 64},
+    {"index_type": "sq8", "rescore_factor": 4},
+    {"index_type": "flat", "n_shards": 4},
+    {"index_type": "flat", "n_shards": 4, "shard_backend": "process"},
+]
+# Parâmetros de consulta/carga passados ao RetrievalEngine (o resto vai para create_index)
+ENGINE_PARAMS = ("nprobe", "ef_search", "rescore_factor", "shard_backend", "mmap")
+
+def synthetic_corpus(n_vectors, dimension, n_clusters=64, seed=42):
+    """Vetores agrupados em torno de n_clusters centros, mais próximos da distribuição de embeddings reais."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(n_clusters, dimension)).astype('float32')
+    labels = rng.integers(0, n_clusters, n_vectors)
+    return centers[labels] + 0.3 * rng.normal(size=(n_vectors, dimension)).astype('float32')
+
+def make_queries(embeddings, n_queries, noise=0.05, seed=42):
+    """Consultas próximas (mas não iguais) a chunks do corpus."""
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+    queries = np.asarray(embeddings[rows], dtype='float32')
+    scale = noise * float(np.abs(queries).mean() or 1.0)
+    return queries + scale * rng.normal(size=queries.shape).astype('float32')
+
+def current_rss():
+    """Memória residente do processo em bytes (Linux); None quando /proc não está disponível."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def write_benchmark_artifacts(data_dir, embeddings, index_type="flat", n_shards=1, **params):
+    """Grava índice (ou shards), chunks, ids e embeddings no layout do RetrievalEngine; retorna o tamanho do índice."""
+    chunks = [f"Chunk {i}" for i in range(len(embeddings))]
+    with open(os.path.join(data_dir, "chunks.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f)
+    np.save(os.path.join(data_dir, "embeddings.npy"), embeddings)
+    if n_shards <= 1:
+        index = create_index(embeddings.shape[1], index_type, n_vectors=len(embeddings), **params)
+        train_index(index, embeddings)
+        index.add(embeddings)
+        index_path = os.path.join(data_dir, "index.faiss")
+        faiss.write_index(index, index_path)
+        return os.path.getsize(index_path)
+    ids = chunk_ids(chunks)
+    np.save(os.path.join(data_dir, CHUNK_IDS_FILE), ids)
+    shards_dir = shards_dir_for(data_dir)
+    os.makedirs(shards_dir)
+    shards = []
+    for shard_no, rows in enumerate(shard_rows(ids, n_shards)):
+        shard = create_index(embeddings.shape[1], index_type, n_vectors=len(rows), **params)
+        train_index(shard, embeddings[rows])
+        shard = faiss.IndexIDMap2(shard)
+        shard.add_with_ids(embeddings[rows], ids[rows])
+        faiss.write_index(shard, shard_path(shards_dir, shard_no))
+        shards.append(shard)
+    write_manifest(shards_dir, shards, index_type)
+    return directory_size(shards_dir)
+
+def measure_latency(engine, queries, k):
+    """Uma consulta por chamada a engine.search; retorna (ids encontrados, latências em ms)."""
+    found = np.empty((len(queries), k), dtype='int64')
+    latencies = np.empty(len(queries))
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = engine.search(queries[i:i + 1], k)
+        latencies[i] = (time.perf_counter() - start) * 1000
+        found[i] = ids[0]
+    return found, latencies
+
+def measure_qps(engine, queries, k, n_threads):
+    """Consultas por segundo com n_threads threads disparando buscas individuais em paralelo."""
+    def run(i):
+        engine.search(queries[i:i + 1], k)
+    with ThreadPoolExecutor(max_workers=n_threads) as executor:
+        start = time.perf_counter()
+        list(executor.map(run, range(len(queries))))
+        elapsed = time.perf_counter() - start
+    return len(queries) / elapsed if elapsed > 0 else float("inf")
+
+def benchmark_config(embeddings, queries, ground_truth, config, k=10, threads=(1,)):
+    """Constrói uma configuração, carrega-a num RetrievalEngine e mede recall, latência, QPS e memória."""
+    build_params = dict(config)
+    engine_params = {name: build_params.pop(name) for name in ENGINE_PARAMS if name in build_params}
+    n_shards = build_params.pop("n_shards", 1)
+    data_dir = tempfile.mkdtemp(prefix="benchmark_")
+    try:
+        start_time = time.perf_counter()
+        index_bytes = write_benchmark_artifacts(data_dir, embeddings, n_shards=n_shards, **build_params)
+        build_seconds = time.perf_counter() - start_time
+        rss_before = current_rss()
+        engine = RetrievalEngine(data_dir, hybrid=False, rerank=False, **engine_params).load()
+        rss_after = current_rss()
+        try:
+            # Aquecimento: a primeira busca paga a criação de threads e a leitura inicial das páginas
+            engine.search(queries[:1], k)
+            found, latencies = measure_latency(engine, queries, k)
+            start_time = time.perf_counter()
+            engine.search_batch(queries, k)
+            batch_seconds = time.perf_counter() - start_time
+            result = {
+                "config": dict(config),
+                "build_seconds": build_seconds,
+                "index_bytes": index_bytes,
+                "rss_delta_bytes": rss_after - rss_before if rss_before is not None else None,
+                f"recall_at_{k}": recall_at_k(found, ground_truth),
+                "latency_ms_mean": float(latencies.mean()),
+                "latency_ms_p50": float(np.percentile(latencies, 50)),
+                "latency_ms_p95": float(np.percentile(latencies, 95)),
+                "latency_ms_p99": float(np.percentile(latencies, 99)),
+                "batch_qps": len(queries) / batch_seconds if batch_seconds > 0 else None,
+                "qps": {str(n): measure_qps(engine, queries, k, n) for n in threads},
+            }
+        finally:
+            close_artifacts(engine.artifacts())
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    logging.info(f"Benchmark de recuperação: {result}")
+    return result
+
+def run_benchmark(embeddings=None, configs=DEFAULT_CONFIGS, k=BENCHMARK_K, n_queries=BENCHMARK_QUERIES,
+                  threads=BENCHMARK_THREADS, source=None):
+    """Executa todas as configurações sobre o mesmo corpus e as mesmas consultas; retorna o relatório."""
+    if embeddings is None:
+        embeddings = synthetic_corpus(BENCHMARK_N, BENCHMARK_DIM)
+        source = source or f"synthetic:{BENCHMARK_N}x{BENCHMARK_DIM}"
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    queries = make_queries(embeddings, n_queries)
+    k = min(k, len(embeddings))
+    ground_truth = exact_neighbors(embeddings, queries, k)
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "source": source,
+            "n_vectors": int(len(embeddings)),
+            "dimension": int(embeddings.shape[1]),
+            "n_queries": int(len(queries)),
+            "k": k,
+            "threads": list(threads),
+            "faiss_version": getattr(faiss, "__version__", None),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": [benchmark_config(embeddings, queries, ground_truth, config, k, threads) for config in configs],
+    }
+
+def compare_reports(baseline, current, recall_tolerance=0.01, latency_tolerance=0.2):
+    """Lista as regressões de current em relação a baseline (configurações casadas pelos parâmetros).
+
+    Aponta quedas de recall acima de recall_tolerance e aumentos de p95 acima de latency_tolerance (fração).
+    """
+    recall_name = f"recall_at_{current['meta']['k']}"
+    previous = {json.dumps(result["config"], sort_keys=True): result for result in baseline["results"]}
+    regressions = []
+    for result in current["results"]:
+        old = previous.get(json.dumps(result["config"], sort_keys=True))
+        if old is None:
+            continue
+        if recall_name in old and old[recall_name] - result[recall_name] > recall_tolerance:
+            regressions.append({"config": result["config"], "metric": recall_name,
+                                "baseline": old[recall_name], "current": result[recall_name]})
+        if result["latency_ms_p95"] > old["latency_ms_p95"] * (1 + latency_tolerance):
+            regressions.append({"config": result["config"], "metric": "latency_ms_p95",
+                                "baseline": old["latency_ms_p95"], "current": result["latency_ms_p95"]})
+    return regressions
+
+if __name__ == "__main__":
+    embeddings, source = None, None
+    if BENCHMARK_EMBEDDINGS:
+        embeddings, source = np.load(BENCHMARK_EMBEDDINGS, mmap_mode='r'), BENCHMARK_EMBEDDINGS
+    configs = json.loads(BENCHMARK_CONFIGS) if BENCHMARK_CONFIGS else DEFAULT_CONFIGS
+    report = run_benchmark(embeddings, configs, source=source)
+    with open(BENCHMARK_OUTPUT, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    print(f"Benchmark salvo em {BENCHMARK_OUTPUT}.")
+    # Com um relatório anterior como argumento, termina com código 1 se houver regressão
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], "r", encoding="utf-8") as f:
+            regressions = compare_reports(json.load(f), report)
+        for regression in regressions:
+            print(f"Regressão: {regression}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,106 @@
+import re
+import logging
+import unicodedata
+from collections import Counter
+import numpy as np
+
+# Parâmetros clássicos do BM25
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+STOPWORDS = frozenset("""
+a ao aos as com como da das de do dos e em entre foi ha isso mais mas na nas nao no nos o os ou para
+pela pelas pelo pelos por que qual quais se sem ser seu sua so sao sobre tambem um uma umas uns
+""".split())
+
+def tokenize(text):
+    """Tokens em minúsculas e sem acentos; números com pontos (14.133, 8.666/93) são mantidos unidos."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    tokens = re.findall(r"\d+(?:[./]\d+)*|[a-z]+", text)
+    return [t.replace(".", "") for t in tokens if t not in STOPWORDS]
+
+class BM25Index:
+    """Índice invertido BM25 com postings pré-computados.
+
+    Para cada termo, guarda os ids dos chunks e o peso BM25 já calculado (idf * tf normalizado),
+    de modo que uma consulta apenas soma os postings dos seus termos, sem percorrer o corpus.
+    """
+
+    def __init__(self, terms, offsets, doc_ids, weights, n_docs):
+        self.terms = terms
+        self.offsets = offsets
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.n_docs = n_docs
+        self._vocab = {term: i for i, term in enumerate(terms)}
+
+    @classmethod
+    def build(cls, chunks, k1=BM25_K1, b=BM25_B):
+        term_docs = {}
+        doc_lengths = np.zeros(len(chunks), dtype='float32')
+        for doc_id, chunk in enumerate(chunks):
+            counts = Counter(tokenize(chunk))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                term_docs.setdefault(term, []).append((doc_id, tf))
+        avg_length = float(doc_lengths.mean()) if len(chunks) else 0.0
+        n_docs = len(chunks)
+
+        terms = sorted(term_docs)
+        offsets = np.zeros(len(terms) + 1, dtype='int64')
+        doc_ids, weights = [], []
+        for i, term in enumerate(terms):
+            postings = term_docs[term]
+            df = len(postings)
+            idf = np.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            ids = np.array([doc_id for doc_id, _ in postings], dtype='int32')
+            tf = np.array([tf for _, tf in postings], dtype='float32')
+            norm = k1 * (1 - b + b * doc_lengths[ids] / (avg_length or 1.0))
+            doc_ids.append(ids)
+            weights.append((idf * tf * (k1 + 1) / (tf + norm)).astype('float32'))
+            offsets[i + 1] = offsets[i] + df
+        doc_ids = np.concatenate(doc_ids) if doc_ids else np.zeros(0, dtype='int32')
+        weights = np.concatenate(weights) if weights else np.zeros(0, dtype='float32')
+        logging.info(f"Índice BM25 construído: {len(terms)} termos, {len(doc_ids)} postings, {n_docs} chunks.")
+        return cls(terms, offsets, doc_ids, weights, n_docs)
+
+    def save(self, path):
+        np.savez(path, terms=np.array(self.terms, dtype=str), offsets=self.offsets,
+                 doc_ids=self.doc_ids, weights=self.weights, n_docs=np.array(self.n_docs))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["terms"].tolist(), data["offsets"], data["doc_ids"], data["weights"], int(data["n_docs"]))
+
+    def search(self, query, top_k=10, allowed=None):
+        """Retorna (scores, ids) dos top_k chunks para a consulta, somando apenas os postings dos termos dela.
+
+        allowed (posições ordenadas) restringe os chunks antes da seleção do top_k.
+        """
+        slices = []
+        for term in set(tokenize(query)):
+            i = self._vocab.get(term)
+            if i is not None:
+                slices.append((self.offsets[i], self.offsets[i + 1]))
+        if not slices:
+            return np.zeros(0, dtype='float32'), np.zeros(0, dtype='int64')
+        ids = np.concatenate([self.doc_ids[start:end] for start, end in slices])
+        weights = np.concatenate([self.weights[start:end] for start, end in slices])
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        if allowed is not None:
+            keep = np.isin(unique_ids, allowed, assume_unique=True)
+            unique_ids, scores = unique_ids[keep], scores[keep]
+        top = np.argsort(-scores, kind="stable")[:top_k]
+        return scores[top].astype('float32'), unique_ids[top].astype('int64')
+
+def reciprocal_rank_fusion(rankings, top_k=10, k=RRF_K):
+    """Funde listas de ids ordenadas por relevância (Reciprocal Rank Fusion), retornando [(id, score)]."""
+    fused = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[int(doc_id)] = fused.get(int(doc_id), 0.0) + 1.0 / (k + rank + 1)
+    return sorted(fused.items(), key=lambda item: -item[1])[:top_k]
@@ -0,0 +1,198 @@
+import os
+import re
+import json
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict
+import numpy as np
+
+def normalize_query(text):
+    """Normaliza a consulta para a chave do cache: NFC, minúsculas e espaços colapsados."""
+    text = unicodedata.normalize("NFC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+def text_key(text):
+    return hashlib.md5(text.encode('utf-8')).hexdigest()
+
+class EmbeddingStore:
+    """Armazenamento em disco (SQLite) de vetores como BLOB, indexados por chave.
+
+    dtype (float32 ou float16) define a representação gravada num arquivo novo e fica registrado
+    nele; arquivos existentes mantêm o dtype com que foram criados. A leitura sempre devolve float32.
+
+    Também serve como cache de embeddings do corpus: aceita o protocolo de dicionário usado pelo
+    gerador (in, [], update), com busca pela chave primária e gravações incrementais, sem reescrever
+    o arquivo. compact() remove chaves obsoletas e devolve o espaço ao disco.
+    """
+
+    def __init__(self, path, dtype='float32'):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        # Páginas maiores acomodam vários vetores por página (só vale para arquivos novos)
+        self._conn.execute("PRAGMA page_size=16384")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        existing = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'embeddings'"
+        ).fetchone() is not None
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        row = self._conn.execute("SELECT value FROM settings WHERE name = 'dtype'").fetchone()
+        if row is None:
+            # Arquivos anteriores ao registro do dtype foram gravados em float32
+            row = ("float32" if existing else np.dtype(dtype).name,)
+            self._conn.execute("INSERT INTO settings (name, value) VALUES ('dtype', ?)", row)
+        self.dtype = np.dtype(row[0])
+        self._conn.commit()
+
+    def _encode(self, vector):
+        return np.ascontiguousarray(vector, dtype=self.dtype).tobytes()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=self.dtype).astype('float32')
+
+    def put(self, key, vector):
+        blob = self._encode(vector)
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", (key, blob))
+            self._conn.commit()
+
+    def update(self, items):
+        """Grava vários vetores numa única transação."""
+        rows = [(key, self._encode(vector)) for key, vector in dict(items).items()]
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM embeddings WHERE key = ?", (key,)).fetchone() is not None
+
+    def __getitem__(self, key):
+        vector = self.get(key)
+        if vector is None:
+            raise KeyError(key)
+        return vector
+
+    def __setitem__(self, key, vector):
+        self.put(key, vector)
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def import_json(self, json_path):
+        """Importa um cache no formato antigo (JSON {chave: lista de floats}); retorna quantos vetores entraram."""
+        with open(json_path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        self.update(entries)
+        return len(entries)
+
+    def compact(self, keep=None):
+        """Remove as chaves fora de keep (se informado) e reescreve o arquivo sem páginas livres.
+
+        Com keep, o arquivo só é reescrito se algo foi removido; retorna quantas chaves saíram.
+        """
+        with self._lock:
+            removed = None
+            if keep is not None:
+                self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS keep_keys (key TEXT PRIMARY KEY)")
+                self._conn.execute("DELETE FROM keep_keys")
+                self._conn.executemany("INSERT OR IGNORE INTO keep_keys (key) VALUES (?)", ((key,) for key in keep))
+                removed = self._conn.execute(
+                    "DELETE FROM embeddings WHERE key NOT IN (SELECT key FROM keep_keys)"
+                ).rowcount
+                self._conn.execute("DROP TABLE keep_keys")
+                self._conn.commit()
+            if removed != 0:
+                self._conn.execute("VACUUM")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed or 0
+
+    def checkpoint(self):
+        """Leva o WAL para o arquivo principal, que passa a ser uma cópia completa (ex.: para enviar ao GCS)."""
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class LRUEmbeddingCache:
+    """Cache LRU limitado de embeddings de consultas, opcionalmente persistido num EmbeddingStore.
+
+    namespace entra na chave, para que vetores de provedores de embeddings diferentes não se misturem.
+    """
+
+    def __init__(self, maxsize=1024, store=None, namespace=""):
+        self.maxsize = maxsize
+        self.store = store
+        self.namespace = namespace
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, query):
+        return text_key(self.namespace + normalize_query(query))
+
+    def get(self, query):
+        key = self._key(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return vector
+        vector = self.store.get(key) if self.store is not None else None
+        with self._lock:
+            if vector is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._insert(key, vector)
+        return vector
+
+    def put(self, query, vector):
+        key = self._key(query)
+        vector = np.ascontiguousarray(vector, dtype='float32').reshape(-1)
+        with self._lock:
+            self._insert(key, vector)
+        if self.store is not None:
+            try:
+                self.store.put(key, vector)
+            except sqlite3.Error as e:
+                logging.error(f"Erro ao persistir embedding de consulta: {e}")
+
+    def _insert(self, key, vector):
+        self._entries[key] = vector
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
@@ -0,0 +1,111 @@
+import time
+import logging
+import threading
+import numpy as np
+import faiss
+
+# Distância L2 ao quadrado entre embeddings normalizados: 2 - 2 * cos. 0.1 equivale a cos >= 0.95.
+SEMANTIC_CACHE_MAX_DISTANCE = 0.1
+SEMANTIC_CACHE_TTL = 24 * 60 * 60
+SEMANTIC_CACHE_MAXSIZE = 5000
+
+class SemanticCache:
+    """Cache de respostas indexado pelo embedding da pergunta.
+
+    Uma pergunta parafraseada cujo embedding fique a até max_distance de uma pergunta já
+    respondida reutiliza a resposta armazenada. Os embeddings ficam num índice FAISS próprio,
+    pequeno (IndexIDMap2 sobre IndexFlatL2), que permite remover entradas expiradas.
+    """
+
+    def __init__(self, max_distance=SEMANTIC_CACHE_MAX_DISTANCE, ttl=SEMANTIC_CACHE_TTL,
+                 maxsize=SEMANTIC_CACHE_MAXSIZE, name="semantico"):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._index = None
+        self._entries = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _prepare(query_embedding):
+        vector = np.asarray(query_embedding, dtype='float32').reshape(1, -1)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return np.ascontiguousarray(vector / norm)
+
+    def _remove(self, ids):
+        ids = [i for i in ids if i in self._entries]
+        if not ids:
+            return
+        self._index.remove_ids(np.array(ids, dtype='int64'))
+        for i in ids:
+            del self._entries[i]
+
+    def _purge_expired(self, now):
+        self._remove([i for i, (_, expires_at) in self._entries.items() if expires_at <= now])
+
+    def get(self, query_embedding):
+        """Retorna a resposta da pergunta mais próxima dentro de max_distance, ou None."""
+        vector = self._prepare(query_embedding)
+        with self._lock:
+            if vector is None or self._index is None or self._index.ntotal == 0 or vector.shape[1] != self._index.d:
+                self.misses += 1
+                return None
+            distances, ids = self._index.search(vector, 1)
+            entry_id, distance = int(ids[0][0]), float(distances[0][0])
+            entry = self._entries.get(entry_id)
+            if entry is None or distance > self.max_distance:
+                self.misses += 1
+                return None
+            answer, expires_at = entry
+            if expires_at <= time.time():
+                self._remove([entry_id])
+                self.misses += 1
+                return None
+            self.hits += 1
+            return answer
+
+    def put(self, query_embedding, answer):
+        vector = self._prepare(query_embedding)
+        if vector is None:
+            return
+        now = time.time()
+        with self._lock:
+            if self._index is None or self._index.d != vector.shape[1]:
+                self._index = faiss.IndexIDMap2(faiss.IndexFlatL2(vector.shape[1]))
+                self._entries = {}
+            self._purge_expired(now)
+            if len(self._entries) >= self.maxsize:
+                # Ids crescentes: os menores são as entradas mais antigas
+                self._remove(sorted(self._entries)[:len(self._entries) - self.maxsize + 1])
+            entry_id = self._next_id
+            self._next_id += 1
+            self._index.add_with_ids(vector, np.array([entry_id], dtype='int64'))
+            self._entries[entry_id] = (answer, now + self.ttl)
+
+    def flush(self):
+        """Esvazia o cache (por exemplo, após a reconstrução do corpus)."""
+        with self._lock:
+            if self._index is not None:
+                self._index.reset()
+            self._entries = {}
+        logging.info(f"Cache {self.name} esvaziado.")
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
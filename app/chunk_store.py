@@ -0,0 +1,196 @@
+import os
+import json
+import mmap
+import zlib
+import struct
+import logging
+import numpy as np
+
+# Formato binário dos chunks:
+#   <nome>.store          textos UTF-8 concatenados (cada registro opcionalmente comprimido com zlib)
+#   <nome>.store.offsets  cabeçalho (magic, flags, quantidade) + N+1 offsets uint64 little-endian
+# O registro i ocupa data[offsets[i]:offsets[i + 1]]; uma busca top-k lê apenas k registros.
+STORE_EXTENSION = ".store"
+OFFSETS_SUFFIX = ".offsets"
+# Arquivo de origem de cada chunk (mesma ordem do chunks.json), usado nas atualizações incrementais
+SOURCES_SUFFIX = ".sources.json"
+# Metadados compactos de cada chunk (página inicial e artigos citados), usados nos filtros de busca
+METADATA_SUFFIX = ".meta.json"
+MAGIC = b"UFCHUNK1"
+HEADER = struct.Struct("<8sIIQ")
+FLAG_ZLIB = 1
+
+def offsets_path_for(store_path):
+    return store_path + OFFSETS_SUFFIX
+
+def store_path_for(json_path):
+    """Caminho do chunk store correspondente a um chunks.json (chunks.json -> chunks.store)."""
+    return os.path.splitext(json_path)[0] + STORE_EXTENSION
+
+def sources_path_for(json_path):
+    """Caminho da lista de arquivos de origem dos chunks (chunks.json -> chunks.sources.json)."""
+    return os.path.splitext(json_path)[0] + SOURCES_SUFFIX
+
+def read_chunk_sources(json_path, count=None):
+    """Lê a origem de cada chunk; retorna None se o arquivo não existir ou não corresponder aos count chunks."""
+    path = sources_path_for(json_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        sources = json.load(f)
+    if count is not None and len(sources) != count:
+        logging.warning(f"{path} tem {len(sources)} origens para {count} chunks; origens ignoradas.")
+        return None
+    return sources
+
+def write_chunk_sources(sources, json_path):
+    path = sources_path_for(json_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(list(sources), f, ensure_ascii=False)
+    _replace_atomically(tmp_path, path)
+    return path
+
+def metadata_path_for(json_path):
+    """Caminho dos metadados dos chunks (chunks.json -> chunks.meta.json)."""
+    return os.path.splitext(json_path)[0] + METADATA_SUFFIX
+
+def read_chunk_metadata(json_path, count=None):
+    """Lê os metadados de cada chunk; retorna None se o arquivo não existir ou não corresponder aos count chunks."""
+    path = metadata_path_for(json_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        metadata = json.load(f)
+    if count is not None and len(metadata) != count:
+        logging.warning(f"{path} tem {len(metadata)} registros para {count} chunks; metadados ignorados.")
+        return None
+    return metadata
+
+def write_chunk_metadata(metadata, json_path):
+    path = metadata_path_for(json_path)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(list(metadata), f, ensure_ascii=False, separators=(",", ":"))
+    _replace_atomically(tmp_path, path)
+    return path
+
+def write_chunk_files(chunks, sources, metadata, json_path):
+    """Grava chunks.json, as origens e os metadados juntos, inclusive quando não há chunks.
+
+    Os três arquivos são escritos em temporários e só então substituem os anteriores, para que
+    um chunks.json antigo nunca fique ao lado de origens e metadados de outra extração.
+    """
+    if not len(chunks) == len(sources) == len(metadata):
+        raise ValueError(f"{len(chunks)} chunks, {len(sources)} origens e {len(metadata)} metadados.")
+    files = [
+        (json_path, {"indent": 4}, chunks),
+        (sources_path_for(json_path), {}, sources),
+        (metadata_path_for(json_path), {"separators": (",", ":")}, metadata),
+    ]
+    for path, options, values in files:
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(list(values), f, ensure_ascii=False, **options)
+    for path, _, _ in files:
+        _replace_atomically(path + ".tmp", path)
+    return json_path
+
+def _replace_atomically(tmp_path, final_path):
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, final_path)
+
+def write_chunk_store(chunks, store_path, compress=False):
+    """Grava os chunks no formato binário; os arquivos finais só são substituídos após a escrita completa."""
+    directory = os.path.dirname(store_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    offsets = np.zeros(len(chunks) + 1, dtype='<u8')
+    data_tmp = store_path + ".tmp"
+    with open(data_tmp, "wb") as f:
+        position = 0
+        for i, chunk in enumerate(chunks):
+            record = chunk.encode('utf-8')
+            if compress:
+                record = zlib.compress(record)
+            f.write(record)
+            position += len(record)
+            offsets[i + 1] = position
+    offsets_tmp = offsets_path_for(store_path) + ".tmp"
+    with open(offsets_tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FLAG_ZLIB if compress else 0, 0, len(chunks)))
+        f.write(offsets.tobytes())
+    # Cada arquivo só substitui o anterior (os.replace) depois de gravado por completo
+    _replace_atomically(data_tmp, store_path)
+    _replace_atomically(offsets_tmp, offsets_path_for(store_path))
+    logging.info(f"Salvos {len(chunks)} chunks em {store_path} ({int(offsets[-1])} bytes, zlib: {compress}).")
+    return store_path
+
+class ChunkStore:
+    """Leitura de chunks via mmap: abrir não carrega os textos, e cada acesso decodifica só o registro pedido."""
+
+    def __init__(self, store_path):
+        self.path = store_path
+        with open(offsets_path_for(store_path), "rb") as f:
+            magic, flags, _, count = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"Arquivo {offsets_path_for(store_path)} não é um índice de chunks válido.")
+        self.compressed = bool(flags & FLAG_ZLIB)
+        self._count = count
+        self._offsets = np.memmap(offsets_path_for(store_path), dtype='<u8', mode='r',
+                                  offset=HEADER.size, shape=(count + 1,))
+        self._file = open(store_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return self._count
+
+    def _record(self, i):
+        raw = self._data[int(self._offsets[i]):int(self._offsets[i + 1])]
+        if self.compressed:
+            raw = zlib.decompress(raw)
+        return raw.decode('utf-8')
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self._record(j) for j in range(*i.indices(self._count))]
+        i = int(i)
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(f"Chunk {i} fora do intervalo (0..{self._count - 1}).")
+        return self._record(i)
+
+    def get_many(self, ids):
+        return [self[i] for i in ids]
+
+    def __iter__(self):
+        for i in range(self._count):
+            yield self._record(i)
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_chunks(path):
+    """Lê chunks de um chunk store (.store) ou de um JSON, retornando uma sequência indexável."""
+    if path.endswith(STORE_EXTENSION):
+        return ChunkStore(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_chunks(chunks, path, compress=False):
+    """Grava chunks como chunk store (.store) ou JSON, conforme a extensão do caminho."""
+    if path.endswith(STORE_EXTENSION):
+        return write_chunk_store(chunks, path, compress)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(list(chunks), f, ensure_ascii=False, indent=4)
+    return path
@@ -0,0 +1,189 @@
+import os
+import time
+import random
+import logging
+import threading
+
+# Controle adaptativo de taxa das chamadas a provedores externos (Gemini, OpenRouter): token bucket
+# cuja taxa sobe aditivamente a cada sucesso e cai pela metade a cada limite atingido (AIMD), com
+# novas tentativas espaçadas por backoff exponencial com jitter em respostas 429 e 5xx.
+# Por provedor: <NOME>_RATE_LIMIT (requisições/s iniciais) e <NOME>_MAX_RATE (teto).
+RATE_DEFAULTS = {"gemini": (5.0, 50.0), "openrouter": (2.0, 20.0)}
+RATE_MAX_RETRIES = int(os.getenv("RATE_MAX_RETRIES", "5"))
+BACKOFF_BASE = 1.0
+BACKOFF_CAP = 60.0
+
+def status_code(exc):
+    """Status HTTP de uma exceção (google.api_core usa .code; requests, .response.status_code)."""
+    code = getattr(exc, "code", None)
+    if code is None:
+        code = getattr(getattr(exc, "response", None), "status_code", None)
+    try:
+        return int(code)
+    except (TypeError, ValueError):
+        return None
+
+def is_retryable(exc):
+    code = status_code(exc)
+    return code is not None and (code == 429 or 500 <= code < 600)
+
+def retry_after(exc):
+    """Segundos pedidos pelo provedor no cabeçalho Retry-After, se houver."""
+    headers = getattr(getattr(exc, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+class RateController:
+    """Token bucket com taxa aprendida por AIMD, compartilhado pelas threads que chamam um provedor.
+
+    Cada sucesso soma increase / taxa (cerca de +increase req/s a cada segundo a plena carga); cada
+    limite atingido multiplica a taxa por decrease, no máximo uma vez por janela de cooldown, para
+    que uma rajada de 429 simultâneos não derrube a taxa a zero.
+    """
+
+    def __init__(self, name, rate, max_rate=None, min_rate=0.1, burst=None, increase=1.0, decrease=0.5,
+                 cooldown=1.0, max_retries=RATE_MAX_RETRIES, backoff_base=BACKOFF_BASE, backoff_cap=BACKOFF_CAP):
+        self.name = name
+        self.rate = float(rate)
+        self.max_rate = float(max_rate or rate)
+        self.min_rate = min_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._waiting = 0
+        self._in_flight = 0
+        self._successes = 0
+        self._throttles = 0
+        self._retries = 0
+        self._condition = threading.Condition()
+
+    def _capacity(self):
+        return self.burst or max(1.0, self.rate)
+
+    def _refill(self, now):
+        self._tokens = min(self._capacity(), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, timeout=None):
+        """Espera um token; retorna False se timeout (segundos) acabar antes."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if now >= self._blocked_until and self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        self._in_flight += 1
+                        return True
+                    wait = max(self._blocked_until - now, (1.0 - self._tokens) / self.rate, 0.001)
+                    if deadline is not None:
+                        if now + wait > deadline:
+                            return False
+                    self._condition.wait(wait)
+            finally:
+                self._waiting -= 1
+
+    def release(self):
+        with self._condition:
+            self._in_flight = max(self._in_flight - 1, 0)
+
+    def success(self):
+        with self._condition:
+            self._successes += 1
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def throttled(self, delay=None):
+        """Registra um limite atingido: reduz a taxa e, com Retry-After, pausa o bucket."""
+        with self._condition:
+            self._throttles += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= self.cooldown:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+                self._tokens = min(self._tokens, 0.0)
+                self._last_decrease = now
+                logging.warning(f"Limite de taxa em {self.name}: taxa reduzida para {self.rate:.2f} req/s.")
+            if delay:
+                self._blocked_until = max(self._blocked_until, now + delay)
+
+    def backoff(self, attempt):
+        """Atraso da tentativa attempt (0, 1, ...): jitter completo sobre base * 2^attempt, até o teto."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+
+    def call(self, fn, *args, max_retries=None, deadline=None, **kwargs):
+        """Executa fn respeitando a taxa; repete com backoff em 429/5xx.
+
+        deadline (segundos) limita a espera total, para chamadas feitas durante uma requisição web.
+        Outros erros, ou o fim das tentativas/prazo, propagam a última exceção.
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        end = None if deadline is None else time.monotonic() + deadline
+        attempt = 0
+        while True:
+            remaining = None if end is None else max(end - time.monotonic(), 0.0)
+            if not self.acquire(remaining):
+                raise TimeoutError(f"Prazo esgotado aguardando a taxa de {self.name}.")
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                self.release()
+                if not is_retryable(e):
+                    raise
+                requested = retry_after(e)
+                self.throttled(requested)
+                delay = max(self.backoff(attempt), requested or 0.0)
+                if attempt >= max_retries or (end is not None and time.monotonic() + delay > end):
+                    raise
+                attempt += 1
+                with self._condition:
+                    self._retries += 1
+                logging.info(f"{self.name}: erro {status_code(e)}, nova tentativa {attempt} em {delay:.2f}s.")
+                time.sleep(delay)
+                continue
+            self.release()
+            self.success()
+            return result
+
+    def stats(self):
+        with self._condition:
+            return {
+                "name": self.name,
+                "rate": self.rate,
+                "queue_depth": self._waiting,
+                "in_flight": self._in_flight,
+                "successes": self._successes,
+                "throttles": self._throttles,
+                "retries": self._retries,
+            }
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+def get_rate_controller(name):
+    """Controlador compartilhado pelo processo para o provedor name (criado na primeira chamada)."""
+    with _controllers_lock:
+        if name not in _controllers:
+            rate, max_rate = RATE_DEFAULTS.get(name, (1.0, 10.0))
+            prefix = name.upper()
+            _controllers[name] = RateController(
+                name,
+                float(os.getenv(f"{prefix}_RATE_LIMIT", rate)),
+                float(os.getenv(f"{prefix}_MAX_RATE", max_rate)),
+            )
+        return _controllers[name]
+
+def rate_stats():
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return [controller.stats() for controller in controllers]
@@ -4,14 +4,19 @@ import json
 import PyPDF2
 import spacy
 import logging
-from pdf2image import convert_from_path
-import pytesseract
 from PyPDF2.errors import PdfReadError
 from multiprocessing import Pool, cpu_count
 from docx import Document
 import pandas as pd
 import docx2txt
 import hashlib
+from bisect import bisect_right
+from itertools import accumulate
+from app.chunk_store import (
+    write_chunk_store, store_path_for, read_chunk_sources, read_chunk_metadata, write_chunk_files
+)
+from app.filtros_metadados import article_numbers
+from app.ocr_paginas import ocr_pdf_pages
 
 # Configurações
 MAX_CHUNK_TOKENS = 800
@@ -19,8 +24,15 @@ MIN_CHUNK_TOKENS = 100
 OVERLAP_TOKENS = 150
 MAX_CHUNK_BYTES = 9000
 LOG_FILE = 'chunking_debug.log'
-TESSERACT_LANG = 'por'
 CACHE_FILE = "app/rag_data/chunk_cache.json"  # Novo: cache de arquivos processados
+CHUNK_STORE_COMPRESS = os.getenv("CHUNK_STORE_COMPRESS", "").lower() == "true"
+# Textos de vários arquivos passam juntos pelo SpaCy (NLP.pipe) em lotes de SPACY_BATCH_SIZE trechos;
+# textos maiores que SPACY_MAX_SEGMENT_CHARS são divididos antes, o que mantém a memória de cada
+# worker estável e evita o limite max_length do SpaCy
+SPACY_BATCH_SIZE = int(os.getenv("SPACY_BATCH_SIZE", "16"))
+SPACY_MAX_SEGMENT_CHARS = int(os.getenv("SPACY_MAX_SEGMENT_CHARS", "100000"))
+# Arquivos entregues de uma vez a cada worker da extração
+EXTRACTION_FILES_PER_TASK = int(os.getenv("EXTRACTION_FILES_PER_TASK", "4"))
 
 # Carregar SpaCy com sentencizer
 NLP = spacy.load("pt_core_news_sm", disable=["ner", "parser"])
@@ -48,8 +60,12 @@ def get_file_hash(file_path):
         hasher.update(f.read())
     return hasher.hexdigest()
 
-def extract_text_from_pdf(file_path):
-    text = ""
+def extract_pages_from_pdf(file_path):
+    """Texto de cada página do PDF (OCR nas páginas sem texto extraível), na ordem do arquivo.
+
+    As páginas escaneadas são reunidas e passam juntas pelo OCR (app.ocr_paginas), em paralelo.
+    """
+    pages, scanned = [], []
     try:
         with open(file_path, "rb") as f:
             reader = PyPDF2.PdfReader(f)
@@ -58,22 +74,25 @@ def extract_text_from_pdf(file_path):
                     page = reader.pages[page_num]
                     page_text = page.extract_text()
                     if page_text and page_text.strip():
-                        text += page_text + "\n"
-                    else:
-                        text += extract_text_from_image(file_path, page_num)
+                        pages.append(page_text + "\n")
+                        continue
                 except PdfReadError:
-                    text += extract_text_from_image(file_path, page_num)
+                    pass
+                pages.append("")
+                scanned.append(page_num)
     except Exception as e:
         logging.error(f"Erro ao processar PDF {file_path}: {e}")
-    return text
+    if scanned:
+        texts, _ = ocr_pdf_pages(file_path, scanned)
+        for page_num in scanned:
+            pages[page_num] = texts[page_num]
+    return pages
+
+def extract_text_from_pdf(file_path):
+    return "".join(extract_pages_from_pdf(file_path))
 
 def extract_text_from_image(file_path, page_num):
-    try:
-        images = convert_from_path(file_path, first_page=page_num + 1, last_page=page_num + 1)
-        return "".join(pytesseract.image_to_string(image, lang=TESSERACT_LANG) + "\n" for image in images)
-    except Exception as e:
-        logging.error(f"Erro ao aplicar OCR na página {page_num + 1} de {file_path}: {e}")
-        return ""
+    return ocr_pdf_pages(file_path, [page_num])[0][page_num]
 
 def extract_text_from_docx(file_path):
     try:
@@ -144,79 +163,258 @@ def preprocess_text(text):
     text = re.sub(r'\s+', ' ', text)
     return text.strip()
 
+def split_long_text(text, max_chars=SPACY_MAX_SEGMENT_CHARS):
+    """Divide text em trechos de até max_chars para o SpaCy.
+
+    Cada corte cai na última quebra de parágrafo antes do limite ou, no texto já pré-processado (sem
+    quebras de linha), no último fim de sentença; só sem nenhum dos dois corta num espaço.
+    """
+    segments = []
+    while len(text) > max_chars:
+        window = text[:max_chars]
+        cut = window.rfind("\n")
+        if cut <= 0:
+            cut = max(window.rfind(". "), window.rfind("? "), window.rfind("! ")) + 1
+        if cut <= 0:
+            cut = window.rfind(" ")
+        if cut <= 0:
+            cut = max_chars
+        segments.append(text[:cut])
+        text = text[cut:]
+    segments.append(text)
+    return segments
+
+def doc_sentences(doc):
+    """(sentença sem espaços nas pontas, número de tokens, posição no texto do Doc) de cada sentença.
+
+    Tokens de espaço nas pontas não contam, então o número é o mesmo de tokenizar a sentença sozinha.
+    """
+    for sent in doc.sents:
+        sentence = sent.text.strip()
+        if not sentence:
+            continue
+        start, end = sent.start, sent.end
+        while start < end and doc[start].is_space:
+            start += 1
+        while end > start and doc[end - 1].is_space:
+            end -= 1
+        yield sentence, end - start, doc[start].idx
+
+def split_sentences_batch(texts, batch_size=SPACY_BATCH_SIZE, max_chars=SPACY_MAX_SEGMENT_CHARS, with_offsets=False):
+    """(sentenças, tokens de cada sentença) de cada texto, numa única passada do SpaCy.
+
+    Os trechos de todos os textos passam juntos por NLP.pipe em lotes de batch_size, e cada Doc é
+    descartado assim que suas sentenças são lidas: a memória do SpaCy não cresce com os documentos.
+    Com with_offsets, cada resultado traz também a posição inicial de cada sentença no texto.
+    """
+    results = [([], [], []) for _ in texts]
+
+    def segments():
+        for i, text in enumerate(texts):
+            base = 0
+            for segment in split_long_text(text, max_chars):
+                yield segment, (i, base)
+                base += len(segment)
+
+    for doc, (i, base) in NLP.pipe(segments(), as_tuples=True, batch_size=batch_size):
+        sentences, token_counts, offsets = results[i]
+        for sentence, tokens, offset in doc_sentences(doc):
+            sentences.append(sentence)
+            token_counts.append(tokens)
+            offsets.append(base + offset)
+    if with_offsets:
+        return results
+    return [(sentences, token_counts) for sentences, token_counts, _ in results]
+
+def split_sentences(text):
+    """Sentenças do texto (sem espaços nas pontas) e o número de tokens de cada uma, numa única passada do SpaCy."""
+    return split_sentences_batch([text])[0]
+
 def semantic_segmentation_with_overlap(text):
     try:
-        doc = NLP(text)
-        sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+        sentences, token_counts = split_sentences(text)
     except Exception as e:
         logging.error(f"Erro ao processar texto com SpaCy: {e}")
         return []
+    return overlapping_chunks(sentences, token_counts)
+
+def segment_documents(texts, with_offsets=False):
+    """Chunks de cada texto, com os textos processados juntos pelo SpaCy (NLP.pipe).
+
+    Com with_offsets, retorna (chunks, posição no texto da primeira sentença de cada chunk) por texto.
+    """
+    try:
+        parsed = split_sentences_batch(texts, with_offsets=True)
+    except Exception as e:
+        logging.error(f"Erro ao processar textos com SpaCy: {e}")
+        return [([], []) if with_offsets else [] for _ in texts]
+    results = []
+    for sentences, token_counts, offsets in parsed:
+        chunks, first_sentences = overlapping_chunks(sentences, token_counts, with_starts=True)
+        results.append((chunks, [offsets[i] for i in first_sentences]) if with_offsets else chunks)
+    return results
+
+def overlapping_chunks(sentences, token_counts, with_starts=False):
+    """Agrupa as sentenças em chunks de até MAX_CHUNK_TOKENS tokens, com sobreposição de ~OVERLAP_TOKENS.
 
-    chunks = []
-    current_chunk = []
+    Com with_starts, retorna (chunks, índice da primeira sentença de cada chunk). Como a sentença que
+    estourou o limite sai do chunk seguinte, os chunks nem sempre são trechos contíguos do texto.
+    """
+    # prefix[i] = tokens das sentenças antes de i, para somar a janela de sobreposição em O(1).
+    # O chunk atual é sentences[chunk_start:idx] sem a sentença skipped: a que estourou o limite
+    # não entra no chunk seguinte (só volta se cair numa janela de sobreposição posterior).
+    prefix = list(accumulate(token_counts, initial=0))
+    chunks, starts = [], []
+    chunk_start, skipped = 0, None
     current_token_count = 0
 
-    for idx, sentence in enumerate(sentences):
-        sentence_tokens = len(list(NLP(sentence)))
+    def chunk_sentences(end):
+        if skipped is None:
+            return sentences[chunk_start:end]
+        return sentences[chunk_start:skipped] + sentences[skipped + 1:end]
+
+    def first_sentence():
+        return skipped + 1 if skipped == chunk_start else chunk_start
+
+    for idx, sentence_tokens in enumerate(token_counts):
         if current_token_count + sentence_tokens > MAX_CHUNK_TOKENS:
-            chunk_text = " ".join(current_chunk)
+            chunk_text = " ".join(chunk_sentences(idx))
             chunk_bytes = len(chunk_text.encode('utf-8'))
             if chunk_bytes <= MAX_CHUNK_BYTES and current_token_count >= MIN_CHUNK_TOKENS:
                 chunks.append(chunk_text)
-            overlap_start = max(0, idx - int(OVERLAP_TOKENS / (sentence_tokens or 1)))
-            current_chunk = sentences[overlap_start:idx]
-            current_token_count = sum(len(list(NLP(sent))) for sent in current_chunk)
+                starts.append(first_sentence())
+            chunk_start = max(0, idx - int(OVERLAP_TOKENS / (sentence_tokens or 1)))
+            skipped = idx
+            current_token_count = prefix[idx] - prefix[chunk_start]
         else:
-            current_chunk.append(sentence)
             current_token_count += sentence_tokens
 
+    current_chunk = chunk_sentences(len(sentences))
     if current_chunk:
         chunk_text = " ".join(current_chunk)
         chunk_bytes = len(chunk_text.encode('utf-8'))
         if chunk_bytes <= MAX_CHUNK_BYTES and current_token_count >= MIN_CHUNK_TOKENS:
             chunks.append(chunk_text)
+            starts.append(first_sentence())
 
-    return chunks
+    return (chunks, starts) if with_starts else chunks
 
-def process_file(file_path, cache):
-    file_hash = get_file_hash(file_path)
-    if file_path in cache and cache[file_path] == file_hash:
-        logging.info(f"Pulando {file_path} (já processado e inalterado).")
-        return []
-    logging.info(f"Iniciando processamento de {file_path}.")
-    text = extract_text_from_file(file_path)
-    if not text:
-        logging.warning(f"Nenhum texto extraído de {file_path}.")
-        return []
-    cleaned_text = preprocess_text(text)
-    chunks = semantic_segmentation_with_overlap(cleaned_text)
+def preprocess_pages(pages):
+    """Pré-processa cada página e as une; retorna (texto, posição inicial de cada página no texto)."""
+    text, page_starts = "", []
+    for page in pages:
+        page_starts.append(len(text) + (1 if text else 0))
+        cleaned = preprocess_text(page)
+        if cleaned:
+            text = f"{text} {cleaned}" if text else cleaned
+    return text, page_starts
+
+def chunk_metadata(chunks, chunk_offsets=None, page_starts=None):
+    """Metadados compactos de cada chunk: página inicial (quando conhecida) e artigos citados.
+
+    chunk_offsets é a posição no texto da primeira sentença de cada chunk (segment_documents com
+    with_offsets), comparada às posições iniciais das páginas. Chaves vazias são omitidas.
+    """
+    records = []
+    for position, chunk in enumerate(chunks):
+        record = {}
+        if page_starts and chunk_offsets is not None:
+            record["page"] = bisect_right(page_starts, chunk_offsets[position])
+        articles = article_numbers(chunk)
+        if articles:
+            record["articles"] = articles
+        records.append(record)
+    return records
+
+def extract_cleaned_text(file_path):
+    """Texto pré-processado do arquivo e, para PDFs, a posição inicial de cada página (None nos demais)."""
+    if get_file_type(file_path) == "pdf":
+        return preprocess_pages(extract_pages_from_pdf(file_path))
+    return preprocess_text(extract_text_from_file(file_path)), None
+
+def log_chunks(file_path, chunks):
     if chunks:
         logging.info(f"Processado: {file_path}. Gerados {len(chunks)} chunks.")
         print(f"Processado: {file_path}. Gerados {len(chunks)} chunks.")
     else:
         logging.warning(f"Nenhum chunk válido gerado para {file_path}.")
+
+def process_file(file_path, cache, with_metadata=False):
+    """Chunks do arquivo; com with_metadata, retorna (chunks, metadados de cada chunk)."""
+    empty = ([], []) if with_metadata else []
+    file_hash = get_file_hash(file_path)
+    if file_path in cache and cache[file_path] == file_hash:
+        logging.info(f"Pulando {file_path} (já processado e inalterado).")
+        return empty
+    logging.info(f"Iniciando processamento de {file_path}.")
+    cleaned_text, page_starts = extract_cleaned_text(file_path)
+    if not cleaned_text:
+        logging.warning(f"Nenhum texto extraído de {file_path}.")
+        return empty
+    chunks, chunk_offsets = segment_documents([cleaned_text], with_offsets=True)[0]
+    log_chunks(file_path, chunks)
     cache[file_path] = file_hash
+    if with_metadata:
+        return chunks, chunk_metadata(chunks, chunk_offsets, page_starts)
     return chunks
 
-def save_chunks_to_json(chunks, output_json):
+def process_files(file_paths):
+    """(chunks, metadados) de cada arquivo, com o texto de todos segmentado numa só passada do SpaCy."""
+    extracted = []
+    for file_path in file_paths:
+        logging.info(f"Iniciando processamento de {file_path}.")
+        cleaned_text, page_starts = extract_cleaned_text(file_path)
+        if not cleaned_text:
+            logging.warning(f"Nenhum texto extraído de {file_path}.")
+        extracted.append((cleaned_text, page_starts))
+    results = []
+    for file_path, (cleaned_text, page_starts), (chunks, chunk_offsets) in zip(
+            file_paths, extracted, segment_documents([text for text, _ in extracted], with_offsets=True)):
+        if cleaned_text:
+            log_chunks(file_path, chunks)
+        results.append((chunks, chunk_metadata(chunks, chunk_offsets, page_starts)))
+    return results
+
+def save_chunks_to_json(chunks, sources, metadata, output_json):
+    """Salva os chunks com suas origens e metadados (os três arquivos, mesmo sem nenhum chunk)."""
+    write_chunk_files(chunks, sources, metadata, output_json)
     if not chunks:
         print("Nenhum chunk para salvar.")
-        with open(output_json, "w", encoding="utf-8") as f:
-            json.dump([], f, ensure_ascii=False, indent=4)
         return
-    with open(output_json, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=4)
     print(f"Salvos {len(chunks)} novos chunks em {output_json}.")
 
+def files_to_process(file_hashes, cache, sources):
+    """Arquivos novos ou alterados e arquivos removidos desde a última extração.
+
+    O cache guarda o hash de todo arquivo já processado, inclusive dos que não geraram chunks,
+    que assim não voltam a ser extraídos (nem a passar pelo OCR) a cada execução.
+    """
+    changed = [f for f, file_hash in file_hashes.items() if cache.get(f) != file_hash]
+    removed = (set(cache) | set(sources)) - set(file_hashes)
+    return changed, removed
+
+def merge_file_chunks(chunks, sources, updated, removed_sources=()):
+    """Substitui os chunks dos arquivos alterados e descarta os de arquivos removidos.
+
+    updated mapeia arquivo -> novos chunks. Chunks de arquivos inalterados mantêm sua ordem;
+    os novos são acrescentados ao final. Retorna (chunks, origens).
+    """
+    dropped = set(updated) | set(removed_sources)
+    merged = [(chunk, source) for chunk, source in zip(chunks, sources) if source not in dropped]
+    for source, file_chunks in updated.items():
+        merged.extend((chunk, source) for chunk in file_chunks if chunk)
+    return [chunk for chunk, _ in merged], [source for _, source in merged]
+
+def save_chunks_to_store(chunks, output_store, compress=CHUNK_STORE_COMPRESS):
+    """Salva os chunks no chunk store binário (lido via mmap pelo motor de recuperação)."""
+    write_chunk_store(chunks, output_store, compress)
+    print(f"Salvos {len(chunks)} chunks em {output_store}.")
+
 if __name__ == "__main__":
     dir_path = "app/rag_data/arquivos"
     output_json = "app/rag_data/chunks.json"
     os.makedirs(os.path.dirname(output_json), exist_ok=True)
 
-    if os.path.exists(output_json):
-        os.remove(output_json)
-        print(f"Arquivo {output_json} removido para nova execução.")
-
     # Carregar cache
     cache = load_cache()
 
@@ -229,13 +427,44 @@ if __name__ == "__main__":
                 files.append(os.path.join(root, filename))
     print(f"Encontrados {len(files)} arquivos em pastas aninhadas para processar.")
 
-    # Processamento paralelo com limite de processos
+    # Chunks existentes são mantidos; só os arquivos novos ou alterados são reprocessados.
+    # Sem chunks.json, a lista de origens (chunks.sources.json) ou os metadados (chunks.meta.json),
+    # não há como atribuir os chunks: reprocessa tudo.
+    chunks, sources = [], []
+    if os.path.exists(output_json):
+        with open(output_json, "r", encoding="utf-8") as f:
+            existing = json.load(f)
+        existing_sources = read_chunk_sources(output_json, len(existing))
+        existing_metadata = read_chunk_metadata(output_json, len(existing))
+        if existing_sources is not None and existing_metadata is not None:
+            # Cada chunk segue junto com seus metadados na combinação abaixo
+            chunks, sources = list(zip(existing, existing_metadata)), existing_sources
+        else:
+            print(f"Origens ou metadados de {output_json} ausentes: todos os arquivos serão reprocessados.")
+            cache = {}
+    else:
+        cache = {}
+    file_hashes = {f: get_file_hash(f) for f in files}
+    changed, removed = files_to_process(file_hashes, cache, sources)
+    print(f"{len(changed)} arquivos novos ou alterados, {len(removed)} removidos.")
+
+    # Processamento paralelo com limite de processos. O cache é atualizado aqui, no processo
+    # principal: alterações feitas pelos processos filhos não retornam ao pai.
+    # Cada tarefa leva alguns arquivos, segmentados juntos pelo SpaCy (NLP.pipe)
+    groups = [changed[i:i + EXTRACTION_FILES_PER_TASK] for i in range(0, len(changed), EXTRACTION_FILES_PER_TASK)]
     with Pool(min(cpu_count(), 8)) as pool:  # Limita a 8 processos para evitar sobrecarga
-        all_chunks = pool.starmap(process_file, [(f, cache) for f in files])
+        all_chunks = [result for group in pool.map(process_files, groups) for result in group]
+    for f in changed:
+        cache[f] = file_hashes[f]
+    for f in removed:
+        cache.pop(f, None)
 
-    # Combinar todos os chunks
-    combined_chunks = [chunk for file_chunks in all_chunks for chunk in file_chunks if chunk]
+    # Combinar com os chunks dos arquivos inalterados
+    updated = {f: list(zip(*file_result)) for f, file_result in zip(changed, all_chunks)}
+    combined, combined_sources = merge_file_chunks(chunks, sources, updated, removed)
+    combined_chunks = [chunk for chunk, _ in combined]
 
     # Salvar chunks e atualizar cache
-    save_chunks_to_json(combined_chunks, output_json)
+    save_chunks_to_json(combined_chunks, combined_sources, [metadata for _, metadata in combined], output_json)
+    save_chunks_to_store(combined_chunks, store_path_for(output_json))
     save_cache(cache)
\ No newline at end of file
@@ -0,0 +1,110 @@
+import re
+import fnmatch
+import logging
+from functools import lru_cache
+import numpy as np
+
+# Chaves aceitas nos filtros de busca:
+#   source   padrão fnmatch (ou lista) comparado ao caminho e ao nome do arquivo de origem, ex.: "*14133*"
+#   pages    (primeira, última) página inicial do chunk, inclusive
+#   article  número do artigo citado no chunk (ou lista), ex.: "75"
+# Um chunk que representa cópias descartadas de outros arquivos (remove_duplicates.merge_duplicates)
+# traz em "copies" a origem e a página de cada uma, e atende aos filtros por qualquer delas.
+FILTER_KEYS = ("source", "pages", "article")
+ARTICLE_PATTERN = re.compile(r"\bart(?:igo)?s?\.?\s*(\d+(?:\.\d{3})*)", re.IGNORECASE)
+
+def article_numbers(text):
+    """Números dos artigos citados no texto, sem repetição e na ordem em que aparecem ("Art. 1.048" -> "1048")."""
+    return list(dict.fromkeys(match.replace(".", "") for match in ARTICLE_PATTERN.findall(text)))
+
+def _as_tuple(value):
+    if isinstance(value, (list, tuple, set)):
+        return tuple(str(v) for v in value)
+    return (str(value),)
+
+def filter_key(filters):
+    """Forma canônica e hashable de um dicionário de filtros (None quando não há filtro)."""
+    if not filters:
+        return None
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Filtro desconhecido: {', '.join(sorted(unknown))}. Opções: {', '.join(FILTER_KEYS)}.")
+    key = []
+    if filters.get("source") is not None:
+        key.append(("source", _as_tuple(filters["source"])))
+    if filters.get("pages") is not None:
+        first, last = filters["pages"]
+        key.append(("pages", (int(first), int(last))))
+    if filters.get("article") is not None:
+        key.append(("article", tuple(a.replace(".", "") for a in _as_tuple(filters["article"]))))
+    return tuple(key) or None
+
+class ChunkMetadata:
+    """Metadados dos chunks organizados para resolver filtros em posições sem percorrer os textos.
+
+    Guarda, por arquivo de origem e por artigo, as posições dos chunks (listas invertidas) e um
+    vetor com a página inicial de cada chunk. Filtros repetidos são resolvidos a partir de cache.
+    """
+
+    def __init__(self, sources=None, records=None, count=None):
+        count = count if count is not None else len(sources if sources is not None else records)
+        self.count = count
+        by_source = {}
+        if sources is not None:
+            for position, source in enumerate(sources):
+                by_source.setdefault(source, []).append(position)
+        self._pages = np.full(count, -1, dtype='int64')
+        by_article = {}
+        copy_positions, copy_pages = [], []
+        for position, record in enumerate(records or []):
+            if record.get("page") is not None:
+                self._pages[position] = record["page"]
+            for article in record.get("articles", ()):
+                by_article.setdefault(article, []).append(position)
+            for copy in record.get("copies", ()):
+                if copy.get("source") is not None:
+                    by_source.setdefault(copy["source"], []).append(position)
+                if copy.get("page") is not None:
+                    copy_positions.append(position)
+                    copy_pages.append(copy["page"])
+        self._by_source = {s: np.unique(np.array(p, dtype='int64')) for s, p in by_source.items()}
+        self._by_article = {a: np.array(p, dtype='int64') for a, p in by_article.items()}
+        self._copy_positions = np.array(copy_positions, dtype='int64')
+        self._copy_pages = np.array(copy_pages, dtype='int64')
+        self._resolve_key = lru_cache(maxsize=128)(self._resolve_uncached)
+
+    @property
+    def sources(self):
+        return sorted(self._by_source)
+
+    def _match_sources(self, patterns):
+        matched = [
+            positions for source, positions in self._by_source.items()
+            if any(fnmatch.fnmatch(source, p) or fnmatch.fnmatch(source.replace("\\", "/").rsplit("/", 1)[-1], p)
+                   for p in patterns)
+        ]
+        return np.unique(np.concatenate(matched)) if matched else np.zeros(0, dtype='int64')
+
+    def _resolve_uncached(self, key):
+        allowed = None
+        for name, value in key:
+            if name == "source":
+                positions = self._match_sources(value)
+            elif name == "pages":
+                positions = np.flatnonzero((self._pages >= value[0]) & (self._pages <= value[1]))
+                copies = (self._copy_pages >= value[0]) & (self._copy_pages <= value[1])
+                if copies.any():
+                    positions = np.union1d(positions, self._copy_positions[copies])
+            else:
+                lists = [self._by_article[a] for a in value if a in self._by_article]
+                positions = np.unique(np.concatenate(lists)) if lists else np.zeros(0, dtype='int64')
+            allowed = positions if allowed is None else np.intersect1d(allowed, positions, assume_unique=True)
+        logging.debug(f"Filtro {key}: {len(allowed)} de {self.count} chunks.")
+        return allowed
+
+    def resolve(self, filters):
+        """Posições (ordenadas) dos chunks que atendem a todos os filtros, ou None se não houver filtro."""
+        key = filter_key(filters)
+        if key is None:
+            return None
+        return self._resolve_key(key)
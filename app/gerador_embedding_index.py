@@ -4,19 +4,61 @@ import numpy as np
 import faiss
 import google.generativeai as genai
 from tqdm import tqdm
-from multiprocessing import Pool, cpu_count
 import logging
 import hashlib
 import time
 from google.cloud import storage
 import sys
+import shutil
+from app.indice_faiss import INDEX_TYPES, create_index, train_index, index_report
+from app.bm25 import BM25Index
+from app.chunk_store import (
+    read_chunk_sources, write_chunks, store_path_for, offsets_path_for, sources_path_for, metadata_path_for,
+    read_chunk_metadata, write_chunk_sources, write_chunk_metadata
+)
+from app.cache_embeddings import EmbeddingStore
+from app.remove_duplicates import NEAR_DUPLICATE_THRESHOLD, merge_duplicates
+from app.provedores_embedding import EMBEDDING_PROVIDER, get_embedding_provider, embed_in_batches
+from app.versoes_artefatos import (
+    VERSIONS_DIR, CURRENT_FILE, resolve_data_dir, create_version_dir, write_version_manifest,
+    read_version_manifest, publish_version, prune_versions
+)
+from app.indice_incremental import (
+    CHUNK_IDS_FILE, chunk_ids, is_id_mapped, align_embeddings, update_index,
+    write_index_atomically, write_atomically
+)
+from app.indice_sharded import (
+    SHARDS_DIR, shard_of, shard_rows, shard_path, read_manifest, write_manifest
+)
 
 # Configurações
 EMBEDDED_DIR = "/app/rag_data"
 CHUNKS_JSON = os.path.join(EMBEDDED_DIR, "chunks.json")
 INDEX_PATH = os.path.join(EMBEDDED_DIR, "index.faiss")
 EMBEDDINGS_PATH = os.path.join(EMBEDDED_DIR, "embeddings.npy")
-CACHE_FILE = os.path.join(EMBEDDED_DIR, "embedding_cache.json")
+# Cache de embeddings em SQLite (vetores float32 em BLOB); o JSON antigo é importado uma única vez
+CACHE_FILE = os.path.join(EMBEDDED_DIR, "embedding_cache.sqlite")
+LEGACY_CACHE_FILE = os.path.join(EMBEDDED_DIR, "embedding_cache.json")
+# float16 (padrão) ocupa metade do float32, com erro desprezível para a busca por similaridade
+EMBEDDING_CACHE_DTYPE = os.getenv("EMBEDDING_CACHE_DTYPE", "float16")
+# Com true (padrão), o cache é compactado ao final, mantendo só os embeddings dos chunks atuais
+EMBEDDING_CACHE_COMPACT = os.getenv("EMBEDDING_CACHE_COMPACT", "true").lower() == "true"
+# Progresso do job de embeddings (atualizado a cada lote) e fila dos chunks que falharam, refeitos
+# na próxima execução. Os vetores prontos já estão no cache, então um job interrompido recomeça
+# de onde parou: só os chunks ausentes do cache voltam à API.
+EMBEDDING_JOURNAL_PATH = os.path.join(EMBEDDED_DIR, "embedding_progress.json")
+RETRY_QUEUE_PATH = os.path.join(EMBEDDED_DIR, "embedding_retry_queue.json")
+# No Cloud Run, o cache parcial é enviado ao GCS no máximo a cada tantos segundos durante o job
+EMBEDDING_CHECKPOINT_SECONDS = float(os.getenv("EMBEDDING_CHECKPOINT_SECONDS", "300"))
+INDEX_REPORT_PATH = os.path.join(EMBEDDED_DIR, "index_report.json")
+CHUNK_IDS_PATH = os.path.join(EMBEDDED_DIR, CHUNK_IDS_FILE)
+# Com true (padrão), reaproveita índice e embeddings existentes e só embeda/indexa os chunks novos
+INCREMENTAL_INDEX = os.getenv("INCREMENTAL_INDEX", "true").lower() == "true"
+# Com mais de 1 shard, o índice é particionado em index_shards/ (busca scatter-gather no motor)
+FAISS_SHARDS = int(os.getenv("FAISS_SHARDS", "1"))
+INDEX_SHARDS_DIR = os.path.join(EMBEDDED_DIR, SHARDS_DIR)
+INDEX_TYPE = os.getenv("FAISS_INDEX_TYPE", "flat")
+INDEX_TRAIN_SAMPLE = int(os.getenv("FAISS_TRAIN_SAMPLE", "50000"))
 LOG_FILE = "embedding_debug.log"
 GCS_BUCKET_NAME = os.getenv("GCS_BUCKET_NAME", "seu-bucket-aqui")
 
@@ -25,7 +67,8 @@ logging.basicConfig(filename=LOG_FILE, level=logging.INFO, format='%(asctime)s -
 
 # Configurar API Gemini
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if not GEMINI_API_KEY:
+# Com um provedor local (EMBEDDING_PROVIDER=hashing ou onnx), o gerador roda sem a API
+if not GEMINI_API_KEY and EMBEDDING_PROVIDER == "gemini":
     raise ValueError("GEMINI_API_KEY não definida nas variáveis de ambiente.")
 genai.configure(api_key=GEMINI_API_KEY)
 
@@ -48,34 +91,77 @@ def load_chunks(json_path):
     return chunks
 
 def load_cache():
-    """Carrega o cache de embeddings local ou do GCS."""
+    """Abre o cache de embeddings (baixado do GCS no Cloud Run), migrando o cache JSON antigo se ele existir."""
+    legacy_path = None
     if 'CLOUD_RUN' in os.environ:
         client = storage.Client()
         bucket = client.get_bucket(GCS_BUCKET_NAME)
-        blob = bucket.blob("embedding_cache.json")
+        blob = bucket.blob(os.path.basename(CACHE_FILE))
         if blob.exists():
-            cache_content = blob.download_as_string().decode('utf-8')
-            return json.loads(cache_content)
-        return {}
-    else:
-        if os.path.exists(CACHE_FILE):
-            with open(CACHE_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-        return {}
-
-def save_cache(cache):
-    """Salva o cache de embeddings local ou no GCS."""
-    cache_json = json.dumps(cache, ensure_ascii=False, indent=4)
+            os.makedirs(os.path.dirname(CACHE_FILE) or ".", exist_ok=True)
+            blob.download_to_filename(CACHE_FILE)
+        else:
+            legacy_blob = bucket.blob(os.path.basename(LEGACY_CACHE_FILE))
+            if legacy_blob.exists():
+                legacy_path = CACHE_FILE + ".legacy.json"
+                legacy_blob.download_to_filename(legacy_path)
+    elif os.path.exists(LEGACY_CACHE_FILE):
+        legacy_path = LEGACY_CACHE_FILE
+    cache = EmbeddingStore(CACHE_FILE, EMBEDDING_CACHE_DTYPE)
+    if legacy_path is not None and len(cache) == 0:
+        migrated = cache.import_json(legacy_path)
+        logging.info(f"{migrated} embeddings migrados de {legacy_path} para {CACHE_FILE}.")
+        print(f"{migrated} embeddings migrados de {legacy_path} para {CACHE_FILE}.")
+    logging.info(f"Cache de embeddings aberto com {len(cache)} vetores.")
+    return cache
+
+def upload_cache(cache):
+    """Envia ao GCS uma cópia consistente do cache (no Cloud Run)."""
+    cache.checkpoint()
     if 'CLOUD_RUN' in os.environ:
-        client = storage.Client()
-        bucket = client.get_bucket(GCS_BUCKET_NAME)
-        blob = bucket.blob("embedding_cache.json")
-        blob.upload_from_string(cache_json, content_type='application/json')
-    else:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            f.write(cache_json)
+        save_to_gcs(CACHE_FILE, os.path.basename(CACHE_FILE))
+
+def save_cache(cache, keep=None):
+    """Finaliza o cache de embeddings: compacta (mantendo só as chaves de keep, se informado) e, no Cloud Run, envia ao GCS.
+
+    As gravações já vão para o disco à medida que os embeddings chegam; aqui não há reescrita do cache.
+    """
+    if keep is not None and EMBEDDING_CACHE_COMPACT:
+        removed = cache.compact(keep)
+        logging.info(f"Cache compactado: {removed} embeddings obsoletos removidos.")
+    upload_cache(cache)
     logging.info(f"Cache salvo.")
 
+def write_json_atomically(path, data):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=4)
+    return write_atomically(path, write)
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_retry_queue(path, chunks, sources, failed):
+    """Grava a fila de chunks sem embedding (hash, origem, erro e tentativas acumuladas); retorna as entradas."""
+    previous = {entry["hash"]: entry for entry in read_json(path, [])}
+    queue, seen = [], set()
+    for position, chunk in enumerate(chunks):
+        chunk_hash = get_chunk_hash(chunk)
+        if chunk_hash not in failed or chunk_hash in seen:
+            continue
+        seen.add(chunk_hash)
+        queue.append({
+            "hash": chunk_hash,
+            "source": sources[position] if sources is not None else None,
+            "error": failed[chunk_hash],
+            "attempts": previous.get(chunk_hash, {}).get("attempts", 0) + 1,
+        })
+    write_json_atomically(path, queue)
+    return queue
+
 def save_to_gcs(local_path, gcs_path):
     """Salva um arquivo local no Google Cloud Storage."""
     if 'CLOUD_RUN' in os.environ:
@@ -90,59 +176,279 @@ def get_chunk_hash(chunk):
     """Gera um hash MD5 do chunk para verificar alterações."""
     return hashlib.md5(chunk.encode('utf-8')).hexdigest()
 
-def generate_embedding_single(chunk, cache):
+def embedding_cache_key(chunk_hash, provider):
+    """Chave do cache de embeddings: o hash do chunk, prefixado pelo namespace do provedor (se houver)."""
+    namespace = provider.cache_namespace
+    return f"{namespace}:{chunk_hash}" if namespace else chunk_hash
+
+def generate_embedding_single(chunk, cache, provider=None):
     """Gera embedding para um único chunk com cache."""
-    chunk_hash = get_chunk_hash(chunk)
-    if chunk_hash in cache:
-        logging.debug(f"Embedding de chunk reutilizado do cache: {chunk[:50]}...")
-        return np.array(cache[chunk_hash], dtype='float32')
+    return generate_embeddings_gemini_api([chunk], cache, provider)[0]
 
-    try:
-        response = genai.embed_content(
-            model="models/embedding-001",
-            content=chunk,
-            task_type="retrieval_document"
-        )
-        embedding = response['embedding']
-        cache[chunk_hash] = embedding
-        return np.array(embedding, dtype='float32')
-    except Exception as e:
-        logging.error(f"Erro ao gerar embedding para chunk: {e}")
-        return np.zeros(768, dtype='float32')
-
-def generate_embeddings_gemini_api(chunks, cache):
-    """Gera embeddings usando a API Gemini em paralelo com progresso."""
-    logging.info(f"Iniciando geração de embeddings para {len(chunks)} chunks.")
-    print(f"Iniciando geração de embeddings para {len(chunks)} chunks.")
-    start_time = time.time()
-
-    num_processes = 20 if 'CLOUD_RUN' not in os.environ else min(cpu_count(), 4)
-    with Pool(num_processes) as pool:
-        embeddings_list = list(tqdm(
-            pool.starmap(generate_embedding_single, [(chunk, cache) for chunk in chunks]),
-            total=len(chunks),
-            desc="Gerando embeddings"
-        ))
+def embed_missing(chunks, cache, provider=None, journal_path=None, checkpoint=None):
+    """Embeda os chunks ausentes do cache (cada texto uma vez), gravando cada lote no cache assim que termina.
+
+    Textos de lotes que falharem são tentados de novo um a um, para que um texto problemático não
+    derrube os demais do lote. Com journal_path, o progresso é gravado a cada lote; checkpoint, se
+    informado, é chamado a cada EMBEDDING_CHECKPOINT_SECONDS. Retorna {hash: erro} dos que falharam.
+    """
+    provider = provider or get_embedding_provider()
+    texts = {}
+    for chunk in chunks:
+        texts.setdefault(get_chunk_hash(chunk), chunk)
+    missing = [h for h in texts if embedding_cache_key(h, provider) not in cache]
+    previous = read_json(journal_path) if journal_path else None
+    if previous and not previous.get("finished"):
+        logging.info(f"Retomando job de embeddings interrompido: {len(texts) - len(missing)} de {len(texts)} já no cache.")
+        print(f"Retomando job de embeddings interrompido: {len(texts) - len(missing)} de {len(texts)} já no cache.")
+    logging.info(f"Iniciando geração de embeddings para {len(chunks)} chunks ({len(missing)} fora do cache).")
+    print(f"Iniciando geração de embeddings para {len(chunks)} chunks ({len(missing)} fora do cache).")
+    start_time = last_checkpoint = time.time()
+    state = {"total": len(texts), "cached": len(texts) - len(missing), "embedded": 0, "failed": 0,
+             "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "finished": False}
+
+    failed = {}
+    pending = missing
+    for batch_size in (provider.max_batch_size, 1):
+        if not pending or (batch_size == 1 and provider.max_batch_size == 1 and failed):
+            break
+        failed = {}
+        pending_texts = [texts[h] for h in pending]
+        # Os resultados chegam às threads do pipeline, mas só esta thread escreve no cache e no journal
+        with tqdm(total=len(pending_texts), desc="Gerando embeddings", unit="chunk") as progress:
+            for positions, result in embed_in_batches(pending_texts, provider, max_batch_size=batch_size):
+                progress.update(len(positions))
+                if isinstance(result, Exception):
+                    failed.update((pending[i], str(result)) for i in positions)
+                else:
+                    # Um lote por gravação (uma transação no EmbeddingStore)
+                    cache.update({embedding_cache_key(pending[i], provider): vector
+                                  for i, vector in zip(positions, result)})
+                    state["embedded"] += len(positions)
+                if journal_path:
+                    state["failed"] = len(failed)
+                    write_json_atomically(journal_path, state)
+                if checkpoint is not None and time.time() - last_checkpoint >= EMBEDDING_CHECKPOINT_SECONDS:
+                    checkpoint()
+                    last_checkpoint = time.time()
+        pending = list(failed)
 
+    state["failed"] = len(failed)
+    state["finished"] = True
+    if journal_path:
+        write_json_atomically(journal_path, state)
     duration = time.time() - start_time
-    logging.info(f"Embeddings gerados em {duration:.2f} segundos com {num_processes} processos.")
-    print(f"Embeddings gerados em {duration:.2f} segundos com {num_processes} processos.")
-    return np.array(embeddings_list, dtype='float32')
+    logging.info(f"Embeddings gerados em {duration:.2f} segundos ({len(failed)} chunks com falha).")
+    print(f"Embeddings gerados em {duration:.2f} segundos ({len(failed)} chunks com falha).")
+    return failed
 
-def build_index(embeddings):
-    """Constrói e retorna o índice FAISS IndexFlatL2, usando GPU se disponível."""
+def generate_embeddings_gemini_api(chunks, cache, provider=None):
+    """Embeddings dos chunks, na ordem, enviando ao provedor apenas os ausentes do cache.
+
+    Levanta RuntimeError se algum chunk ficar sem embedding (os que deram certo permanecem no cache).
+    """
+    provider = provider or get_embedding_provider()
+    failed = embed_missing(chunks, cache, provider)
+    if failed:
+        raise RuntimeError(f"{len(failed)} chunks ficaram sem embedding: {next(iter(failed.values()))}")
+    keys = [embedding_cache_key(get_chunk_hash(chunk), provider) for chunk in chunks]
+    return np.array([np.asarray(cache[key], dtype='float32') for key in keys],
+                    dtype='float32').reshape(len(chunks), provider.dimension)
+
+def build_index(embeddings, index_type=None, train_sample=None, ids=None, **params):
+    """Constrói e retorna o índice FAISS do tipo configurado (flat por padrão, usando GPU se disponível).
+
+    Tipos aproximados (ivf_flat, ivf_pq, hnsw) aceitam nlist, pq_m, pq_nbits e hnsw_m em params
+    e são treinados numa amostra de até train_sample vetores. Com ids, o índice é envolvido num
+    IndexIDMap2 que guarda os ids estáveis dos chunks, permitindo atualizações incrementais.
+    """
+    index_type = index_type or INDEX_TYPE
     dimension = embeddings.shape[1]
-    if 'USE_FAISS_GPU' in os.environ and os.environ['USE_FAISS_GPU'].lower() == 'true':
+    use_gpu = 'USE_FAISS_GPU' in os.environ and os.environ['USE_FAISS_GPU'].lower() == 'true'
+    if index_type == "flat" and use_gpu:
         res = faiss.StandardGpuResources()
         index = faiss.GpuIndexFlatL2(res, dimension)
     else:
-        index = faiss.IndexFlatL2(dimension)
-    
-    index.add(embeddings)
-    logging.info(f"Índice FAISS construído com {index.ntotal} vetores (GPU: {'USE_FAISS_GPU' in os.environ}).")
-    print(f"Índice FAISS construído com {index.ntotal} vetores (GPU: {'USE_FAISS_GPU' in os.environ}).")
+        index = create_index(dimension, index_type, n_vectors=len(embeddings), **params)
+        train_index(index, embeddings, train_sample or INDEX_TRAIN_SAMPLE)
+
+    if ids is not None:
+        index = faiss.IndexIDMap2(index)
+        index.add_with_ids(embeddings, np.asarray(ids, dtype='int64'))
+    else:
+        index.add(embeddings)
+    logging.info(f"Índice FAISS ({index_type}) construído com {index.ntotal} vetores (GPU: {'USE_FAISS_GPU' in os.environ}).")
+    print(f"Índice FAISS ({index_type}) construído com {index.ntotal} vetores (GPU: {'USE_FAISS_GPU' in os.environ}).")
     return index
 
+def same_embedding_space(version_dir, embeddings, provider=None):
+    """Confere se os embeddings anteriores vieram do provedor atual e têm a sua dimensão.
+
+    O provedor é lido do manifesto da versão; versões sem esse campo (ou o layout antigo, sem
+    manifesto) são anteriores aos provedores plugáveis e sempre usaram o Gemini.
+    """
+    provider = provider or get_embedding_provider()
+    manifest = read_version_manifest(version_dir) or {}
+    previous_provider = manifest.get("embedding_provider", "gemini")
+    previous_dimension = manifest.get("embedding_dimension", embeddings.shape[1])
+    if previous_provider != provider.name or previous_dimension != provider.dimension \
+            or embeddings.shape[1] != provider.dimension:
+        logging.warning(f"Embeddings anteriores de {previous_provider} ({previous_dimension} dimensões), provedor atual "
+                        f"{provider.name} ({provider.dimension}): reconstrução completa.")
+        return False
+    return True
+
+def load_previous_index(index_path=INDEX_PATH, ids_path=CHUNK_IDS_PATH, embeddings_path=EMBEDDINGS_PATH,
+                        provider=None):
+    """Carrega índice, ids e embeddings da execução anterior, ou None se não puderem ser reaproveitados."""
+    if not all(os.path.exists(path) for path in (index_path, ids_path, embeddings_path)):
+        return None
+    embeddings = np.load(embeddings_path, mmap_mode='r')
+    if not same_embedding_space(os.path.dirname(ids_path), embeddings, provider):
+        return None
+    index = faiss.read_index(index_path)
+    ids = np.load(ids_path)
+    embeddings = np.load(embeddings_path)
+    if not is_id_mapped(index) or not (index.ntotal == len(ids) == len(embeddings)):
+        logging.warning("Artefatos anteriores sem ids ou inconsistentes: reconstrução completa.")
+        return None
+    expected = create_index(index.d, INDEX_TYPE, n_vectors=max(len(ids), 1))
+    if type(faiss.downcast_index(index.index)) is not type(expected):
+        logging.warning(f"Índice anterior não é do tipo {INDEX_TYPE}: reconstrução completa.")
+        return None
+    return index, ids, embeddings
+
+def update_or_build_index(chunks, ids, cache, previous=None):
+    """Atualiza o índice anterior com os chunks adicionados/removidos ou, sem ele, constrói do zero.
+
+    Retorna (índice, embeddings alinhados aos chunks). Só os chunks novos são enviados à API.
+    """
+    if previous is None:
+        embeddings = generate_embeddings_gemini_api(chunks, cache)
+        return build_index(embeddings, ids=ids), embeddings
+    index, old_ids, old_embeddings = previous
+    embeddings, removed, added_positions = align_embeddings(
+        old_ids, old_embeddings, ids,
+        lambda positions: generate_embeddings_gemini_api([chunks[i] for i in positions], cache)
+    )
+    print(f"Atualização incremental: {len(removed)} chunks removidos, {len(added_positions)} adicionados.")
+    try:
+        update_index(index, removed, ids, added_positions, embeddings)
+    except RuntimeError as e:
+        # HNSW não suporta remoção: reconstrói a partir dos embeddings, sem novas chamadas à API
+        logging.warning(f"Índice não suporta atualização in-place ({e}); reconstruindo a partir dos embeddings.")
+        index = build_index(embeddings, ids=ids)
+    return index, embeddings
+
+def load_previous_shards(n_shards, shards_dir=INDEX_SHARDS_DIR, ids_path=CHUNK_IDS_PATH, embeddings_path=EMBEDDINGS_PATH,
+                         provider=None):
+    """Carrega shards, ids e embeddings da execução anterior, ou None se não puderem ser reaproveitados."""
+    manifest = read_manifest(shards_dir)
+    if manifest is None or not all(os.path.exists(path) for path in (ids_path, embeddings_path)):
+        return None
+    if not same_embedding_space(os.path.dirname(ids_path), np.load(embeddings_path, mmap_mode='r'), provider):
+        return None
+    if manifest["n_shards"] != n_shards or manifest["index_type"] != INDEX_TYPE:
+        logging.warning("Particionamento ou tipo de índice alterado: reconstrução completa dos shards.")
+        return None
+    shards = [faiss.read_index(shard_path(shards_dir, shard_no)) for shard_no in range(n_shards)]
+    ids = np.load(ids_path)
+    embeddings = np.load(embeddings_path)
+    if not (sum(shard.ntotal for shard in shards) == len(ids) == len(embeddings)):
+        logging.warning("Shards anteriores inconsistentes: reconstrução completa.")
+        return None
+    return shards, ids, embeddings
+
+def update_or_build_shards(chunks, ids, cache, n_shards, previous=None):
+    """Versão particionada de update_or_build_index: cada id vai para o shard id % n_shards.
+
+    Retorna (lista de shards, embeddings alinhados aos chunks). Só os shards afetados são modificados.
+    """
+    if previous is None:
+        embeddings = generate_embeddings_gemini_api(chunks, cache)
+        return [build_index(embeddings[rows], ids=ids[rows]) for rows in shard_rows(ids, n_shards)], embeddings
+    shards, old_ids, old_embeddings = previous
+    embeddings, removed, added_positions = align_embeddings(
+        old_ids, old_embeddings, ids,
+        lambda positions: generate_embeddings_gemini_api([chunks[i] for i in positions], cache)
+    )
+    print(f"Atualização incremental: {len(removed)} chunks removidos, {len(added_positions)} adicionados.")
+    removed_owner = shard_of(removed, n_shards)
+    added_owner = shard_of(ids[added_positions], n_shards)
+    for shard_no, rows in enumerate(shard_rows(ids, n_shards)):
+        try:
+            update_index(shards[shard_no], removed[removed_owner == shard_no], ids,
+                         added_positions[added_owner == shard_no], embeddings)
+        except RuntimeError as e:
+            logging.warning(f"Shard {shard_no} não suporta atualização in-place ({e}); reconstruindo.")
+            shards[shard_no] = build_index(embeddings[rows], ids=ids[rows])
+    return shards, embeddings
+
+def write_shards(shards, shards_dir=INDEX_SHARDS_DIR):
+    """Grava cada shard atomicamente e, por último, o manifesto que o motor usa para encontrá-los."""
+    os.makedirs(shards_dir, exist_ok=True)
+    for shard_no, shard in enumerate(shards):
+        write_index_atomically(shard, shard_path(shards_dir, shard_no))
+    return write_manifest(shards_dir, shards, INDEX_TYPE)
+
+def write_version(data_dir, chunks, ids, embeddings, index, chunks_json=CHUNKS_JSON, sources=None, metadata=None):
+    """Grava todos os artefatos numa nova versão em data_dir/versions/ e a publica em CURRENT.
+
+    index é um índice único ou a lista de shards. A versão anterior continua intacta até ser
+    removida por prune_versions, então workers que ainda a usam não leem arquivos parciais.
+    Com chunks_json=None (chunks filtrados, ex.: sem quase-duplicatas), os arquivos de chunks são
+    gravados a partir de chunks, sources e metadata em vez de copiados. Retorna (versão, manifesto).
+    """
+    version, version_dir = create_version_dir(data_dir)
+    np.save(os.path.join(version_dir, CHUNK_IDS_FILE), ids)
+    np.save(os.path.join(version_dir, "embeddings.npy"), embeddings)
+    BM25Index.build(chunks).save(os.path.join(version_dir, "bm25.npz"))
+    if isinstance(index, list):
+        write_shards(index, os.path.join(version_dir, SHARDS_DIR))
+    else:
+        faiss.write_index(index, os.path.join(version_dir, "index.faiss"))
+    # Cada versão leva sua cópia dos chunks, para que índice e textos nunca sejam de execuções diferentes
+    if chunks_json and os.path.exists(chunks_json):
+        chunk_files = [chunks_json, store_path_for(chunks_json), offsets_path_for(store_path_for(chunks_json)),
+                       sources_path_for(chunks_json), metadata_path_for(chunks_json)]
+        for path in chunk_files:
+            if os.path.exists(path):
+                shutil.copy2(path, version_dir)
+    else:
+        version_json = os.path.join(version_dir, "chunks.json")
+        write_chunks(chunks, version_json)
+        write_chunks(chunks, store_path_for(version_json))
+        if sources is not None:
+            write_chunk_sources(sources, version_json)
+        if metadata is not None:
+            write_chunk_metadata(metadata, version_json)
+    # O provedor fica registrado para que o app confira se embeda as consultas no mesmo espaço
+    provider = get_embedding_provider()
+    manifest = write_version_manifest(version_dir, version, index_type=INDEX_TYPE, n_shards=FAISS_SHARDS,
+                                      n_chunks=len(chunks), embedding_provider=provider.name,
+                                      embedding_dimension=int(np.asarray(embeddings).shape[1]))
+    publish_version(data_dir, version)
+    prune_versions(data_dir)
+    logging.info(f"Versão {version} gravada em {version_dir}.")
+    print(f"Versão {version} gravada em {version_dir}.")
+    return version, manifest
+
+def write_index_report(embeddings, report_path=INDEX_REPORT_PATH, k=10):
+    """Compara recall@k e latência das configurações aproximadas com o índice flat e salva em JSON."""
+    configs = [{"index_type": "flat"}]
+    for nprobe in (1, 8, 32):
+        configs.append({"index_type": "ivf_flat", "nprobe": nprobe})
+        configs.append({"index_type": "ivf_pq", "nprobe": nprobe})
+    for ef_search in (16, 64, 128):
+        configs.append({"index_type": "hnsw", "ef_search": ef_search})
+    configs.extend({"index_type": index_type} for index_type in ("sq8", "sq_fp16", "pq"))
+    report = index_report(embeddings, configs, k=k)
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+    logging.info(f"Relatório de índices salvo em {report_path}.")
+    print(f"Relatório de índices salvo em {report_path}.")
+    return report
+
 if __name__ == "__main__":
     if 'CLOUD_RUN' not in os.environ:
         os.makedirs(EMBEDDED_DIR, exist_ok=True)
@@ -161,7 +467,49 @@ if __name__ == "__main__":
 
     cache = load_cache()
 
-    embeddings = generate_embeddings_gemini_api(chunks, cache)
+    if INDEX_TYPE not in INDEX_TYPES:
+        print(f"Tipo de índice inválido: {INDEX_TYPE}. Opções: {', '.join(INDEX_TYPES)}.")
+        sys.exit(1)
+    sources = read_chunk_sources(CHUNKS_JSON, len(chunks))
+    metadata = read_chunk_metadata(CHUNKS_JSON, len(chunks))
+    # Cópias e quase-duplicatas saem antes de embedar: menos chamadas à API, índice menor e menos redundância.
+    # A origem e a página de cada cópia ficam nos metadados do chunk mantido, para os filtros continuarem valendo
+    keep, merged_metadata = merge_duplicates(chunks, sources, metadata, NEAR_DUPLICATE_THRESHOLD)
+    deduplicated = len(keep) < len(chunks)
+    if deduplicated:
+        logging.info(f"{len(chunks) - len(keep)} chunks duplicados ou quase duplicados descartados.")
+        print(f"{len(chunks) - len(keep)} chunks duplicados ou quase duplicados descartados.")
+        chunks = [chunks[i] for i in keep]
+        sources = [sources[i] for i in keep] if sources is not None else None
+        metadata = merged_metadata
+    # Embeddings de todos os chunks vão para o cache antes do índice; os que falharem ficam na fila de
+    # novas tentativas e fora desta versão, em vez de entrarem no índice com vetores nulos
+    failed = embed_missing(chunks, cache, journal_path=EMBEDDING_JOURNAL_PATH,
+                           checkpoint=(lambda: upload_cache(cache)) if 'CLOUD_RUN' in os.environ else None)
+    write_retry_queue(RETRY_QUEUE_PATH, chunks, sources, failed)
+    if failed:
+        logging.warning(f"{len(failed)} chunks sem embedding ficam fora desta versão (fila em {RETRY_QUEUE_PATH}).")
+        print(f"{len(failed)} chunks sem embedding ficam fora desta versão (fila em {RETRY_QUEUE_PATH}).")
+        keep = [i for i, chunk in enumerate(chunks) if get_chunk_hash(chunk) not in failed]
+        if not keep:
+            upload_cache(cache)
+            sys.exit(1)
+        chunks = [chunks[i] for i in keep]
+        sources = [sources[i] for i in keep] if sources is not None else None
+        metadata = [metadata[i] for i in keep] if metadata is not None else None
+    ids = chunk_ids(chunks, sources)
+    # Artefatos da versão ativa (ou do layout antigo, sem versões) servem de base para a atualização incremental
+    previous_dir = resolve_data_dir(EMBEDDED_DIR)
+    previous_ids = os.path.join(previous_dir, CHUNK_IDS_FILE)
+    previous_embeddings = os.path.join(previous_dir, "embeddings.npy")
+    if FAISS_SHARDS > 1:
+        previous = load_previous_shards(FAISS_SHARDS, os.path.join(previous_dir, SHARDS_DIR), previous_ids,
+                                        previous_embeddings) if INCREMENTAL_INDEX else None
+        index, embeddings = update_or_build_shards(chunks, ids, cache, FAISS_SHARDS, previous)
+    else:
+        previous = load_previous_index(os.path.join(previous_dir, "index.faiss"), previous_ids,
+                                       previous_embeddings) if INCREMENTAL_INDEX else None
+        index, embeddings = update_or_build_index(chunks, ids, cache, previous)
     if len(embeddings) != len(chunks):
         logging.warning(f"Inconsistência: {len(embeddings)} embeddings gerados para {len(chunks)} chunks.")
         print(f"Inconsistência: {len(embeddings)} embeddings gerados para {len(chunks)} chunks.")
@@ -169,21 +517,25 @@ if __name__ == "__main__":
         logging.info(f"Gerados {len(embeddings)} embeddings com sucesso.")
         print(f"Gerados {len(embeddings)} embeddings com sucesso.")
 
-    index = build_index(embeddings)
+    if os.getenv("FAISS_INDEX_REPORT", "").lower() == "true":
+        write_index_report(embeddings)
     
     # Converter índice GPU para CPU antes de salvar
     if 'USE_FAISS_GPU' in os.environ and os.environ['USE_FAISS_GPU'].lower() == 'true':
-        index = faiss.index_gpu_to_cpu(index)
+        index = [faiss.index_gpu_to_cpu(shard) for shard in index] if FAISS_SHARDS > 1 else faiss.index_gpu_to_cpu(index)
         logging.info("Índice convertido de GPU para CPU para salvamento.")
         print("Índice convertido de GPU para CPU para salvamento.")
     
-    faiss.write_index(index, INDEX_PATH)
-    np.save(EMBEDDINGS_PATH, embeddings)
-    save_cache(cache)
+    # Nova versão em versions/<versão>/; os workers a carregam ao detectar a mudança de CURRENT
+    version, manifest = write_version(EMBEDDED_DIR, chunks, ids, embeddings, index,
+                                      None if deduplicated or failed else CHUNKS_JSON, sources, metadata)
+    save_cache(cache, {embedding_cache_key(get_chunk_hash(chunk), get_embedding_provider()) for chunk in chunks})
 
     if 'CLOUD_RUN' in os.environ:
-        save_to_gcs(INDEX_PATH, "index.faiss")
-        save_to_gcs(EMBEDDINGS_PATH, "embeddings.npy")
+        # Arquivos da versão primeiro, CURRENT por último
+        for relative in list(manifest["files"]) + ["manifest.json"]:
+            save_to_gcs(os.path.join(EMBEDDED_DIR, VERSIONS_DIR, version, relative), f"{VERSIONS_DIR}/{version}/{relative}")
+        save_to_gcs(os.path.join(EMBEDDED_DIR, CURRENT_FILE), CURRENT_FILE)
 
-    logging.info(f"Índice FAISS salvo em {INDEX_PATH}, embeddings em {EMBEDDINGS_PATH}.")
-    print(f"Índice FAISS salvo em {INDEX_PATH}, embeddings em {EMBEDDINGS_PATH}.")
\ No newline at end of file
+    logging.info(f"Índice FAISS e embeddings salvos na versão {version}.")
+    print(f"Índice FAISS e embeddings salvos na versão {version}.")
\ No newline at end of file
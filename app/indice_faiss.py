@@ -0,0 +1,175 @@
+import time
+import logging
+import numpy as np
+import faiss
+
+# Tipos de índice suportados pela fábrica. sq8, sq_fp16 e pq guardam códigos comprimidos
+# (1 byte, 2 bytes ou pq_m bytes por vetor) em vez dos vetores float32 completos.
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "sq_fp16", "pq")
+DEFAULT_TRAIN_SAMPLE = 50000
+DEFAULT_HNSW_M = 32
+DEFAULT_PQ_NBITS = 8
+
+def default_nlist(n_vectors):
+    """Número de listas IVF proporcional a sqrt(N), limitado para manter ~39 pontos de treino por centróide."""
+    return max(1, min(int(4 * np.sqrt(max(n_vectors, 1))), n_vectors // 39 or 1))
+
+def default_pq_m(dimension):
+    """Maior número de subquantizadores (até 64) que divide a dimensão."""
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2, 1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+def create_index(dimension, index_type="flat", n_vectors=None, nlist=None, pq_m=None,
+                 pq_nbits=DEFAULT_PQ_NBITS, hnsw_m=DEFAULT_HNSW_M):
+    """Cria um índice FAISS vazio do tipo pedido (ver INDEX_TYPES)."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Tipo de índice desconhecido: {index_type}. Opções: {', '.join(INDEX_TYPES)}.")
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dimension)
+    if index_type == "hnsw":
+        return faiss.IndexHNSWFlat(dimension, hnsw_m)
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit)
+    if index_type == "sq_fp16":
+        return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16)
+    if index_type == "pq":
+        return faiss.IndexPQ(dimension, pq_m or default_pq_m(dimension), pq_nbits)
+    nlist = nlist or default_nlist(n_vectors or 0)
+    quantizer = faiss.IndexFlatL2(dimension)
+    if index_type == "ivf_flat":
+        return faiss.IndexIVFFlat(quantizer, dimension, nlist)
+    return faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m or default_pq_m(dimension), pq_nbits)
+
+def sample_for_training(embeddings, sample_size=DEFAULT_TRAIN_SAMPLE, seed=42):
+    """Amostra aleatória (sem reposição) das linhas usadas no treino dos quantizadores."""
+    if len(embeddings) <= sample_size:
+        return embeddings
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(len(embeddings), sample_size, replace=False))
+    return embeddings[rows]
+
+def train_index(index, embeddings, sample_size=DEFAULT_TRAIN_SAMPLE, seed=42):
+    if index.is_trained:
+        return index
+    sample = np.ascontiguousarray(sample_for_training(embeddings, sample_size, seed), dtype='float32')
+    start_time = time.time()
+    index.train(sample)
+    logging.info(f"Índice treinado com {len(sample)} vetores em {time.time() - start_time:.2f} segundos.")
+    return index
+
+def set_search_params(index, nprobe=None, ef_search=None):
+    """Ajusta nprobe (IVF) e efSearch (HNSW) em tempo de consulta; parâmetros sem efeito no índice são ignorados."""
+    if hasattr(index, "shards"):
+        # Índice particionado (app.indice_sharded): repassa os parâmetros a cada shard
+        return index.set_search_params(nprobe=nprobe, ef_search=ef_search)
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is None:
+            continue
+        try:
+            params.set_index_parameter(index, name, int(value))
+        except RuntimeError:
+            logging.debug(f"Parâmetro {name} não se aplica ao índice {type(index).__name__}.")
+    return index
+
+def search_parameters(index, selector):
+    """SearchParameters com o seletor de ids, do tipo exigido pelo índice e com o nprobe/efSearch atuais.
+
+    IndexIVF rejeita parâmetros genéricos, e SearchParametersHNSW sem efSearch explícito usaria o
+    padrão (16) em vez do valor configurado no índice.
+    """
+    inner = faiss.downcast_index(index.index) if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)) else index
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=inner.nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    return faiss.SearchParameters(sel=selector)
+
+def filtered_search(index, queries, k, allowed_ids):
+    """Busca restrita aos ids permitidos, aplicada dentro do índice (IDSelectorBatch) em vez de pós-filtrar."""
+    if hasattr(index, "shards"):
+        return index.search(queries, k, allowed_ids=allowed_ids)
+    allowed_ids = np.ascontiguousarray(allowed_ids, dtype='int64')
+    selector = faiss.IDSelectorBatch(allowed_ids)
+    params = search_parameters(index, selector)
+    return index.search(queries, k, params=params)
+
+def rescore(queries, candidate_ids, vectors, k):
+    """Reordena os candidatos de um índice comprimido pela distância L2 exata.
+
+    vectors pode ser um np.memmap de embeddings.npy: apenas as linhas candidatas são lidas.
+    Retorna (distâncias, índices) com k colunas, preenchidas com -1 quando faltam candidatos.
+    """
+    queries = np.asarray(queries, dtype='float32')
+    distances = np.full((len(queries), k), np.inf, dtype='float32')
+    indices = np.full((len(queries), k), -1, dtype='int64')
+    for row, (query, ids) in enumerate(zip(queries, candidate_ids)):
+        # Leitura em ordem crescente de linha favorece o acesso sequencial ao memmap
+        ids = np.unique(ids[(ids >= 0) & (ids < len(vectors))])
+        if len(ids) == 0:
+            continue
+        exact = ((np.asarray(vectors[ids], dtype='float32') - query) ** 2).sum(axis=1)
+        order = np.argsort(exact)[:k]
+        distances[row, :len(order)] = exact[order]
+        indices[row, :len(order)] = ids[order]
+    return distances, indices
+
+def exact_neighbors(embeddings, queries, k):
+    """Vizinhos exatos (IndexFlatL2) usados como referência no cálculo de recall."""
+    flat = faiss.IndexFlatL2(embeddings.shape[1])
+    flat.add(embeddings)
+    return flat.search(queries, k)[1]
+
+def recall_at_k(found, ground_truth):
+    """Fração média dos k vizinhos exatos que aparecem entre os k retornados."""
+    hits = sum(len(set(f[f >= 0]) & set(g)) for f, g in zip(found, ground_truth))
+    return hits / float(ground_truth.size)
+
+def evaluate_index(index, queries, ground_truth, k=10):
+    """Mede recall@k contra a busca exata e a latência por consulta (uma consulta por chamada)."""
+    latencies = []
+    found = np.empty((len(queries), k), dtype='int64')
+    for i in range(len(queries)):
+        start = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found[i] = ids[0]
+    latencies = np.array(latencies)
+    return {
+        f"recall_at_{k}": recall_at_k(found, ground_truth),
+        "latency_ms_mean": float(latencies.mean()),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+    }
+
+def index_report(embeddings, configs, k=10, n_queries=100, seed=42):
+    """Constrói cada configuração e compara recall@k e latência com o índice flat.
+
+    Cada configuração é um dicionário com index_type e, opcionalmente, parâmetros de
+    construção (nlist, pq_m, hnsw_m) e de consulta (nprobe, ef_search).
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype='float32')
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(embeddings), min(n_queries, len(embeddings)), replace=False)
+    queries = embeddings[query_rows]
+    k = min(k, len(embeddings))
+    ground_truth = exact_neighbors(embeddings, queries, k)
+
+    report = []
+    for config in configs:
+        config = dict(config)
+        nprobe = config.pop("nprobe", None)
+        ef_search = config.pop("ef_search", None)
+        start_time = time.time()
+        index = create_index(embeddings.shape[1], n_vectors=len(embeddings), **config)
+        train_index(index, embeddings)
+        index.add(embeddings)
+        build_seconds = time.time() - start_time
+        set_search_params(index, nprobe=nprobe, ef_search=ef_search)
+        result = {**config, "nprobe": nprobe, "ef_search": ef_search, "build_seconds": build_seconds}
+        result.update(evaluate_index(index, queries, ground_truth, k))
+        logging.info(f"Relatório de índice: {result}")
+        report.append(result)
+    return report
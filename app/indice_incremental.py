@@ -0,0 +1,102 @@
+import os
+import hashlib
+import logging
+from collections import Counter
+import numpy as np
+import faiss
+
+# Ids estáveis dos chunks, na mesma ordem do chunks.json e das linhas de embeddings.npy.
+# O índice FAISS (IndexIDMap2) guarda esses ids, não a posição do chunk.
+CHUNK_IDS_FILE = "chunk_ids.npy"
+
+def chunk_id(source, text, occurrence=0):
+    """Id de 63 bits derivado do arquivo de origem, do texto e da ocorrência do texto nesse arquivo."""
+    key = f"{source}\0{occurrence}\0{text}".encode('utf-8')
+    return int.from_bytes(hashlib.md5(key).digest()[:8], "little") & 0x7FFFFFFFFFFFFFFF
+
+def chunk_ids(chunks, sources=None):
+    """Ids estáveis de todos os chunks: um chunk inalterado mantém o id mesmo que sua posição mude."""
+    seen = Counter()
+    ids = np.empty(len(chunks), dtype='int64')
+    for i, text in enumerate(chunks):
+        source = sources[i] if sources is not None else ""
+        ids[i] = chunk_id(source, text, seen[(source, text)])
+        seen[(source, text)] += 1
+    return ids
+
+def is_id_mapped(index):
+    return getattr(index, "id_mapped", False) or isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2))
+
+def write_atomically(path, write):
+    """Chama write(caminho_temporário) e só então substitui path, para que leitores nunca vejam um arquivo parcial."""
+    root, ext = os.path.splitext(path)
+    tmp_path = f"{root}.tmp{ext}"
+    write(tmp_path)
+    with open(tmp_path, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return path
+
+def write_index_atomically(index, path):
+    return write_atomically(path, lambda tmp_path: faiss.write_index(index, tmp_path))
+
+def save_npy_atomically(path, array):
+    return write_atomically(path, lambda tmp_path: np.save(tmp_path, array))
+
+class IdTranslator:
+    """Converte ids estáveis retornados pelo índice em posições no chunk store e em embeddings.npy."""
+
+    def __init__(self, ids):
+        ids = np.asarray(ids, dtype='int64')
+        self.ids = ids
+        self._order = np.argsort(ids, kind="stable")
+        self._sorted = ids[self._order]
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def to_positions(self, ids):
+        """Mesmo formato de ids; ids desconhecidos (ou -1, vagas não preenchidas pelo FAISS) viram -1."""
+        ids = np.asarray(ids, dtype='int64')
+        if len(self._sorted) == 0:
+            return np.full(ids.shape, -1, dtype='int64')
+        slots = np.minimum(np.searchsorted(self._sorted, ids), len(self._sorted) - 1)
+        found = (self._sorted[slots] == ids) & (ids >= 0)
+        return np.where(found, self._order[slots], -1).astype('int64')
+
+def diff_ids(old_ids, new_ids):
+    """Ids a remover do índice e posições (em new_ids) dos chunks a embedar e adicionar."""
+    old_ids = np.asarray(old_ids, dtype='int64')
+    new_ids = np.asarray(new_ids, dtype='int64')
+    removed = old_ids[~np.isin(old_ids, new_ids)]
+    added_positions = np.flatnonzero(~np.isin(new_ids, old_ids))
+    return removed, added_positions
+
+def align_embeddings(old_ids, old_embeddings, new_ids, embed):
+    """Embeddings alinhados a new_ids, reaproveitando as linhas de old_embeddings e embedando só os chunks novos.
+
+    embed recebe as posições (em new_ids) dos chunks novos e retorna seus embeddings.
+    Retorna (embeddings, ids removidos, posições adicionadas).
+    """
+    removed, added_positions = diff_ids(old_ids, new_ids)
+    old_rows = IdTranslator(old_ids).to_positions(new_ids)
+    embeddings = np.empty((len(new_ids), old_embeddings.shape[1]), dtype='float32')
+    kept = old_rows >= 0
+    embeddings[kept] = old_embeddings[old_rows[kept]]
+    if len(added_positions):
+        embeddings[added_positions] = np.asarray(embed(added_positions), dtype='float32')
+    return embeddings, removed, added_positions
+
+def update_index(index, removed, new_ids, added_positions, embeddings):
+    """Remove e adiciona vetores num índice IndexIDMap2 in-place, sem reconstruí-lo.
+
+    Índices que não suportam remoção (HNSW) levantam RuntimeError; nesse caso, reconstrua-os
+    a partir dos embeddings já alinhados, sem novas chamadas de embedding.
+    """
+    new_ids = np.asarray(new_ids, dtype='int64')
+    if len(removed):
+        index.remove_ids(np.asarray(removed, dtype='int64'))
+    if len(added_positions):
+        index.add_with_ids(np.ascontiguousarray(embeddings[added_positions]), new_ids[added_positions])
+    logging.info(f"Índice atualizado: {len(removed)} chunks removidos, {len(added_positions)} adicionados, {index.ntotal} vetores.")
+    return index
@@ -0,0 +1,155 @@
+import os
+import json
+import logging
+import numpy as np
+import faiss
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from app.indice_faiss import set_search_params, filtered_search
+
+# Índice particionado em shards (IndexIDMap2 com os ids estáveis dos chunks), gravados em
+# <data_dir>/index_shards/shard_NNN.faiss. Cada id pertence ao shard id % n_shards, o que
+# permite atualizar um shard sem tocar nos demais.
+SHARDS_DIR = "index_shards"
+SHARDS_MANIFEST = "manifest.json"
+SHARD_BACKENDS = ("thread", "process")
+
+def shards_dir_for(data_dir):
+    return os.path.join(data_dir, SHARDS_DIR)
+
+def shard_path(shards_dir, shard_no):
+    return os.path.join(shards_dir, f"shard_{shard_no:03d}.faiss")
+
+def shard_of(ids, n_shards):
+    return np.asarray(ids, dtype='int64') % n_shards
+
+def shard_rows(ids, n_shards):
+    """Posições (em ids) de cada shard."""
+    owners = shard_of(ids, n_shards)
+    return [np.flatnonzero(owners == shard_no) for shard_no in range(n_shards)]
+
+def read_manifest(shards_dir):
+    path = os.path.join(shards_dir, SHARDS_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_manifest(shards_dir, shards, index_type):
+    """Grava o manifesto por último: enquanto ele não é substituído, leitores usam o conjunto anterior."""
+    path = os.path.join(shards_dir, SHARDS_MANIFEST)
+    manifest = {"n_shards": len(shards), "index_type": index_type, "ntotal": [int(s.ntotal) for s in shards]}
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+def read_shard(path, mmap=False):
+    """Lê um shard; com mmap, vetores e listas invertidas ficam no page cache, compartilhado entre processos."""
+    return faiss.read_index(path, faiss.IO_FLAG_MMAP if mmap else 0)
+
+def merge_results(results, k):
+    """Junta os top-k de cada shard (lista de (distâncias, ids)) no top-k global de cada consulta."""
+    distances = np.hstack([d for d, _ in results]).astype('float32')
+    ids = np.hstack([i for _, i in results]).astype('int64')
+    distances[ids < 0] = np.inf
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    merged_distances = np.take_along_axis(distances, order, axis=1)
+    merged_ids = np.take_along_axis(ids, order, axis=1)
+    merged_ids[~np.isfinite(merged_distances)] = -1
+    return merged_distances, merged_ids
+
+# Estado de um processo de shard (backend "process"): cada processo carrega apenas o seu shard
+_process_shard = None
+
+def _load_process_shard(path, mmap, nprobe, ef_search):
+    global _process_shard
+    _process_shard = read_shard(path, mmap)
+    set_search_params(_process_shard, nprobe=nprobe, ef_search=ef_search)
+
+def _process_shard_ntotal():
+    return int(_process_shard.ntotal)
+
+def _process_shard_search(queries, k, allowed_ids=None):
+    if allowed_ids is not None:
+        return filtered_search(_process_shard, queries, k, allowed_ids)
+    return _process_shard.search(queries, k)
+
+def _shard_search(shard, queries, k, allowed_ids):
+    if allowed_ids is not None:
+        return filtered_search(shard, queries, k, allowed_ids)
+    return shard.search(queries, k)
+
+def _process_shard_set_params(nprobe, ef_search):
+    set_search_params(_process_shard, nprobe=nprobe, ef_search=ef_search)
+
+class ShardedIndex:
+    """Busca scatter-gather sobre shards FAISS, com a mesma interface search/ntotal de um índice.
+
+    Com backend "thread", os shards ficam no processo atual e são consultados em paralelo (o FAISS
+    libera o GIL durante a busca). Com backend "process", cada shard vive num processo próprio e só
+    as consultas e os top-k trafegam entre processos. Os ids retornados são os ids estáveis dos chunks.
+    """
+
+    id_mapped = True
+
+    def __init__(self, shards_dir, backend="thread", mmap=False, nprobe=None, ef_search=None, max_workers=None):
+        if backend not in SHARD_BACKENDS:
+            raise ValueError(f"Backend de shards desconhecido: {backend}. Opções: {', '.join(SHARD_BACKENDS)}.")
+        manifest = read_manifest(shards_dir)
+        if manifest is None:
+            raise FileNotFoundError(f"Manifesto de shards não encontrado em {shards_dir}.")
+        self.shards_dir = shards_dir
+        self.backend = backend
+        self.n_shards = manifest["n_shards"]
+        paths = [shard_path(shards_dir, shard_no) for shard_no in range(self.n_shards)]
+        if backend == "thread":
+            self.shards = [read_shard(path, mmap) for path in paths]
+            for shard in self.shards:
+                set_search_params(shard, nprobe=nprobe, ef_search=ef_search)
+            self._executor = ThreadPoolExecutor(max_workers=max_workers or self.n_shards)
+            self._counts = [int(shard.ntotal) for shard in self.shards]
+        else:
+            self.shards = [
+                ProcessPoolExecutor(max_workers=1, initializer=_load_process_shard,
+                                    initargs=(path, mmap, nprobe, ef_search))
+                for path in paths
+            ]
+            self._executor = None
+            self._counts = [process.submit(_process_shard_ntotal).result() for process in self.shards]
+        self.d = None if backend == "process" else self.shards[0].d
+        logging.info(f"Índice particionado carregado: {self.n_shards} shards ({backend}), {self.ntotal} vetores.")
+
+    @property
+    def ntotal(self):
+        return sum(self._counts)
+
+    def search(self, queries, k, allowed_ids=None):
+        """Top-k global; com allowed_ids, cada shard recebe só os ids que lhe pertencem (id % n_shards)."""
+        queries = np.ascontiguousarray(queries, dtype='float32')
+        per_shard = [None] * self.n_shards
+        if allowed_ids is not None:
+            allowed_ids = np.asarray(allowed_ids, dtype='int64')
+            per_shard = [allowed_ids[rows] for rows in shard_rows(allowed_ids, self.n_shards)]
+        if self.backend == "thread":
+            futures = [self._executor.submit(_shard_search, shard, queries, k, ids)
+                       for shard, ids in zip(self.shards, per_shard)]
+        else:
+            futures = [process.submit(_process_shard_search, queries, k, ids)
+                       for process, ids in zip(self.shards, per_shard)]
+        return merge_results([future.result() for future in futures], k)
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        if self.backend == "thread":
+            for shard in self.shards:
+                set_search_params(shard, nprobe=nprobe, ef_search=ef_search)
+        else:
+            for process in self.shards:
+                process.submit(_process_shard_set_params, nprobe, ef_search).result()
+        return self
+
+    def close(self):
+        if self.backend == "process":
+            for process in self.shards:
+                process.shutdown(wait=False)
+        else:
+            self._executor.shutdown(wait=False)
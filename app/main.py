@@ -1,4 +1,5 @@
 import time
+import hmac
 from flask import Flask, render_template, request, jsonify, session
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy import inspect, text
@@ -8,6 +9,8 @@ import uuid
 from dotenv import load_dotenv
 from app.db import db, Conversa, MensagemX, MensagemY, Avaliacao, Proficiencia
 from app.models import modelo_x_response, modelo_y_response
+from app.recuperacao import get_engine, watch_versions
+from app.controle_taxa import rate_stats
 import pandas as pd
 from app.stats import calculate_statistics, FALLBACK_MSG
 # from app import create_app
@@ -21,6 +24,13 @@ if str(BASE_DIR) not in sys.path:
 
 import logging
 
+def admin_authorized():
+    """Confere o cabeçalho X-Admin-Token com ADMIN_TOKEN (em tempo constante); sem ADMIN_TOKEN, nega."""
+    admin_token = os.getenv('ADMIN_TOKEN')
+    if not admin_token:
+        return False
+    return hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token)
+
 def create_app():
     # Criar a instância do Flask dentro da função
     app = Flask(__name__)
@@ -62,6 +72,9 @@ def create_app():
             else:
                 print(f"Tabela {table} já existe no esquema ufchatbot.")
 
+    # Cada worker verifica periodicamente se há uma nova versão dos artefatos do RAG
+    watch_versions()
+
     # Definição das rotas
     @app.route('/')
     def index():
@@ -171,6 +184,22 @@ def create_app():
                                tabela_avaliacoes=stats.get('tabela_avaliacoes', FALLBACK_MSG),
                                teste_hipotese=stats.get('teste_hipotese', FALLBACK_MSG))
 
+    @app.route('/admin/reload', methods=['POST'])
+    def admin_reload():
+        # Recarrega os artefatos do RAG em segundo plano neste worker (os demais detectam a versão pelo watcher)
+        if not admin_authorized():
+            return jsonify({'error': 'Não autorizado.'}), 403
+        engine = get_engine()
+        engine.reload_in_background()
+        return jsonify({'status': 'Recarga iniciada', 'versao_atual': engine.version}), 202
+
+    @app.route('/admin/taxas')
+    def admin_taxas():
+        # Taxa atual, fila e contadores de cada controlador de taxa deste worker
+        if not admin_authorized():
+            return jsonify({'error': 'Não autorizado.'}), 403
+        return jsonify(rate_stats())
+
     @app.route('/sobre')
     def sobre():
         return render_template('sobre.html')
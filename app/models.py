@@ -1,11 +1,15 @@
 import requests
-import faiss
-import json
 import numpy as np
 import os
 import google.generativeai as genai
 from google.api_core import exceptions
 import logging
+from app.cache_embeddings import LRUEmbeddingCache, EmbeddingStore
+from app.cache_semantico import SemanticCache
+from app.recuperacao import get_engine
+from app.orcamento_prompt import build_prompt, PROMPT_TOKEN_BUDGET
+from app.controle_taxa import get_rate_controller
+from app.provedores_embedding import get_embedding_provider
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -20,51 +24,89 @@ GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 genai.configure(api_key=GEMINI_API_KEY)
 
 print(genai.__version__)
-# Carregar índice FAISS e chunks
-index_path = os.path.join(os.path.dirname(__file__), "rag_data", "index.faiss")
-index = faiss.read_index(index_path)
-with open("app/rag_data/chunks.json", "r", encoding="utf-8") as f:
-    chunks = json.load(f)
+# Índice FAISS e chunks ficam residentes no motor de recuperação (app.recuperacao.get_engine),
+# carregados uma única vez por processo na primeira consulta RAG.
 
 cache_x = {}
 cache_y = {}
 
+# Cache de embeddings de consultas: LRU em memória, opcionalmente persistido em SQLite
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "1024"))
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH")
+# Prazo da chamada de embedding; ao estourar, a busca RAG segue só com o índice lexical (BM25)
+EMBEDDING_TIMEOUT = float(os.getenv("EMBEDDING_TIMEOUT", "5"))
+# Prazo total (com novas tentativas em 429/5xx) de uma resposta do OpenRouter
+OPENROUTER_DEADLINE = float(os.getenv("OPENROUTER_DEADLINE", "30"))
+
+# Cache semântico para a primeira pergunta de cada conversa: paráfrases próximas reutilizam a resposta
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_MAX_DISTANCE = float(os.getenv("SEMANTIC_CACHE_MAX_DISTANCE", "0.1"))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 60 * 60)))
+semantic_cache_x = SemanticCache(SEMANTIC_CACHE_MAX_DISTANCE, SEMANTIC_CACHE_TTL, name="semantico_x")
+semantic_cache_y = SemanticCache(SEMANTIC_CACHE_MAX_DISTANCE, SEMANTIC_CACHE_TTL, name="semantico_y")
+# As respostas do Modelo Y dependem do corpus: descartá-las quando o motor recarregar os artefatos
+get_engine().add_reload_listener(semantic_cache_y.flush)
+get_engine().add_reload_listener(cache_y.clear)
+# Consultas usam o mesmo provedor de embeddings (EMBEDDING_PROVIDER) que gerou o índice
+embedding_provider = get_embedding_provider()
+query_embedding_cache = LRUEmbeddingCache(
+    maxsize=QUERY_EMBEDDING_CACHE_SIZE,
+    store=EmbeddingStore(QUERY_EMBEDDING_CACHE_PATH) if QUERY_EMBEDDING_CACHE_PATH else None,
+    namespace=embedding_provider.cache_namespace
+)
+
 def embed_query(query):
+    cached = query_embedding_cache.get(query)
+    if cached is not None:
+        return cached.reshape(1, -1)
     try:
-        response = genai.embed_content(
-            model="models/embedding-001",
-            content=query,
-            task_type="retrieval_document"
-        )
-        return np.array([response['embedding']], dtype='float32')
-    except exceptions.GoogleAPIError as e:
+        # Novas tentativas de provedores remotos ficam dentro do mesmo prazo da requisição
+        embedding = embedding_provider.embed([query], deadline=EMBEDDING_TIMEOUT).reshape(1, -1)
+        query_embedding_cache.put(query, embedding)
+        return embedding
+    except (exceptions.GoogleAPIError, TimeoutError) as e:
         logger.error(f"Erro ao gerar embedding: {e}")
-        return np.zeros((1, 768), dtype='float32')
-
-def generate_response(query, context_chunks=None):
-    if context_chunks:
-        context = " ".join(context_chunks)
-        prompt = f"""     
-            "Seu nome é Eniac Jr.\n"
-            "Você é um especialista em contratações públicas no Brasil bastante experiente, "
-            "especialmente treinado na lei 14.133/2021 e suas aplicações.\n"
-            "Responda a pergunta em português formal, claro e conciso, usando bulletpoints quando couber.\n"
-            "Elabore uma resposta que possua uma breve introdução e ao final indique como o usuário pode se aprofundar sobre sua dúvida ou problema.\n"
-            "Não responda sobre o tipo de modelo de LLM você é ou quais tecnologias está usando.\n"
-            "Não responda sobre outros assuntos que não envolvam, direta ou indiretamente, contratações públicas no Brasil."
-            Forneça uma resposta curta à consulta: {query}\nContexto fornecido: {context}"
-            """
-    else:
-        prompt = f"""
-            "Seu nome é Eniac Jr.\n"
-            "Você é um especialista em contratações públicas no Brasil bastante experiente, "
-            "especialmente treinado na lei 14.133/2021 e suas aplicações.\n"
-            "Responda a pergunta em português formal, claro e conciso, usando bulletpoints quando couber.\n"
-            "Elabore uma resposta que possua uma breve introdução e ao final indique como o usuário pode se aprofundar sobre sua dúvida ou problema.\n"
-            "Não responda sobre o tipo de modelo de LLM você é ou quais tecnologias está usando.\n"
-            "Não responda sobre outros assuntos que não envolvam, direta ou indiretamente, contratações públicas no Brasil."
-            Forneça uma resposta curta à consulta: {query}"
-            """
+        return np.zeros((1, embedding_provider.dimension), dtype='float32')
+
+def embed_queries(queries):
+    """Gera embeddings para várias consultas numa única chamada ao provedor, retornando uma matriz (N, d).
+
+    Consultas já presentes no cache não são reenviadas ao provedor.
+    """
+    if not queries:
+        return np.zeros((0, embedding_provider.dimension), dtype='float32')
+    cached = [query_embedding_cache.get(query) for query in queries]
+    missing = [i for i, vector in enumerate(cached) if vector is None]
+    if missing:
+        try:
+            vectors = embedding_provider.embed([queries[i] for i in missing], deadline=EMBEDDING_TIMEOUT)
+        except (exceptions.GoogleAPIError, TimeoutError) as e:
+            logger.error(f"Erro ao gerar embeddings em lote: {e}")
+            vectors = np.zeros((len(missing), embedding_provider.dimension), dtype='float32')
+        else:
+            for i, vector in zip(missing, vectors):
+                query_embedding_cache.put(queries[i], vector)
+        for i, vector in zip(missing, vectors):
+            cached[i] = vector
+    return np.vstack([np.asarray(vector, dtype='float32').reshape(1, -1) for vector in cached])
+
+SYSTEM_INSTRUCTIONS = (
+    "Seu nome é Eniac Jr.\n"
+    "Você é um especialista em contratações públicas no Brasil bastante experiente, "
+    "especialmente treinado na lei 14.133/2021 e suas aplicações.\n"
+    "Responda a pergunta em português formal, claro e conciso, usando bulletpoints quando couber.\n"
+    "Elabore uma resposta que possua uma breve introdução e ao final indique como o usuário pode se aprofundar sobre sua dúvida ou problema.\n"
+    "Não responda sobre o tipo de modelo de LLM você é ou quais tecnologias está usando.\n"
+    "Não responda sobre outros assuntos que não envolvam, direta ou indiretamente, contratações públicas no Brasil."
+)
+
+def _history_turns(historico, model_name):
+    return [("Usuário" if msg['remetente'] == 'user' else model_name, msg['conteudo']) for msg in historico]
+
+def generate_response(query, context_chunks=None, historico=(), model_name="Modelo", budget=PROMPT_TOKEN_BUDGET):
+    """Gera a resposta do LLM com um prompt limitado a budget tokens (ver app.orcamento_prompt)."""
+    prompt = build_prompt(SYSTEM_INSTRUCTIONS, query, context_chunks or (),
+                          _history_turns(historico, model_name), budget).text
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json"
@@ -73,13 +115,22 @@ def generate_response(query, context_chunks=None):
         "model": MODEL,
         "messages": [{"role": "user", "content": prompt}]
     }
-    try:
+    controller = get_rate_controller("openrouter")
+
+    def post():
         response = requests.post(OPENROUTER_API_URL, headers=headers, json=payload, timeout=10)
         response.raise_for_status()
-        response_json = response.json()
+        return response.json()
+
+    try:
+        # 429 e 5xx são repetidos pelo controlador de taxa, com backoff, até OPENROUTER_DEADLINE segundos
+        response_json = controller.call(post, deadline=OPENROUTER_DEADLINE)
         if 'error' in response_json:
             error_msg = response_json['error']
             if isinstance(error_msg, dict):
+                if error_msg.get('code') == 429:
+                    # Cota diária esgotada vem com status 200: não adianta repetir, mas a taxa deve cair
+                    controller.throttled()
                 error_msg = error_msg.get('message', 'Erro desconhecido')
             return f"Erro: {error_msg}"
         if 'choices' in response_json:
@@ -91,40 +142,37 @@ def generate_response(query, context_chunks=None):
         else:
             return "Erro: Resposta da API em formato inesperado."
     except Exception as e:
-        if "timed out" in str(e).lower():
+        logger.error(f"Erro ao chamar OpenRouter: {e} ({controller.stats()})")
+        message = str(e).lower()
+        if isinstance(e, (requests.Timeout, TimeoutError)) or "timeout" in message or "timed out" in message:
             return "Erro: Request timeout"
-        try:
-            fallback_payload = {
-                "model": MODEL,
-                "messages": [{"role": "user", "content": prompt}]
-            }
-            fallback_response = requests.post(OPENROUTER_API_URL, headers=headers, json=fallback_payload, timeout=10)
-            fallback_response.raise_for_status()
-            fallback_json = fallback_response.json()
-            if 'choices' in fallback_json:
-                return fallback_json["choices"][0]["message"]["content"]
-            else:
-                return "Resposta padrão: modelo indisponível no momento."
-        except Exception:
-            return "Resposta padrão: modelo indisponível no momento."
+        return "Resposta padrão: modelo indisponível no momento."
         
+def _semantic_key(query, historico):
+    """Embedding usado no cache semântico; só perguntas de abertura (sem histórico) participam."""
+    if historico or not SEMANTIC_CACHE_ENABLED:
+        return None
+    query_embedding = embed_query(query)
+    return query_embedding if np.any(query_embedding) else None
+
+def _is_cacheable(resposta):
+    return not resposta.startswith(("Erro", "Resposta padrão"))
+
 def modelo_x_response(query, historico):
     # Cria uma chave única com base no query e no histórico
     key = (query, tuple((msg['remetente'], msg['conteudo']) for msg in historico))
     if key in cache_x:
         return cache_x[key]
+    semantic_key = _semantic_key(query, historico)
+    if semantic_key is not None:
+        cached = semantic_cache_x.get(semantic_key)
+        if cached is not None:
+            return cached
     
-    # Constrói o prompt com histórico
-    prompt = ""
-    for msg in historico:
-        if msg['remetente'] == 'user':
-            prompt += f"Usuário: {msg['conteudo']}\n"
-        else:
-            prompt += f"Modelo X: {msg['conteudo']}\n"
-    prompt += f"Usuário: {query}\nModelo X: "
-    
-    resposta = generate_response(prompt)
+    resposta = generate_response(query, historico=historico, model_name="Modelo X")
     cache_x[key] = resposta
+    if semantic_key is not None and _is_cacheable(resposta):
+        semantic_cache_x.put(semantic_key, resposta)
     return resposta
 
 def modelo_y_response(query, historico):
@@ -133,16 +181,15 @@ def modelo_y_response(query, historico):
     key = (query, tuple((msg['remetente'], msg['conteudo']) for msg in historico))
     if key in cache_y:
         return cache_y[key]
+    semantic_key = _semantic_key(query, historico)
+    if semantic_key is not None:
+        cached = semantic_cache_y.get(semantic_key)
+        if cached is not None:
+            return cached
     
     context_chunks = search_chunks(query)
-    prompt = "Contexto: " + " ".join(context_chunks) + "\n"
-    for msg in historico:
-        if msg['remetente'] == 'user':
-            prompt += f"Usuário: {msg['conteudo']}\n"
-        else:
-            prompt += f"Modelo Y: {msg['conteudo']}\n"
-    prompt += f"Usuário: {query}\nModelo Y: "
-    
-    resposta = generate_response(prompt)
+    resposta = generate_response(query, context_chunks, historico, model_name="Modelo Y")
     cache_y[key] = resposta
+    if semantic_key is not None and _is_cacheable(resposta):
+        semantic_cache_y.put(semantic_key, resposta)
     return resposta
\ No newline at end of file
@@ -0,0 +1,83 @@
+import os
+import time
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from pdf2image import convert_from_path
+import pytesseract
+
+# OCR das páginas escaneadas de um PDF: as páginas são rasterizadas de uma vez (uma chamada ao
+# pdftoppm por sequência contígua de páginas, direto para arquivos temporários) e o OCR de cada
+# página roda em paralelo. Cada chamada ao pytesseract executa um processo tesseract próprio, então
+# threads bastam para ocupar vários núcleos, inclusive dentro dos workers do Pool da extração
+# (processos daemon, que não podem criar um pool de processos).
+TESSERACT_LANG = 'por'
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_GRAYSCALE = os.getenv("OCR_GRAYSCALE", "true").lower() == "true"
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", "4"))
+
+# O paralelismo vem das páginas: cada processo tesseract fica com uma thread
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+def page_runs(page_numbers):
+    """Agrupa números de página (base 0) em sequências contíguas [(primeira, última)]."""
+    runs = []
+    for page in sorted(set(page_numbers)):
+        if runs and page == runs[-1][1] + 1:
+            runs[-1] = (runs[-1][0], page)
+        else:
+            runs.append((page, page))
+    return runs
+
+def rasterize_pages(file_path, page_numbers, output_dir, dpi=OCR_DPI, grayscale=OCR_GRAYSCALE, workers=OCR_WORKERS):
+    """Rasteriza as páginas (base 0) em arquivos de output_dir; retorna {página: caminho da imagem}."""
+    paths = {}
+    for first, last in page_runs(page_numbers):
+        files = convert_from_path(
+            file_path, dpi=dpi, grayscale=grayscale, first_page=first + 1, last_page=last + 1,
+            output_folder=output_dir, paths_only=True, thread_count=max(1, min(workers, last - first + 1))
+        )
+        paths.update(zip(range(first, last + 1), files))
+    return paths
+
+def ocr_image(path, lang=TESSERACT_LANG):
+    """Texto da imagem e o tempo (segundos) gasto no OCR."""
+    start = time.perf_counter()
+    text = pytesseract.image_to_string(path, lang=lang)
+    return text + "\n", time.perf_counter() - start
+
+def ocr_pdf_pages(file_path, page_numbers, dpi=OCR_DPI, grayscale=OCR_GRAYSCALE, workers=OCR_WORKERS,
+                  lang=TESSERACT_LANG):
+    """OCR das páginas (base 0) do PDF; retorna ({página: texto}, {página: segundos de OCR}).
+
+    Páginas que falharem ficam com texto vazio. O tempo de cada página e o resumo do arquivo vão para o log.
+    """
+    page_numbers = sorted(set(page_numbers))
+    texts, timings = {page: "" for page in page_numbers}, {}
+    if not page_numbers:
+        return texts, timings
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix="ocr_") as output_dir:
+        try:
+            paths = rasterize_pages(file_path, page_numbers, output_dir, dpi, grayscale, workers)
+        except Exception as e:
+            logging.error(f"Erro ao rasterizar {len(page_numbers)} páginas de {file_path}: {e}")
+            return texts, timings
+        raster_seconds = time.perf_counter() - start
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths))), thread_name_prefix="ocr") as executor:
+            futures = {page: executor.submit(ocr_image, path, lang) for page, path in paths.items()}
+            for page, future in futures.items():
+                try:
+                    texts[page], timings[page] = future.result()
+                except Exception as e:
+                    logging.error(f"Erro ao aplicar OCR na página {page + 1} de {file_path}: {e}")
+    for page, seconds in sorted(timings.items()):
+        logging.info(f"OCR de {file_path}, página {page + 1}: {seconds:.2f}s.")
+    if timings:
+        logging.info(
+            f"OCR de {file_path}: {len(timings)} de {len(page_numbers)} páginas em "
+            f"{time.perf_counter() - start:.2f}s (rasterização {raster_seconds:.2f}s a {dpi} dpi, "
+            f"média {sum(timings.values()) / len(timings):.2f}s e máximo {max(timings.values()):.2f}s por página, "
+            f"{workers} em paralelo)."
+        )
+    return texts, timings
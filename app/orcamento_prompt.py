@@ -0,0 +1,87 @@
+import os
+import re
+import logging
+from collections import namedtuple
+
+# Orçamento de tokens do prompt enviado ao LLM. As partes entram por prioridade: instruções do
+# sistema, consulta atual, chunks mais relevantes (na ordem do ranking) e turnos mais recentes
+# do histórico; o que não couber é descartado e registrado em truncated.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Estimativa conservadora para tokenizadores de subpalavras: palavras longas contam um token a cada
+# 6 caracteres, e cada pontuação conta como um token
+TOKEN_PATTERN = re.compile(r"\w{1,6}|[^\w\s]")
+
+CONTEXT_HEADER = "Contexto fornecido:"
+HISTORY_HEADER = "Histórico da conversa:"
+QUERY_PREFIX = "Forneça uma resposta curta à consulta: "
+
+# text é o prompt final e tokens a sua contagem estimada. truncated informa quantos chunks e
+# turnos ficaram de fora e se a consulta foi cortada.
+Prompt = namedtuple("Prompt", ["text", "tokens", "truncated"])
+
+def count_tokens(text):
+    return len(TOKEN_PATTERN.findall(text))
+
+def truncate_to_tokens(text, max_tokens):
+    """Mantém o início do texto com no máximo max_tokens tokens."""
+    if max_tokens <= 0:
+        return ""
+    for i, match in enumerate(TOKEN_PATTERN.finditer(text)):
+        if i == max_tokens:
+            return text[:match.start()].rstrip()
+    return text
+
+def build_prompt(instructions, query, chunks=(), history=(), budget=PROMPT_TOKEN_BUDGET):
+    """Monta o prompt dentro de budget tokens.
+
+    chunks vêm em ordem de relevância e history é uma lista de (remetente, texto) em ordem
+    cronológica. Instruções entram sempre; a consulta é cortada se sozinha estourar o orçamento.
+    Chunks que não cabem são pulados (um menor, adiante, ainda pode entrar) e o histórico é
+    preenchido do turno mais recente para o mais antigo, parando no primeiro que não couber.
+    """
+    remaining = budget - count_tokens(instructions)
+    query_tokens = count_tokens(QUERY_PREFIX + query)
+    query_truncated = query_tokens > remaining
+    if query_truncated:
+        query = truncate_to_tokens(query, remaining - count_tokens(QUERY_PREFIX))
+        query_tokens = count_tokens(QUERY_PREFIX + query)
+    remaining -= query_tokens
+
+    selected_chunks = []
+    if chunks:
+        remaining -= count_tokens(CONTEXT_HEADER)
+        for chunk in chunks:
+            tokens = count_tokens(chunk)
+            if tokens <= remaining:
+                selected_chunks.append(chunk)
+                remaining -= tokens
+        if not selected_chunks:
+            remaining += count_tokens(CONTEXT_HEADER)
+
+    selected_turns = []
+    if history:
+        remaining -= count_tokens(HISTORY_HEADER)
+        for speaker, text in reversed(history):
+            tokens = count_tokens(f"{speaker}: {text}")
+            if tokens > remaining:
+                break
+            selected_turns.append(f"{speaker}: {text}")
+            remaining -= tokens
+        selected_turns.reverse()
+
+    parts = [instructions]
+    if selected_chunks:
+        parts.append(CONTEXT_HEADER + "\n" + "\n".join(selected_chunks))
+    if selected_turns:
+        parts.append(HISTORY_HEADER + "\n" + "\n".join(selected_turns))
+    parts.append(QUERY_PREFIX + query)
+    text = "\n\n".join(parts)
+    truncated = {
+        "chunks_dropped": len(chunks) - len(selected_chunks),
+        "turns_dropped": len(history) - len(selected_turns),
+        "query_truncated": query_truncated,
+    }
+    tokens = count_tokens(text)
+    if any(truncated.values()):
+        logging.info(f"Prompt limitado a {budget} tokens ({tokens} usados): {truncated}")
+    return Prompt(text, tokens, truncated)
@@ -0,0 +1,218 @@
+import os
+import re
+import hashlib
+import logging
+import threading
+import unicodedata
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import google.generativeai as genai
+from app.controle_taxa import get_rate_controller
+
+# Limites de lote do provedor: a API de embeddings do Gemini aceita até 100 textos por requisição
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_BATCH_MAX_CHARS = int(os.getenv("EMBEDDING_BATCH_MAX_CHARS", "200000"))
+# Lotes em voo ao mesmo tempo: o trabalho é só espera de rede, então threads bastam
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "8"))
+GEMINI_EMBEDDING_MODEL = "models/embedding-001"
+# Provedor usado pelo gerador e pelas consultas (os dois precisam concordar): gemini (API), hashing
+# (local e determinístico, sem rede: testes e desenvolvimento offline) ou onnx (modelo local em CPU)
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "gemini")
+# Dimensão dos vetores do provedor hashing
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", "768"))
+# Diretório com model.onnx e tokenizer.json do provedor onnx (ex.: um multilingual-e5-small quantizado)
+EMBEDDING_ONNX_MODEL = os.getenv("EMBEDDING_ONNX_MODEL", "")
+EMBEDDING_ONNX_THREADS = int(os.getenv("EMBEDDING_ONNX_THREADS", "0"))
+
+class EmbeddingProvider:
+    """Interface dos provedores de embeddings usados pelo gerador e pelas consultas.
+
+    embed(texts, deadline=None) recebe um lote e retorna uma matriz (len(texts), dimension) na mesma
+    ordem; deadline (segundos) limita a espera de provedores remotos. max_batch_size e max_batch_chars
+    limitam o tamanho de cada lote. cache_namespace separa, nos caches, vetores de provedores diferentes.
+    """
+
+    name = "base"
+    dimension = 768
+    max_batch_size = 1
+    max_batch_chars = None
+
+    @property
+    def cache_namespace(self):
+        return f"{self.name}-{self.dimension}"
+
+    def embed(self, texts, deadline=None):
+        raise NotImplementedError
+
+class GeminiEmbeddingProvider(EmbeddingProvider):
+    """Embeddings da API Gemini, com vários textos por requisição (embed_content com lista)."""
+
+    name = "gemini"
+    # Chaves sem prefixo: mantém válidos os caches gravados antes dos demais provedores
+    cache_namespace = ""
+
+    def __init__(self, model=GEMINI_EMBEDDING_MODEL, task_type="retrieval_document",
+                 max_batch_size=EMBEDDING_BATCH_SIZE, max_batch_chars=EMBEDDING_BATCH_MAX_CHARS, api_key=None):
+        api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if api_key:
+            genai.configure(api_key=api_key)
+        self.model = model
+        self.task_type = task_type
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+
+    def embed(self, texts, deadline=None):
+        # O controlador de taxa do Gemini é compartilhado entre gerador e consultas do app neste processo;
+        # as novas tentativas ficam sempre com ele, e não com o retry padrão do cliente da API
+        request_options = {"retry": None}
+        if deadline is not None:
+            request_options["timeout"] = deadline
+        response = get_rate_controller("gemini").call(
+            genai.embed_content, model=self.model, content=list(texts), task_type=self.task_type,
+            deadline=deadline, request_options=request_options
+        )
+        return np.array(response['embedding'], dtype='float32').reshape(len(texts), -1)
+
+def hashing_features(text):
+    """Palavras e bigramas de palavras do texto, em minúsculas e sem acentos."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    words = re.findall(r"\w+", "".join(c for c in text if not unicodedata.combining(c)))
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+class HashingEmbeddingProvider(EmbeddingProvider):
+    """Embeddings locais por feature hashing (com sinal) de palavras e bigramas, normalizados.
+
+    Determinístico entre processos e máquinas, sem rede nem modelo: permite rodar gerador, testes e
+    consultas offline. Mede sobreposição lexical, não semântica.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dimension=EMBEDDING_DIMENSION, max_batch_size=1000):
+        self.dimension = dimension
+        self.max_batch_size = max_batch_size
+
+    def embed(self, texts, deadline=None):
+        vectors = np.zeros((len(texts), self.dimension), dtype='float32')
+        for row, text in enumerate(texts):
+            features = hashing_features(text)
+            if not features:
+                continue
+            # blake2b em vez de hash(): o valor não pode mudar entre processos
+            values = np.array([int.from_bytes(hashlib.blake2b(f.encode('utf-8'), digest_size=8).digest(), "little")
+                               for f in features], dtype='uint64')
+            signs = np.where(values >> np.uint64(63), 1.0, -1.0).astype('float32')
+            np.add.at(vectors[row], (values % np.uint64(self.dimension)).astype('int64'), signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+class OnnxEmbeddingProvider(EmbeddingProvider):
+    """Modelo de sentence embeddings exportado para ONNX, executado em CPU com onnxruntime.
+
+    model_dir contém model.onnx e tokenizer.json (biblioteca tokenizers). O vetor é a média dos
+    estados da última camada sobre os tokens válidos, normalizada. onnxruntime e tokenizers são
+    dependências opcionais, importadas só quando este provedor é usado.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_dir=EMBEDDING_ONNX_MODEL, max_batch_size=32, max_length=512,
+                 threads=EMBEDDING_ONNX_THREADS):
+        import onnxruntime
+        from tokenizers import Tokenizer
+        if not model_dir:
+            raise ValueError("EMBEDDING_ONNX_MODEL não definido para o provedor onnx.")
+        self.model_dir = model_dir
+        self.max_batch_size = max_batch_size
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(
+            os.path.join(model_dir, "model.onnx"), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length)
+        self.tokenizer.enable_padding()
+        self.dimension = int(self.embed(["dimensão"]).shape[1])
+
+    @property
+    def cache_namespace(self):
+        return f"onnx-{os.path.basename(os.path.normpath(self.model_dir))}"
+
+    def embed(self, texts, deadline=None):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype='int64'),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype='int64'),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype='int64'),
+        }
+        hidden = self.session.run(None, {name: value for name, value in inputs.items() if name in self.input_names})[0]
+        mask = inputs["attention_mask"][:, :, None].astype('float32')
+        vectors = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1.0)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        return vectors.astype('float32')
+
+PROVIDERS = {
+    "gemini": GeminiEmbeddingProvider,
+    "hashing": HashingEmbeddingProvider,
+    "onnx": OnnxEmbeddingProvider,
+}
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+def get_embedding_provider(name=None):
+    """Provedor configurado (EMBEDDING_PROVIDER), criado uma vez por processo e compartilhado entre threads."""
+    name = name or EMBEDDING_PROVIDER
+    if name not in PROVIDERS:
+        raise ValueError(f"Provedor de embeddings desconhecido: {name}. Opções: {', '.join(PROVIDERS)}.")
+    with _providers_lock:
+        if name not in _providers:
+            _providers[name] = PROVIDERS[name]()
+        return _providers[name]
+
+def batches(texts, max_batch_size, max_batch_chars=None):
+    """Divide as posições de texts em lotes consecutivos dentro dos limites (um texto maior que o limite vai sozinho)."""
+    batch, chars = [], 0
+    for position, text in enumerate(texts):
+        too_long = max_batch_chars is not None and batch and chars + len(text) > max_batch_chars
+        if len(batch) >= max_batch_size or too_long:
+            yield batch
+            batch, chars = [], 0
+        batch.append(position)
+        chars += len(text)
+    if batch:
+        yield batch
+
+def _embed_batch(provider, texts, positions):
+    try:
+        return positions, provider.embed([texts[i] for i in positions])
+    except Exception as e:
+        logging.error(f"Erro ao gerar embeddings de um lote de {len(positions)} textos ({provider.name}): {e}")
+        return positions, e
+
+def embed_in_batches(texts, provider, concurrency=EMBEDDING_CONCURRENCY, max_batch_size=None):
+    """Embeda texts em lotes do provedor, com até concurrency lotes em voo, gerando
+    (posições, embeddings ou exceção) à medida que cada lote termina.
+
+    max_batch_size, se informado, reduz o tamanho dos lotes (ex.: 1 para isolar textos que falharam).
+
+    Os lotes são montados sob demanda (no máximo 2 * concurrency aguardando), então a memória não
+    cresce com o corpus. Um lote que falha não interrompe os demais: o chamador decide o que fazer
+    com as posições dele.
+    """
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1), thread_name_prefix="embedding") as executor:
+        in_flight = set()
+        batch_size = min(max_batch_size or provider.max_batch_size, provider.max_batch_size)
+        for positions in batches(texts, batch_size, provider.max_batch_chars):
+            if len(in_flight) >= 2 * max(concurrency, 1):
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            in_flight.add(executor.submit(_embed_batch, provider, texts, positions))
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
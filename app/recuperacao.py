@@ -1,11 +1,22 @@
 import os
 import numpy as np
 import faiss
-import google.generativeai as genai
 import json
 import requests
 import logging
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
 from google.api_core import exceptions
+from app.indice_faiss import set_search_params, rescore, filtered_search
+from app.chunk_store import read_chunks, store_path_for, read_chunk_sources, read_chunk_metadata
+from app.filtros_metadados import ChunkMetadata
+from app.bm25 import BM25Index, reciprocal_rank_fusion
+from app.rerank import rerank
+from app.indice_incremental import CHUNK_IDS_FILE, IdTranslator, is_id_mapped
+from app.indice_sharded import ShardedIndex, shards_dir_for, read_manifest
+from app.versoes_artefatos import current_version, resolve_data_dir, verify_version, VersionWatcher
+from app.provedores_embedding import EMBEDDING_PROVIDER, get_embedding_provider
 
 # Configurar variáveis de ambiente para silenciar logs do gRPC
 os.environ["GRPC_VERBOSITY"] = "ERROR"  # Define o nível de log do gRPC para ERROR
@@ -19,16 +30,28 @@ EMBEDDED_DIR = "rag_data"
 INDEX_PATH = os.path.join(EMBEDDED_DIR, "index.faiss")
 EMBEDDINGS_PATH = os.path.join(EMBEDDED_DIR, "embeddings.npy")
 CHUNKS_JSON = os.path.join(EMBEDDED_DIR, "chunks.json")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_MODEL = "google/gemini-2.0-flash-lite-preview-02-05:free"
 GEMINI_EMBEDDING_MODEL_NAME = "models/embedding-001"
-
-def configure_gemini():
-    if not GEMINI_API_KEY:
-        raise ValueError("A variável GEMINI_API_KEY não está definida.")
-    genai.configure(api_key=GEMINI_API_KEY)
-    logging.info("Usando Gemini API para query embeddings.")
+FAISS_NPROBE = os.getenv("FAISS_NPROBE")
+FAISS_EF_SEARCH = os.getenv("FAISS_EF_SEARCH")
+# Com índice comprimido (sq8/pq), busca top_k * fator candidatos e os reordena pela distância exata
+FAISS_RESCORE_FACTOR = int(os.getenv("FAISS_RESCORE_FACTOR", "0"))
+# Funde a busca vetorial com a lexical (BM25) quando bm25.npz existir; sem isso, o BM25 só é usado como fallback
+RAG_HYBRID = os.getenv("RAG_HYBRID", "true").lower() == "true"
+# Re-ranqueamento pós-busca (MMR + remoção de quase-duplicatas e sobreposições) e tamanho final do contexto
+RAG_RERANK = os.getenv("RAG_RERANK", "true").lower() == "true"
+RAG_CONTEXT_K = int(os.getenv("RAG_CONTEXT_K", "5"))
+# Índice particionado (index_shards/): shards consultados em threads ("thread") ou em processos próprios ("process")
+FAISS_SHARD_BACKEND = os.getenv("FAISS_SHARD_BACKEND", "thread")
+# Lê o índice via mmap, sem copiá-lo para a memória do processo (page cache compartilhado entre workers)
+FAISS_MMAP = os.getenv("FAISS_MMAP", "").lower() == "true"
+# Intervalo (segundos) da verificação de novas versões de artefatos em rag_data/CURRENT; 0 desativa
+RAG_VERSION_WATCH_INTERVAL = float(os.getenv("RAG_VERSION_WATCH_INTERVAL", "30"))
+# Buscas filtradas com até esse número de chunks permitidos são exatas sobre embeddings.npy;
+# acima disso, o filtro é aplicado dentro do índice FAISS (IDSelector)
+RAG_FILTER_EXACT_MAX = int(os.getenv("RAG_FILTER_EXACT_MAX", "20000"))
+RAG_DATA_DIR = os.getenv("RAG_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rag_data"))
 
 def load_chunks():
     if not os.path.exists(CHUNKS_JSON):
@@ -50,15 +73,9 @@ def get_query_embedding(query, embeddings=None):
     if embeddings is not None:
         logging.info("Usando embedding mockado para teste (primeiro embedding).")
         return embeddings[0:1]
-    configure_gemini()
+    # A configuração da API (quando o provedor é o Gemini) fica com o próprio provedor
     try:
-        response = genai.embed_content(
-            model=GEMINI_EMBEDDING_MODEL_NAME,
-            content=query,
-            task_type="retrieval_document",
-            title="Query Embedding"
-        )
-        return np.array([response['embedding']], dtype='float32')
+        return get_embedding_provider().embed([query])
     except exceptions.GoogleAPIError as e:
         logging.error(f"Erro na API Gemini: {e}")
         raise
@@ -81,16 +98,340 @@ def search(query, index, texts, embeddings=None, top_k=10):
         logging.error(f"Erro na busca FAISS: {e}")
         raise
 
-def search_chunks(query, top_k=10, threshold=0.5):
-    index = faiss.read_index("app/rag_data/index.faiss")
-    with open("app/rag_data/chunks.json", "r", encoding="utf-8") as f:
-        chunks = json.load(f)
-    from models import embed_query
+# Artefatos de uma versão do corpus; vectors é o memmap de embeddings.npy (com re-score ou re-ranqueamento)
+# e lexical o índice BM25 (None se bm25.npz não foi gerado). id_map traduz os ids estáveis de um índice
+# IndexIDMap2 (atualizado incrementalmente) em posições dos chunks; None quando o índice já usa posições.
+# version é o nome do diretório versionado de origem (None no layout sem versões) e metadata os
+# metadados dos chunks (origem, página, artigos) usados nos filtros; None sem chunks.meta.json/sources.
+Artifacts = namedtuple("Artifacts", ["index", "chunks", "vectors", "lexical", "id_map", "version", "metadata"],
+                       defaults=[None, None, None])
+
+def close_artifacts(artifacts):
+    """Libera recursos que não dependem do coletor de lixo (mmap do chunk store, processos de shards)."""
+    for resource in (artifacts.index, artifacts.chunks):
+        if hasattr(resource, "close"):
+            resource.close()
+
+class RetrievalEngine:
+    """Mantém o índice FAISS e os chunks residentes em memória, carregados uma única vez por processo.
+
+    Com diretórios versionados (app.versoes_artefatos), uma nova versão é carregada em segundo
+    plano e trocada atomicamente: buscas em andamento terminam com a versão anterior, que só é
+    liberada quando a última delas a devolve.
+    """
+
+    def __init__(self, data_dir=RAG_DATA_DIR, nprobe=FAISS_NPROBE, ef_search=FAISS_EF_SEARCH,
+                 rescore_factor=FAISS_RESCORE_FACTOR, hybrid=RAG_HYBRID, rerank=RAG_RERANK,
+                 context_k=RAG_CONTEXT_K, shard_backend=FAISS_SHARD_BACKEND, mmap=FAISS_MMAP,
+                 filter_exact_max=RAG_FILTER_EXACT_MAX):
+        self.data_dir = data_dir
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.rescore_factor = rescore_factor
+        self.hybrid = hybrid
+        self.rerank = rerank
+        self.context_k = context_k
+        self.shard_backend = shard_backend
+        self.mmap = mmap
+        self.filter_exact_max = filter_exact_max
+        # Índice e chunks são trocados juntos, numa única atribuição, para que
+        # uma busca concorrente nunca combine artefatos de versões diferentes.
+        self._artifacts = None
+        self._lock = threading.Lock()
+        self._reload_listeners = []
+        # Buscas em andamento por versão (id dos artefatos) e versões substituídas ainda em uso
+        self._leases = {}
+        self._retired = {}
+        self._lease_lock = threading.Lock()
+        self._watcher = None
+
+    @property
+    def loaded(self):
+        return self._artifacts is not None
+
+    @property
+    def version(self):
+        return self._artifacts.version if self._artifacts is not None else None
+
+    @property
+    def index(self):
+        return self.artifacts().index
+
+    @property
+    def chunks(self):
+        return self.artifacts().chunks
+
+    def _read_index(self, directory):
+        """Índice particionado quando houver manifesto de shards; senão, o index.faiss único."""
+        shards_dir = shards_dir_for(directory)
+        if read_manifest(shards_dir) is not None:
+            return ShardedIndex(shards_dir, self.shard_backend, self.mmap, self.nprobe, self.ef_search)
+        index = faiss.read_index(os.path.join(directory, "index.faiss"), faiss.IO_FLAG_MMAP if self.mmap else 0)
+        set_search_params(index, nprobe=self.nprobe, ef_search=self.ef_search)
+        return index
+
+    def _load_artifacts(self):
+        version = current_version(self.data_dir)
+        directory = resolve_data_dir(self.data_dir)
+        if version is not None:
+            # Recusa versões incompletas antes de trocar os artefatos em uso
+            manifest = verify_version(directory)
+            provider = manifest.get("embedding_provider")
+            if provider is not None and provider != EMBEDDING_PROVIDER:
+                logging.error(f"Versão {version} indexada com embeddings {provider}, mas as consultas usam "
+                              f"{EMBEDDING_PROVIDER}: ajuste EMBEDDING_PROVIDER ou gere o índice novamente.")
+        index_path = os.path.join(directory, "index.faiss")
+        chunks_json = os.path.join(directory, "chunks.json")
+        embeddings_path = os.path.join(directory, "embeddings.npy")
+        bm25_path = os.path.join(directory, "bm25.npz")
+        chunk_ids_path = os.path.join(directory, CHUNK_IDS_FILE)
+        if not os.path.exists(index_path) and read_manifest(shards_dir_for(directory)) is None:
+            raise FileNotFoundError(f"Arquivo {index_path} não encontrado.")
+        # O chunk store binário (mmap) tem prioridade sobre o chunks.json quando existir
+        chunks_path = store_path_for(chunks_json) if os.path.exists(store_path_for(chunks_json)) else chunks_json
+        if not os.path.exists(chunks_path):
+            raise FileNotFoundError(f"Arquivo {chunks_json} não encontrado.")
+        index = self._read_index(directory)
+        chunks = read_chunks(chunks_path)
+        if index.ntotal != len(chunks):
+            logging.warning(f"Inconsistência: índice com {index.ntotal} vetores para {len(chunks)} chunks.")
+        sources = read_chunk_sources(chunks_json, len(chunks))
+        records = read_chunk_metadata(chunks_json, len(chunks))
+        metadata = ChunkMetadata(sources, records, len(chunks)) if sources or records else None
+        vectors = None
+        if self.rescore_factor > 1 or self.rerank or metadata is not None:
+            if os.path.exists(embeddings_path):
+                # mmap: re-score e re-ranqueamento leem só as linhas candidatas, sem trazer a matriz inteira para a RAM
+                vectors = np.load(embeddings_path, mmap_mode='r')
+            else:
+                logging.warning(f"{embeddings_path} não encontrado: re-score e MMR desativados.")
+        lexical = BM25Index.load(bm25_path) if os.path.exists(bm25_path) else None
+        id_map = None
+        if is_id_mapped(index):
+            if not os.path.exists(chunk_ids_path):
+                raise FileNotFoundError(f"Arquivo {chunk_ids_path} não encontrado (necessário para índice com ids).")
+            id_map = IdTranslator(np.load(chunk_ids_path))
+            if len(id_map) != len(chunks):
+                logging.warning(f"Inconsistência: {len(id_map)} ids para {len(chunks)} chunks.")
+        return Artifacts(index, chunks, vectors, lexical, id_map, version, metadata)
+
+    def artifacts(self):
+        """Retorna os artefatos residentes, carregando-os do disco apenas na primeira chamada."""
+        artifacts = self._artifacts
+        if artifacts is not None:
+            return artifacts
+        with self._lock:
+            if self._artifacts is None:
+                self._artifacts = self._load_artifacts()
+                logging.info(f"Motor de recuperação carregado: {self._artifacts.index.ntotal} vetores.")
+            return self._artifacts
+
+    @contextmanager
+    def using(self):
+        """Empresta os artefatos atuais durante uma busca; uma troca de versão não os libera antes do fim dela."""
+        self.artifacts()
+        with self._lease_lock:
+            artifacts = self._artifacts
+            self._leases[id(artifacts)] = self._leases.get(id(artifacts), 0) + 1
+        try:
+            yield artifacts
+        finally:
+            with self._lease_lock:
+                key = id(artifacts)
+                self._leases[key] -= 1
+                released = self._leases[key] == 0
+                if released:
+                    del self._leases[key]
+                retired = self._retired.pop(key, None) if released else None
+            if retired is not None:
+                close_artifacts(retired)
+                logging.info(f"Versão {retired.version} liberada após as buscas em andamento.")
+
+    def load(self):
+        self.artifacts()
+        return self
+
+    def add_reload_listener(self, callback):
+        """Registra uma função chamada após cada recarga (ex.: esvaziar caches de respostas do RAG)."""
+        self._reload_listeners.append(callback)
+
+    def _swap(self, artifacts):
+        with self._lock, self._lease_lock:
+            old = self._artifacts
+            self._artifacts = artifacts
+            in_use = old is not None and id(old) in self._leases
+            if in_use:
+                self._retired[id(old)] = old
+        if old is not None and not in_use:
+            close_artifacts(old)
+
+    def reload(self):
+        """Relê índice e chunks do disco (fora do lock) e os troca pelos artefatos em memória."""
+        artifacts = self._load_artifacts()
+        self._swap(artifacts)
+        logging.info(f"Motor de recuperação recarregado: {artifacts.index.ntotal} vetores (versão {artifacts.version}).")
+        for callback in self._reload_listeners:
+            callback()
+        return self
+
+    def reload_in_background(self):
+        """Carrega a nova versão numa thread, sem bloquear as requisições; retorna a thread iniciada."""
+        def run():
+            try:
+                self.reload()
+            except Exception as e:
+                logging.error(f"Erro ao recarregar o motor de recuperação: {e}")
+        thread = threading.Thread(target=run, name="engine-reload", daemon=True)
+        thread.start()
+        return thread
+
+    def reload_if_changed(self, version=None):
+        """Recarrega se CURRENT apontar para outra versão; sem artefatos carregados, a próxima busca já lê a nova."""
+        version = version or current_version(self.data_dir)
+        if not self.loaded or version is None or version == self.version:
+            return False
+        self.reload()
+        return True
+
+    def watch(self, interval=30.0):
+        """Inicia (uma vez) a thread que verifica CURRENT periodicamente e troca a versão ao detectar mudança."""
+        if self._watcher is None:
+            self._watcher = VersionWatcher(self.data_dir, self.reload_if_changed, interval, initial=self.version)
+            self._watcher.start()
+        return self._watcher
+
+    def set_search_params(self, nprobe=None, ef_search=None):
+        """Ajusta nprobe/efSearch do índice residente (e das próximas recargas) sem reconstruí-lo."""
+        if nprobe is not None:
+            self.nprobe = nprobe
+        if ef_search is not None:
+            self.ef_search = ef_search
+        set_search_params(self.index, nprobe=nprobe, ef_search=ef_search)
+        return self
+
+    def _allowed(self, artifacts, filters):
+        """Posições dos chunks que atendem aos filtros (None sem filtro)."""
+        if not filters:
+            return None
+        if artifacts.metadata is None:
+            raise ValueError("Filtros indisponíveis: artefatos gerados sem metadados dos chunks.")
+        return artifacts.metadata.resolve(filters)
+
+    def _search(self, artifacts, query_embeddings, top_k, allowed=None):
+        query_embeddings = np.ascontiguousarray(query_embeddings, dtype='float32')
+        if query_embeddings.ndim == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
+        if allowed is not None and artifacts.vectors is not None and len(allowed) <= self.filter_exact_max:
+            # Subconjunto pequeno: distâncias exatas só sobre as linhas permitidas, mais rápido que percorrer o índice
+            return rescore(query_embeddings, np.broadcast_to(allowed, (len(query_embeddings), len(allowed))),
+                           artifacts.vectors, top_k)
+        rescoring = artifacts.vectors is not None and self.rescore_factor > 1
+        k = top_k * self.rescore_factor if rescoring else top_k
+        if allowed is None:
+            distances, indices = artifacts.index.search(query_embeddings, k)
+        else:
+            allowed_ids = artifacts.id_map.ids[allowed] if artifacts.id_map is not None else allowed
+            distances, indices = filtered_search(artifacts.index, query_embeddings, k, allowed_ids)
+        if artifacts.id_map is not None:
+            indices = artifacts.id_map.to_positions(indices)
+        if not rescoring:
+            return distances, indices
+        return rescore(query_embeddings, indices, artifacts.vectors, top_k)
+
+    def search(self, query_embedding, top_k=10, filters=None):
+        """Executa a busca no índice residente e retorna (distâncias, índices).
+
+        filters (ex.: {"source": "*14133*", "pages": (1, 10), "article": "75"}) restringe a busca aos
+        chunks correspondentes, sem pós-filtrar um top-k ampliado.
+        """
+        with self.using() as artifacts:
+            return self._search(artifacts, query_embedding, top_k, self._allowed(artifacts, filters))
+
+    def search_chunks(self, query_embedding, top_k=10, threshold=0.5, filters=None):
+        with self.using() as artifacts:
+            chunks = artifacts.chunks
+            distances, indices = self._search(artifacts, query_embedding, top_k, self._allowed(artifacts, filters))
+            return [chunks[idx] for idx, dist in zip(indices[0], distances[0]) if 0 <= idx < len(chunks) and dist < threshold]
+
+    def search_hybrid(self, query, query_embedding=None, top_k=10, threshold=0.5, filters=None):
+        """Combina busca vetorial e BM25 por Reciprocal Rank Fusion.
+
+        Sem embedding utilizável (None ou vetor nulo, como quando a API Gemini falha), responde
+        apenas com o índice lexical, sem nenhuma chamada de rede. Com re-ranqueamento ativo, os
+        top_k candidatos são reduzidos a até context_k chunks não redundantes.
+        """
+        with self.using() as artifacts:
+            chunks = artifacts.chunks
+            allowed = self._allowed(artifacts, filters)
+            has_embedding = query_embedding is not None and np.any(query_embedding)
+            rankings = []
+            if has_embedding:
+                distances, indices = self._search(artifacts, query_embedding, top_k, allowed)
+                rankings.append([idx for idx, dist in zip(indices[0], distances[0]) if 0 <= idx < len(chunks) and dist < threshold])
+            if artifacts.lexical is not None and (self.hybrid or not has_embedding):
+                _, ids = artifacts.lexical.search(query, top_k, allowed)
+                rankings.append([idx for idx in ids if idx < len(chunks)])
+            elif not has_embedding:
+                logging.warning("Embedding indisponível e índice BM25 ausente: nenhum contexto recuperado.")
+            candidate_ids = [idx for idx, _ in reciprocal_rank_fusion(rankings, top_k)]
+            if self.rerank:
+                candidate_ids = rerank(candidate_ids, chunks, self.context_k, query_embedding, artifacts.vectors)
+            return [chunks[idx] for idx in candidate_ids]
+
+    def search_batch(self, query_embeddings, top_k=10, filters=None):
+        """Busca N consultas com uma única chamada a index.search sobre a matriz (N, d).
+
+        Retorna, para cada consulta, uma lista de dicionários com id, distância e texto do chunk.
+        """
+        if len(query_embeddings) == 0:
+            return []
+        with self.using() as artifacts:
+            chunks = artifacts.chunks
+            distances, indices = self._search(artifacts, query_embeddings, top_k, self._allowed(artifacts, filters))
+            results = []
+            for row_ids, row_distances in zip(indices, distances):
+                results.append([
+                    {"id": int(idx), "distance": float(dist), "text": chunks[idx]}
+                    for idx, dist in zip(row_ids, row_distances) if 0 <= idx < len(chunks)
+                ])
+            return results
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """Retorna o motor de recuperação compartilhado pelo processo."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+def reload_engine():
+    """Recarrega o motor compartilhado após a regeneração dos artefatos."""
+    engine = get_engine()
+    engine.reload()
+    return engine
+
+def watch_versions(interval=RAG_VERSION_WATCH_INTERVAL):
+    """Inicia a verificação periódica de novas versões no motor compartilhado (uma thread por processo)."""
+    if interval <= 0:
+        return None
+    return get_engine().watch(interval)
+
+def search_chunks(query, top_k=10, threshold=0.5, filters=None):
+    from app.models import embed_query
     query_embedding = embed_query(query)
-    distances, indices = index.search(query_embedding, top_k)
-    relevant_chunks = [chunks[idx] for idx, dist in zip(indices[0], distances[0]) if dist < threshold]
+    relevant_chunks = get_engine().search_hybrid(query, query_embedding, top_k, threshold, filters)
     return relevant_chunks if relevant_chunks else ["Nenhum contexto relevante encontrado."]
 
+def search_batch(queries, top_k=10, filters=None):
+    """Versão em lote de search_chunks: embeda todas as consultas juntas e faz uma única busca FAISS."""
+    from app.models import embed_queries
+    query_embeddings = embed_queries(queries)
+    return get_engine().search_batch(query_embeddings, top_k, filters)
+
 def build_prompt(query, results):
     prompt = f"Consulta: {query}\n\nContexto recuperado:\n"
     for i, (text, distance) in enumerate(results):
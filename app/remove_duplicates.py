@@ -1,32 +1,151 @@
-import json
-import os
-
-# Configurações
-INPUT_JSON = "app/rag_data/chunks.json"
-OUTPUT_JSON = "app/rag_data/chunks_unique.json"
-
-def remove_duplicates(input_file, output_file):
-    # Carregar os chunks do arquivo de entrada
-    if not os.path.exists(input_file):
-        print(f"Arquivo {input_file} não encontrado.")
-        return
-    
-    with open(input_file, "r", encoding="utf-8") as f:
-        chunks = json.load(f)
-    
-    print(f"Total de chunks carregados: {len(chunks)}")
-
-    # Remover duplicatas mantendo a ordem original
-    unique_chunks = list(dict.fromkeys(chunks))
-    
-    print(f"Total de chunks únicos: {len(unique_chunks)}")
-    print(f"Duplicatas removidas: {len(chunks) - len(unique_chunks)}")
-
-    # Salvar os chunks únicos no arquivo de saída
-    with open(output_file, "w", encoding="utf-8") as f:
-        json.dump(unique_chunks, f, ensure_ascii=False, indent=4)
-    
-    print(f"Chunks únicos salvos em {output_file}")
-
-if __name__ == "__main__":
-    remove_duplicates(INPUT_JSON, OUTPUT_JSON)
\ No newline at end of file
+import os
+import re
+import zlib
+import numpy as np
+from app.chunk_store import (
+    read_chunks, write_chunks, store_path_for, read_chunk_sources, write_chunk_sources,
+    read_chunk_metadata, write_chunk_metadata
+)
+
+# Configurações
+INPUT_JSON = "app/rag_data/chunks.json"
+OUTPUT_JSON = "app/rag_data/chunks_unique.json"
+# Quase-duplicatas: chunks com similaridade de Jaccard (sobre shingles de palavras) a partir desse
+# limiar são agrupados e só o primeiro de cada grupo é mantido; 0 remove apenas cópias exatas
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+SHINGLE_WORDS = 5
+# Assinatura MinHash com NUM_PERM funções de hash, dividida em LSH_BANDS faixas de NUM_PERM / LSH_BANDS
+# linhas: pares com Jaccard 0.8 viram candidatos com ~95% de probabilidade, pares abaixo de 0.5 raramente
+NUM_PERM = 128
+LSH_BANDS = 16
+
+def shingle_hashes(text, size=SHINGLE_WORDS):
+    """Hashes (ordenados, sem repetição) dos n-gramas de palavras do texto."""
+    words = re.findall(r"\w+", text.lower())
+    grams = [" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))] if words else []
+    return np.unique(np.array([zlib.crc32(g.encode("utf-8")) for g in grams], dtype='uint64'))
+
+def minhash_params(num_perm=NUM_PERM, seed=42):
+    """Coeficientes (ímpares) do hashing multiply-shift usado como família de permutações."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2 ** 63, num_perm, dtype='uint64') | np.uint64(1)
+    b = rng.integers(0, 2 ** 63, num_perm, dtype='uint64')
+    return a, b
+
+def minhash_signature(hashes, params):
+    """Menor valor de cada função de hash sobre os shingles (aritmética módulo 2^64, sem overflow)."""
+    a, b = params
+    return ((hashes[:, None] * a[None, :] + b[None, :]) >> np.uint64(32)).min(axis=0)
+
+def jaccard(a, b):
+    if len(a) == 0 or len(b) == 0:
+        return 0.0
+    common = len(np.intersect1d(a, b, assume_unique=True))
+    return common / float(len(a) + len(b) - common)
+
+def canonical_positions(chunks, threshold=NEAR_DUPLICATE_THRESHOLD, num_perm=NUM_PERM, bands=LSH_BANDS):
+    """Para cada chunk, a posição do chunk canônico do seu grupo (ele mesmo, se for o primeiro).
+
+    Cada chunk é comparado apenas com os canônicos que caem num mesmo bucket LSH e a semelhança
+    é confirmada pela Jaccard exata dos shingles, então o custo cresce ~linearmente com o corpus.
+    """
+    canonical = np.arange(len(chunks), dtype='int64')
+    exact = {}
+    params = minhash_params(num_perm)
+    rows = num_perm // bands
+    buckets = [{} for _ in range(bands)]
+    representatives = {}
+    for position, chunk in enumerate(chunks):
+        first = exact.setdefault(chunk, position)
+        if first != position:
+            canonical[position] = first
+            continue
+        if threshold <= 0:
+            continue
+        hashes = shingle_hashes(chunk)
+        if len(hashes) == 0:
+            continue
+        signature = minhash_signature(hashes, params)
+        keys = [signature[band * rows:(band + 1) * rows].tobytes() for band in range(bands)]
+        candidates = dict.fromkeys(c for band, key in enumerate(keys) for c in buckets[band].get(key, ()))
+        match = next((c for c in candidates if jaccard(hashes, representatives[c]) >= threshold), None)
+        if match is not None:
+            canonical[position] = match
+            continue
+        representatives[position] = hashes
+        for band, key in enumerate(keys):
+            buckets[band].setdefault(key, []).append(position)
+    return canonical
+
+def unique_positions(chunks, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """Posições mantidas (um chunk por grupo de cópias e quase-duplicatas), na ordem original."""
+    canonical = canonical_positions(chunks, threshold)
+    return np.flatnonzero(canonical == np.arange(len(chunks)))
+
+def merge_duplicates(chunks, sources=None, metadata=None, threshold=NEAR_DUPLICATE_THRESHOLD):
+    """Remove cópias e quase-duplicatas de todo o corpus; retorna (posições mantidas, metadados dos mantidos).
+
+    Fica o primeiro chunk de cada grupo. Seu registro ganha "copies", com a origem e a página de cada
+    cópia descartada que estava em outro arquivo ou página, e os artigos citados por elas, para que os
+    filtros por origem, página e artigo continuem encontrando o texto. Sem sources nem metadata, os
+    metadados retornados são None.
+    """
+    canonical = canonical_positions(chunks, threshold)
+    keep = np.flatnonzero(canonical == np.arange(len(chunks)))
+    if sources is None and metadata is None:
+        return keep, None
+    records = {int(i): dict(metadata[i]) if metadata is not None else {} for i in keep}
+    for position, first in enumerate(canonical.tolist()):
+        if first == position:
+            continue
+        record = records[first]
+        copy = {"source": sources[position]} if sources is not None else {}
+        if metadata is not None:
+            if metadata[position].get("page") is not None:
+                copy["page"] = metadata[position]["page"]
+            articles = list(dict.fromkeys(record.get("articles", []) + metadata[position].get("articles", [])))
+            if articles:
+                record["articles"] = articles
+        primary = {"source": sources[first]} if sources is not None else {}
+        if record.get("page") is not None:
+            primary["page"] = record["page"]
+        if copy and copy != primary and copy not in record.get("copies", []):
+            record.setdefault("copies", []).append(copy)
+    return keep, [records[int(i)] for i in keep]
+
+def remove_duplicates(input_file, output_file, threshold=NEAR_DUPLICATE_THRESHOLD):
+    # Carregar os chunks do arquivo de entrada (JSON ou chunk store .store)
+    if not os.path.exists(input_file):
+        print(f"Arquivo {input_file} não encontrado.")
+        return
+
+    chunks = read_chunks(input_file)
+
+    print(f"Total de chunks carregados: {len(chunks)}")
+
+    # Remover cópias exatas e quase-duplicatas mantendo a ordem original; as origens e páginas das
+    # cópias ficam nos metadados do chunk mantido
+    sources = read_chunk_sources(input_file, len(chunks))
+    metadata = read_chunk_metadata(input_file, len(chunks))
+    keep, merged_metadata = merge_duplicates(list(chunks), sources, metadata, threshold)
+    unique_chunks = [chunks[i] for i in keep]
+
+    print(f"Total de chunks únicos: {len(unique_chunks)}")
+    print(f"Duplicatas removidas: {len(chunks) - len(unique_chunks)}")
+
+    # Salvar os chunks únicos no arquivo de saída (formato definido pela extensão)
+    write_chunks(unique_chunks, output_file)
+    # Origens e metadados acompanham os chunks mantidos
+    if sources is not None:
+        write_chunk_sources([sources[i] for i in keep], output_file)
+    if merged_metadata is not None:
+        write_chunk_metadata(merged_metadata, output_file)
+
+    print(f"Chunks únicos salvos em {output_file}")
+
+if __name__ == "__main__":
+    # Usa o chunk store binário quando ele existir
+    if os.path.exists(store_path_for(INPUT_JSON)):
+        remove_duplicates(store_path_for(INPUT_JSON), store_path_for(OUTPUT_JSON))
+    else:
+        remove_duplicates(INPUT_JSON, OUTPUT_JSON)
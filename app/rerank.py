@@ -0,0 +1,77 @@
+import re
+import numpy as np
+
+# Parâmetros padrão do re-ranqueamento pós-busca
+MMR_LAMBDA = 0.7
+DUPLICATE_SIMILARITY = 0.97
+OVERLAP_THRESHOLD = 0.5
+SHINGLE_SIZE = 8
+
+def shingles(text, size=SHINGLE_SIZE):
+    """Conjunto de n-gramas de palavras usado para medir sobreposição textual entre chunks."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) <= size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def overlap_ratio(a, b):
+    """Fração do menor conjunto de shingles contida no outro (1.0 = um chunk repete o outro)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype='float32')
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def mmr(query_vector, candidate_vectors, k, lambda_=MMR_LAMBDA):
+    """Maximal Marginal Relevance: escolhe k candidatos equilibrando relevância e diversidade.
+
+    Retorna as posições (em candidate_vectors) na ordem de seleção.
+    """
+    if len(candidate_vectors) == 0:
+        return []
+    query_vector = _normalize(np.asarray(query_vector).reshape(-1))
+    candidates = _normalize(candidate_vectors)
+    relevance = candidates @ query_vector
+    similarity = candidates @ candidates.T
+    selected = []
+    remaining = list(range(len(candidates)))
+    while remaining and len(selected) < k:
+        if selected:
+            redundancy = similarity[np.ix_(remaining, selected)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining))
+        scores = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy
+        selected.append(remaining.pop(int(np.argmax(scores))))
+    return selected
+
+def rerank(candidate_ids, chunks, k, query_embedding=None, vectors=None, lambda_=MMR_LAMBDA,
+           duplicate_similarity=DUPLICATE_SIMILARITY, overlap_threshold=OVERLAP_THRESHOLD):
+    """Reduz os candidatos recuperados a até k chunks não redundantes.
+
+    Com os embeddings armazenados (vectors) e o da consulta, ordena por MMR e descarta quase-duplicatas
+    (similaridade de cosseno >= duplicate_similarity). Em qualquer caso, descarta chunks cujo texto
+    se sobrepõe a um já escolhido (como os vizinhos gerados pela janela de sobreposição do chunker).
+    """
+    candidate_ids = [int(i) for i in candidate_ids]
+    order = list(range(len(candidate_ids)))
+    candidate_vectors = None
+    if vectors is not None and query_embedding is not None and np.any(query_embedding) and candidate_ids:
+        candidate_vectors = _normalize(np.asarray(vectors[candidate_ids], dtype='float32'))
+        order = mmr(query_embedding, candidate_vectors, len(candidate_ids), lambda_)
+
+    selected, selected_shingles = [], []
+    for position in order:
+        if len(selected) >= k:
+            break
+        if candidate_vectors is not None and selected:
+            if float((candidate_vectors[selected] @ candidate_vectors[position]).max()) >= duplicate_similarity:
+                continue
+        text_shingles = shingles(chunks[candidate_ids[position]])
+        if any(overlap_ratio(text_shingles, other) >= overlap_threshold for other in selected_shingles):
+            continue
+        selected.append(position)
+        selected_shingles.append(text_shingles)
+    return [candidate_ids[position] for position in selected]
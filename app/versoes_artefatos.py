@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import shutil
+import logging
+import threading
+
+# Diretórios versionados de artefatos:
+#   <data_dir>/versions/<versão>/   índice (ou index_shards/), chunks, ids, embeddings, bm25 e manifest.json
+#   <data_dir>/CURRENT              nome da versão ativa, substituído atomicamente ao publicar
+# Uma versão publicada nunca é modificada: o gerador sempre grava numa versão nova.
+VERSIONS_DIR = "versions"
+CURRENT_FILE = "CURRENT"
+VERSION_MANIFEST = "manifest.json"
+KEEP_VERSIONS = 3
+
+def versions_dir_for(data_dir):
+    return os.path.join(data_dir, VERSIONS_DIR)
+
+def version_dir_for(data_dir, version):
+    return os.path.join(versions_dir_for(data_dir), version)
+
+def current_version(data_dir):
+    """Nome da versão ativa, ou None quando o diretório ainda usa o layout sem versões."""
+    path = os.path.join(data_dir, CURRENT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip() or None
+
+def resolve_data_dir(data_dir):
+    """Diretório com os artefatos ativos: a versão apontada por CURRENT ou o próprio data_dir."""
+    version = current_version(data_dir)
+    return version_dir_for(data_dir, version) if version else data_dir
+
+def create_version_dir(data_dir):
+    """Cria o diretório de uma nova versão (nome ordenável pela data de criação) e retorna (versão, caminho)."""
+    base = time.strftime("%Y%m%d-%H%M%S")
+    version, suffix = base, 1
+    while os.path.exists(version_dir_for(data_dir, version)):
+        suffix += 1
+        version = f"{base}-{suffix}"
+    path = version_dir_for(data_dir, version)
+    os.makedirs(path)
+    return version, path
+
+def write_version_manifest(version_dir, version, **extra):
+    """Registra a versão e o tamanho de cada arquivo, para conferir a versão antes de carregá-la."""
+    files = {}
+    for root, _, filenames in os.walk(version_dir):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, version_dir).replace(os.sep, "/")
+            if relative != VERSION_MANIFEST:
+                files[relative] = os.path.getsize(path)
+    manifest = {"version": version, "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "files": files, **extra}
+    with open(os.path.join(version_dir, VERSION_MANIFEST), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=4)
+    return manifest
+
+def read_version_manifest(version_dir):
+    path = os.path.join(version_dir, VERSION_MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def verify_version(version_dir):
+    """Levanta ValueError se faltar o manifesto ou algum arquivo não tiver o tamanho registrado nele."""
+    manifest = read_version_manifest(version_dir)
+    if manifest is None:
+        raise ValueError(f"Versão {version_dir} sem {VERSION_MANIFEST}.")
+    for relative, size in manifest["files"].items():
+        path = os.path.join(version_dir, relative)
+        if not os.path.exists(path) or os.path.getsize(path) != size:
+            raise ValueError(f"Arquivo {relative} ausente ou incompleto na versão {manifest['version']}.")
+    return manifest
+
+def publish_version(data_dir, version):
+    """Torna a versão ativa substituindo CURRENT atomicamente (os workers a detectam na próxima verificação)."""
+    verify_version(version_dir_for(data_dir, version))
+    path = os.path.join(data_dir, CURRENT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+    logging.info(f"Versão {version} publicada em {data_dir}.")
+    return version
+
+def prune_versions(data_dir, keep=KEEP_VERSIONS):
+    """Apaga as versões mais antigas, mantendo as keep mais recentes e sempre a ativa."""
+    versions_dir = versions_dir_for(data_dir)
+    if not os.path.isdir(versions_dir):
+        return []
+    active = current_version(data_dir)
+    versions = sorted(os.listdir(versions_dir))
+    removed = [v for v in versions[:max(len(versions) - keep, 0)] if v != active]
+    for version in removed:
+        shutil.rmtree(version_dir_for(data_dir, version), ignore_errors=True)
+        logging.info(f"Versão antiga {version} removida.")
+    return removed
+
+class VersionWatcher(threading.Thread):
+    """Thread que verifica CURRENT a cada interval segundos e chama on_change(versão) quando ela muda."""
+
+    def __init__(self, data_dir, on_change, interval=30.0, initial=None):
+        super().__init__(name="version-watcher", daemon=True)
+        self.data_dir = data_dir
+        self.on_change = on_change
+        self.interval = interval
+        self.version = initial
+        self._stop_event = threading.Event()
+
+    def check(self):
+        version = current_version(self.data_dir)
+        if version is None or version == self.version:
+            return False
+        try:
+            self.on_change(version)
+        except Exception as e:
+            # Mantém a versão anterior; a próxima verificação tenta de novo
+            logging.error(f"Erro ao carregar a versão {version}: {e}")
+            return False
+        self.version = version
+        return True
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.check()
+
+    def stop(self):
+        self._stop_event.set()
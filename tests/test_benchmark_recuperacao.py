@@ -0,0 +1,47 @@
+import os
+import sys
+import copy
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.benchmark_recuperacao import run_benchmark, compare_reports, synthetic_corpus
+
+
+class TestBenchmarkRecuperacao(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = synthetic_corpus(600, 16, n_clusters=8)
+
+    def test_report_per_config(self):
+        configs = [
+            {"index_type": "flat"},
+            {"index_type": "ivf_flat", "nlist": 8, "nprobe": 1},
+            {"index_type": "sq8", "rescore_factor": 4},
+            {"index_type": "flat", "n_shards": 3},
+        ]
+        report = run_benchmark(self.embeddings, configs, k=5, n_queries=20, threads=(1, 2), source="teste")
+        self.assertEqual(report["meta"]["n_vectors"], 600)
+        self.assertEqual(len(report["results"]), 4)
+        flat, ivf, sq8, sharded = report["results"]
+        self.assertEqual(flat["config"], {"index_type": "flat"})
+        self.assertEqual(flat["recall_at_5"], 1.0)
+        self.assertEqual(sharded["recall_at_5"], 1.0)
+        self.assertLessEqual(ivf["recall_at_5"], 1.0)
+        self.assertGreater(sq8["recall_at_5"], 0.9)
+        for result in report["results"]:
+            self.assertLessEqual(result["latency_ms_p50"], result["latency_ms_p99"])
+            self.assertEqual(set(result["qps"]), {"1", "2"})
+            self.assertGreater(result["index_bytes"], 0)
+
+    def test_compare_reports(self):
+        report = run_benchmark(self.embeddings, [{"index_type": "flat"}], k=5, n_queries=10, threads=(1,))
+        regressed = copy.deepcopy(report)
+        regressed["results"][0]["recall_at_5"] -= 0.5
+        regressed["results"][0]["latency_ms_p95"] = report["results"][0]["latency_ms_p95"] * 3 + 1
+        self.assertEqual(compare_reports(report, report), [])
+        metrics = [r["metric"] for r in compare_reports(report, regressed)]
+        self.assertEqual(metrics, ["recall_at_5", "latency_ms_p95"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.bm25 import BM25Index, tokenize, reciprocal_rank_fusion
+
+
+class TestBM25(unittest.TestCase):
+    def setUp(self):
+        self.chunks = [
+            "Art. 75. É dispensável a licitação para contratação que envolva valores inferiores a 100 mil reais.",
+            "A Lei 14.133/2021 estabelece normas gerais de licitação e contratação.",
+            "O pregão é a modalidade de licitação obrigatória para aquisição de bens e serviços comuns.",
+            "Art. 74. É inexigível a licitação quando inviável a competição.",
+        ]
+        self.index = BM25Index.build(self.chunks)
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Dispensa de Licitação, art. 75 da Lei 14.133/2021"),
+                         ["dispensa", "licitacao", "art", "75", "lei", "14133/2021"])
+
+    def test_exact_terms_rank_first(self):
+        _, ids = self.index.search("art. 75 dispensa", top_k=2)
+        self.assertEqual(ids[0], 0)
+        _, ids = self.index.search("inexigível", top_k=4)
+        self.assertEqual(ids.tolist(), [3])
+
+    def test_unknown_terms(self):
+        scores, ids = self.index.search("xyzzy de", top_k=3)
+        self.assertEqual(len(ids), 0)
+        self.assertEqual(len(scores), 0)
+
+    def test_save_and_load(self):
+        path = os.path.join(self.tmp_dir, "bm25.npz")
+        self.index.save(path)
+        loaded = BM25Index.load(path)
+        expected = self.index.search("pregão bens comuns", top_k=3)
+        result = loaded.search("pregão bens comuns", top_k=3)
+        self.assertEqual(result[1].tolist(), expected[1].tolist())
+        self.assertTrue(np.allclose(result[0], expected[0]))
+
+    def test_reciprocal_rank_fusion(self):
+        fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], top_k=3)
+        self.assertEqual([doc_id for doc_id, _ in fused], [1, 3, 2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.cache_embeddings import LRUEmbeddingCache, EmbeddingStore, normalize_query
+
+
+class TestCacheEmbeddings(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("  O que é  a Lei\n14.133? "), "o que é a lei 14.133?")
+
+    def test_hit_and_miss_counters(self):
+        cache = LRUEmbeddingCache(maxsize=4)
+        self.assertIsNone(cache.get("consulta"))
+        cache.put("consulta", np.ones(8, dtype='float32'))
+        self.assertTrue(np.allclose(cache.get("  CONSULTA "), 1.0))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (1, 1, 1))
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_lru_eviction(self):
+        cache = LRUEmbeddingCache(maxsize=2)
+        cache.put("a", np.zeros(4))
+        cache.put("b", np.zeros(4))
+        cache.get("a")
+        cache.put("c", np.zeros(4))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.stats()["size"], 2)
+
+    def test_store_persists_between_instances(self):
+        path = os.path.join(self.tmp_dir, "query_cache.sqlite")
+        cache = LRUEmbeddingCache(maxsize=2, store=EmbeddingStore(path))
+        cache.put("consulta", np.arange(8, dtype='float32'))
+        cache.store.close()
+
+        store = EmbeddingStore(path)
+        self.assertEqual(len(store), 1)
+        reopened = LRUEmbeddingCache(maxsize=2, store=store)
+        self.assertTrue(np.allclose(reopened.get("consulta"), np.arange(8)))
+        self.assertEqual(reopened.stats()["hits"], 1)
+        store.close()
+
+    def test_store_dict_protocol_and_compact(self):
+        store = EmbeddingStore(os.path.join(self.tmp_dir, "embedding_cache.sqlite"))
+        store.update({"a": np.ones(4), "b": np.zeros(4)})
+        store["c"] = np.full(4, 2.0)
+        self.assertIn("a", store)
+        self.assertNotIn("d", store)
+        self.assertTrue(np.allclose(store["c"], 2.0))
+        with self.assertRaises(KeyError):
+            store["d"]
+        self.assertEqual(store.compact({"a", "c"}), 1)
+        self.assertEqual(len(store), 2)
+        self.assertNotIn("b", store)
+        self.assertEqual(store.compact({"a", "c"}), 0)
+        store.close()
+
+    def test_store_keeps_dtype_of_existing_file(self):
+        path = os.path.join(self.tmp_dir, "embedding_cache.sqlite")
+        store = EmbeddingStore(path, dtype='float16')
+        store["a"] = np.full(4, 0.1)
+        store.close()
+        store = EmbeddingStore(path)
+        self.assertEqual(store.dtype, np.float16)
+        self.assertEqual(store["a"].dtype, np.float32)
+        self.assertTrue(np.allclose(store["a"], 0.1, atol=1e-3))
+        store.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
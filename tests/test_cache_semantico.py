@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+from unittest.mock import patch
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.cache_semantico import SemanticCache
+
+
+class TestSemanticCache(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.vectors = rng.normal(size=(5, 16)).astype('float32')
+        self.cache = SemanticCache(max_distance=0.1, ttl=60, maxsize=3)
+
+    def test_hit_within_distance(self):
+        self.cache.put(self.vectors[0], "Resposta 0")
+        paraphrase = self.vectors[0] + 0.05 * self.vectors[1]
+        self.assertEqual(self.cache.get(paraphrase), "Resposta 0")
+        self.assertIsNone(self.cache.get(self.vectors[2]))
+        stats = self.cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"]), (1, 1))
+
+    def test_empty_and_zero_vector(self):
+        self.assertIsNone(self.cache.get(self.vectors[0]))
+        self.cache.put(np.zeros(16), "Resposta")
+        self.assertEqual(len(self.cache), 0)
+
+    def test_ttl_expiration(self):
+        with patch('app.cache_semantico.time.time', return_value=1000.0):
+            self.cache.put(self.vectors[0], "Resposta 0")
+        with patch('app.cache_semantico.time.time', return_value=1059.0):
+            self.assertEqual(self.cache.get(self.vectors[0]), "Resposta 0")
+        with patch('app.cache_semantico.time.time', return_value=1061.0):
+            self.assertIsNone(self.cache.get(self.vectors[0]))
+        self.assertEqual(len(self.cache), 0)
+
+    def test_maxsize_evicts_oldest(self):
+        for i in range(4):
+            self.cache.put(self.vectors[i], f"Resposta {i}")
+        self.assertEqual(len(self.cache), 3)
+        self.assertIsNone(self.cache.get(self.vectors[0]))
+        self.assertEqual(self.cache.get(self.vectors[3]), "Resposta 3")
+
+    def test_flush(self):
+        self.cache.put(self.vectors[0], "Resposta 0")
+        self.cache.flush()
+        self.assertEqual(len(self.cache), 0)
+        self.assertIsNone(self.cache.get(self.vectors[0]))
+
+
+if __name__ == "__main__":
+    unittest.main()
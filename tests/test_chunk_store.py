@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.chunk_store import (
+    ChunkStore, write_chunk_store, read_chunks, write_chunks, store_path_for, offsets_path_for,
+    write_chunk_files, read_chunk_sources, read_chunk_metadata
+)
+from app.remove_duplicates import remove_duplicates
+
+
+class TestChunkStore(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.store_path = os.path.join(self.tmp_dir, "chunks.store")
+        self.chunks = ["Art. 75. É dispensável a licitação:", "Licitação é o procedimento…", "", "Acórdão TCU nº 1.234/2023"]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def test_roundtrip(self):
+        for compress in (False, True):
+            write_chunk_store(self.chunks, self.store_path, compress=compress)
+            with ChunkStore(self.store_path) as store:
+                self.assertEqual(store.compressed, compress)
+                self.assertEqual(len(store), 4)
+                self.assertEqual(list(store), self.chunks)
+                self.assertEqual(store[-1], self.chunks[-1])
+                self.assertEqual(store[1:3], self.chunks[1:3])
+                self.assertEqual(store.get_many([3, 0]), [self.chunks[3], self.chunks[0]])
+                with self.assertRaises(IndexError):
+                    store[4]
+
+    def test_empty_store(self):
+        write_chunk_store([], self.store_path)
+        with ChunkStore(self.store_path) as store:
+            self.assertEqual(len(store), 0)
+            self.assertEqual(list(store), [])
+
+    def test_no_temporary_files_left(self):
+        write_chunk_store(self.chunks, self.store_path)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["chunks.store", "chunks.store.offsets"])
+        self.assertTrue(os.path.exists(offsets_path_for(self.store_path)))
+
+    def test_invalid_offsets_file(self):
+        write_chunk_store(self.chunks, self.store_path)
+        with open(offsets_path_for(self.store_path), "r+b") as f:
+            f.write(b"XXXXXXXX")
+        with self.assertRaises(ValueError):
+            ChunkStore(self.store_path)
+
+    def test_chunk_files_written_together(self):
+        json_path = os.path.join(self.tmp_dir, "chunks.json")
+        write_chunk_files(self.chunks, ["a.pdf"] * 4, [{"page": 1}] * 4, json_path)
+        self.assertEqual(read_chunks(json_path), self.chunks)
+        self.assertEqual(read_chunk_sources(json_path, 4), ["a.pdf"] * 4)
+        # Sem nenhum chunk, os três arquivos ainda são reescritos e continuam consistentes
+        write_chunk_files([], [], [], json_path)
+        self.assertEqual(read_chunks(json_path), [])
+        self.assertEqual(read_chunk_sources(json_path, 0), [])
+        self.assertEqual(read_chunk_metadata(json_path, 0), [])
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["chunks.json", "chunks.meta.json", "chunks.sources.json"])
+        with self.assertRaises(ValueError):
+            write_chunk_files(self.chunks, [], [], json_path)
+
+    def test_read_write_dispatch(self):
+        json_path = os.path.join(self.tmp_dir, "chunks.json")
+        write_chunks(self.chunks, json_path)
+        with open(json_path, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), self.chunks)
+        self.assertEqual(store_path_for(json_path), self.store_path)
+        write_chunks(read_chunks(json_path), self.store_path)
+        self.assertIsInstance(read_chunks(self.store_path), ChunkStore)
+
+    def test_remove_duplicates_store(self):
+        write_chunk_store(self.chunks + self.chunks[:2], self.store_path)
+        output_path = os.path.join(self.tmp_dir, "chunks_unique.store")
+        remove_duplicates(self.store_path, output_path)
+        with ChunkStore(output_path) as store:
+            self.assertEqual(list(store), self.chunks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest.mock import Mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.controle_taxa import RateController, is_retryable, retry_after, status_code
+
+
+class HTTPError(Exception):
+    def __init__(self, code, headers=None):
+        super().__init__(f"HTTP {code}")
+        self.response = Mock(status_code=code, headers=headers or {})
+
+
+class TestControleTaxa(unittest.TestCase):
+    def test_classifies_errors(self):
+        self.assertTrue(is_retryable(HTTPError(429)))
+        self.assertTrue(is_retryable(HTTPError(503)))
+        self.assertFalse(is_retryable(HTTPError(400)))
+        self.assertFalse(is_retryable(ValueError("x")))
+        error = Exception("cota")
+        error.code = 429
+        self.assertEqual(status_code(error), 429)
+        self.assertEqual(retry_after(HTTPError(429, {"Retry-After": "2"})), 2.0)
+
+    def test_token_bucket_limits_rate(self):
+        controller = RateController("teste", rate=20, max_rate=20)
+        start = time.monotonic()
+        for _ in range(6):
+            controller.acquire()
+            controller.release()
+        self.assertGreaterEqual(time.monotonic() - start, 0.2)
+        controller.acquire()
+        self.assertFalse(controller.acquire(timeout=0.0))
+
+    def test_aimd(self):
+        controller = RateController("teste", rate=10, max_rate=12, cooldown=60)
+        for _ in range(50):
+            controller.success()
+        self.assertEqual(controller.rate, 12)
+        controller.throttled()
+        controller.throttled()
+        # Rajada de 429 dentro do cooldown reduz a taxa uma única vez
+        self.assertEqual(controller.rate, 6)
+        self.assertEqual(controller.stats()["throttles"], 2)
+
+    def test_call_retries_with_backoff(self):
+        controller = RateController("teste", rate=100, max_retries=3, backoff_base=0.01)
+        fn = Mock(side_effect=[HTTPError(429), HTTPError(500), "ok"])
+        self.assertEqual(controller.call(fn), "ok")
+        self.assertEqual(fn.call_count, 3)
+        self.assertEqual(controller.stats()["retries"], 2)
+        with self.assertRaises(HTTPError):
+            controller.call(Mock(side_effect=HTTPError(400)))
+        with self.assertRaises(HTTPError):
+            controller.call(Mock(side_effect=HTTPError(503)), max_retries=0)
+
+    def test_deadline_stops_retries(self):
+        controller = RateController("teste", rate=100, backoff_base=10)
+        fn = Mock(side_effect=HTTPError(429, {"Retry-After": "5"}))
+        start = time.monotonic()
+        with self.assertRaises(HTTPError):
+            controller.call(fn, deadline=0.5)
+        self.assertLess(time.monotonic() - start, 0.5)
+        fn.assert_called_once()
+
+    def test_queue_depth(self):
+        controller = RateController("teste", rate=5, max_rate=5)
+        controller.acquire()
+        threads = [threading.Thread(target=controller.acquire) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        self.assertGreaterEqual(controller.stats()["queue_depth"], 2)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(controller.stats()["queue_depth"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 import os
+import re
 import sys
 import unittest
 import shutil
@@ -13,8 +14,10 @@ from app.extrair_texto import (
     extract_text_from_pdf, extract_text_from_docx, extract_text_from_doc,
     extract_text_from_excel, extract_text_from_txt, extract_text_from_file,
     preprocess_text, semantic_segmentation_with_overlap, process_file,
-    load_cache, save_cache
+    load_cache, save_cache, merge_file_chunks, files_to_process, preprocess_pages, chunk_metadata, split_sentences,
+    split_long_text, split_sentences_batch, segment_documents, process_files
 )
+from app.benchmark_chunking import synthetic_law, legacy_segmentation
 from docx import Document
 import pandas as pd
 import PyPDF2
@@ -76,6 +79,48 @@ class TestExtrairTexto(unittest.TestCase):
         if os.path.exists("app/rag_data/chunk_cache.json"):
             os.remove("app/rag_data/chunk_cache.json")
 
+    def test_merge_file_chunks(self):
+        chunks = ["a1", "a2", "b1", "c1"]
+        sources = ["a.pdf", "a.pdf", "b.pdf", "c.pdf"]
+        merged, merged_sources = merge_file_chunks(chunks, sources, {"a.pdf": ["a3"], "d.pdf": ["d1"]}, {"c.pdf"})
+        self.assertEqual(merged, ["b1", "a3", "d1"])
+        self.assertEqual(merged_sources, ["b.pdf", "a.pdf", "d.pdf"])
+
+    def test_files_to_process(self):
+        # vazio.pdf foi processado sem gerar chunks: não aparece nas origens, mas está no cache
+        cache = {"a.pdf": "1", "vazio.pdf": "2", "apagado.pdf": "3", "sem_chunks_apagado.pdf": "4"}
+        sources = ["a.pdf", "apagado.pdf"]
+        changed, removed = files_to_process({"a.pdf": "9", "vazio.pdf": "2", "novo.pdf": "5"}, cache, sources)
+        self.assertEqual(changed, ["a.pdf", "novo.pdf"])
+        self.assertEqual(removed, {"apagado.pdf", "sem_chunks_apagado.pdf"})
+
+    def test_chunk_metadata(self):
+        text, page_starts = preprocess_pages(["Art. 1 Objeto.\n", "", "Art. 75 Dispensa.\nFim."])
+        self.assertEqual(text, "Art. 1 Objeto. Art. 75 Dispensa. Fim.")
+        self.assertEqual(page_starts, [0, 15, 15])
+        records = chunk_metadata(["Art. 1 Objeto. Art. 75", "Art. 75 Dispensa. Fim."], [0, 15], page_starts)
+        self.assertEqual(records, [{"page": 1, "articles": ["1", "75"]}, {"page": 3, "articles": ["75"]}])
+        self.assertEqual(chunk_metadata(["Sem artigo."]), [{}])
+
+    def test_chunk_metadata_pages_from_segmentation(self):
+        # Chunks reais (a sentença que estoura o limite sai do chunk seguinte, então eles não são
+        # trechos contíguos do texto): a página vem da posição da primeira sentença de cada chunk
+        pages = [
+            "\n".join(f"Art. {page * 30 + i}. Na página {page + 1} o órgão publica o edital da licitação "
+                      f"com prazo, valor estimado e critério de julgamento." for i in range(30))
+            for page in range(8)
+        ]
+        text, page_starts = preprocess_pages(pages)
+        [(chunks, chunk_offsets)] = segment_documents([text], with_offsets=True)
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(chunks, semantic_segmentation_with_overlap(text))
+        self.assertTrue(any(chunk not in text for chunk in chunks))
+        records = chunk_metadata(chunks, chunk_offsets, page_starts)
+        for chunk, offset, record in zip(chunks, chunk_offsets, records):
+            self.assertTrue(chunk.startswith(text[offset:offset + 20]))
+            self.assertEqual(record["page"], int(re.search(r"página (\d+)", chunk).group(1)))
+        self.assertGreater(len({record["page"] for record in records}), 2)
+
     def test_extract_text_from_pdf(self):
         text = extract_text_from_pdf(self.files["pdf"])
         self.assertTrue(isinstance(text, str))
@@ -129,6 +174,35 @@ class TestExtrairTexto(unittest.TestCase):
             self.assertTrue(100 <= token_count <= 800, f"Token count: {token_count}")
             self.assertTrue(byte_count <= 9000, f"Byte count: {byte_count}")
 
+    def test_segmentation_matches_legacy(self):
+        # Uma passada do SpaCy com somas de prefixo produz exatamente os chunks da versão anterior
+        text = synthetic_law(60)
+        self.assertEqual(semantic_segmentation_with_overlap(text), legacy_segmentation(text))
+        sentences, token_counts = split_sentences(text)
+        self.assertEqual(token_counts[:20], [len(NLP(sentence)) for sentence in sentences[:20]])
+
+    def test_split_long_text(self):
+        text = "Primeira frase. Segunda frase? Terceira frase! " * 20
+        segments = split_long_text(text, 100)
+        self.assertEqual("".join(segments), text)
+        self.assertTrue(all(len(segment) <= 100 for segment in segments))
+        # Cortes em fim de sentença
+        self.assertTrue(all(segment.rstrip()[-1] in ".?!" for segment in segments[:-1]))
+        self.assertEqual(split_long_text("curto", 100), ["curto"])
+
+    def test_segment_documents_batches_files(self):
+        texts = [synthetic_law(30, seed=1), "", synthetic_law(10, seed=2)]
+        self.assertEqual(segment_documents(texts), [semantic_segmentation_with_overlap(text) for text in texts])
+        # Documento dividido em trechos pequenos: mesmas sentenças, sem passar pelo max_length do SpaCy
+        sentences, _ = split_sentences_batch([texts[0]], batch_size=2, max_chars=2000)[0]
+        self.assertEqual(sentences, split_sentences(texts[0])[0])
+
+    def test_process_files(self):
+        results = process_files([self.files["txt"], self.files["docx"]])
+        self.assertEqual(len(results), 2)
+        self.assertIn("Texto de teste no TXT", " ".join(results[0][0]))
+        self.assertEqual(len(results[0][0]), len(results[0][1]))
+
     def test_process_file(self):
         chunks = process_file(self.files["txt"], self.cache)
         print(f"Chunks gerados para TXT: {chunks}")
@@ -0,0 +1,55 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.filtros_metadados import ChunkMetadata, article_numbers, filter_key
+
+
+class TestFiltrosMetadados(unittest.TestCase):
+    def setUp(self):
+        sources = ["arquivos/lei_14133.pdf"] * 3 + ["arquivos/tcu/acordao_1.pdf"] * 2
+        records = [{"page": 1, "articles": ["1"]}, {"page": 2, "articles": ["75"]}, {"page": 3},
+                   {"page": 1, "articles": ["75", "1048"]}, {}]
+        self.metadata = ChunkMetadata(sources, records)
+
+    def test_article_numbers(self):
+        self.assertEqual(article_numbers("Conforme o Art. 75 e o artigo 1.048, e novamente o art 75."), ["75", "1048"])
+        self.assertEqual(article_numbers("Parte 5 da arte"), [])
+
+    def test_filter_key(self):
+        self.assertIsNone(filter_key({}))
+        self.assertEqual(filter_key({"article": ["1.048"]}), (("article", ("1048",)),))
+        with self.assertRaises(ValueError):
+            filter_key({"autor": "x"})
+
+    def test_resolve(self):
+        self.assertIsNone(self.metadata.resolve(None))
+        self.assertEqual(self.metadata.resolve({"source": "*14133*"}).tolist(), [0, 1, 2])
+        self.assertEqual(self.metadata.resolve({"source": "acordao_1.pdf"}).tolist(), [3, 4])
+        self.assertEqual(self.metadata.resolve({"pages": (2, 3)}).tolist(), [1, 2])
+        self.assertEqual(self.metadata.resolve({"article": "75"}).tolist(), [1, 3])
+        self.assertEqual(self.metadata.resolve({"source": "*tcu*", "article": "75"}).tolist(), [3])
+        self.assertEqual(len(self.metadata.resolve({"source": "*inexistente*"})), 0)
+
+    def test_copies_match_filters(self):
+        # Chunk 0 também representa uma cópia descartada do decreto, na página 12
+        records = [{"page": 1, "copies": [{"source": "decreto.pdf", "page": 12}]}, {"page": 2}]
+        metadata = ChunkMetadata(["lei.pdf", "decreto.pdf"], records)
+        self.assertEqual(metadata.resolve({"source": "decreto.pdf"}).tolist(), [0, 1])
+        self.assertEqual(metadata.resolve({"source": "lei.pdf"}).tolist(), [0])
+        self.assertEqual(metadata.resolve({"pages": (10, 20)}).tolist(), [0])
+        self.assertEqual(metadata.resolve({"pages": (2, 2)}).tolist(), [1])
+        self.assertEqual(metadata.sources, ["decreto.pdf", "lei.pdf"])
+
+    def test_sources_only(self):
+        metadata = ChunkMetadata(["a.pdf", "b.pdf"])
+        self.assertEqual(metadata.resolve({"source": "b.pdf"}).tolist(), [1])
+        self.assertEqual(len(metadata.resolve({"pages": (1, 9)})), 0)
+        self.assertTrue(np.array_equal(metadata.resolve({"source": ["a.pdf", "b.pdf"]}), [0, 1]))
+
+
+if __name__ == "__main__":
+    unittest.main()
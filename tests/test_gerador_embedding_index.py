@@ -22,14 +22,34 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '.
 
 from app.gerador_embedding_index import (
     load_chunks, load_cache, save_cache, get_chunk_hash,
-    generate_embedding_single, generate_embeddings_gemini_api, build_index
+    generate_embedding_single, generate_embeddings_gemini_api, build_index,
+    update_or_build_index, update_or_build_shards, write_version, embed_missing, write_retry_queue,
+    load_previous_index, load_previous_shards
 )
+from app.versoes_artefatos import current_version, resolve_data_dir
+from app.indice_sharded import SHARDS_DIR, shard_rows
+from app.recuperacao import RetrievalEngine
+from app.indice_incremental import chunk_ids
+from app.provedores_embedding import EmbeddingProvider, HashingEmbeddingProvider, batches
 
-# Função mock global que simula a geração de embeddings e atualiza o cache
-def mock_embedding(chunk, cache):
-    embedding = np.array([0.1, 0.2, 0.3] * 256, dtype='float32')
-    cache[get_chunk_hash(chunk)] = embedding.tolist()
-    return embedding
+
+class FakeProvider(EmbeddingProvider):
+    """Provedor local: cada embedding é o tamanho do texto repetido, e as chamadas ficam registradas."""
+
+    name = "fake"
+    # Mesmas chaves de cache do Gemini, o provedor que ele simula
+    cache_namespace = ""
+
+    def __init__(self, max_batch_size=100, fail_on=None):
+        self.max_batch_size = max_batch_size
+        self.fail_on = fail_on
+        self.calls = []
+
+    def embed(self, texts):
+        self.calls.append(list(texts))
+        if self.fail_on in texts:
+            raise RuntimeError("falha simulada")
+        return np.array([[len(text)] * self.dimension for text in texts], dtype='float32')
 
 class TestGeradorEmbeddingIndex(unittest.TestCase):
     def setUp(self):
@@ -38,6 +58,7 @@ class TestGeradorEmbeddingIndex(unittest.TestCase):
 
         self.chunks_json = os.path.join(self.test_dir, "chunks.json")
         self.cache_file = os.path.join(self.test_dir, "embedding_cache.json")
+        self.cache_db = os.path.join(self.test_dir, "embedding_cache.sqlite")
         self.index_path = os.path.join(self.test_dir, "index.faiss")
         self.embeddings_path = os.path.join(self.test_dir, "embeddings.npy")
 
@@ -76,24 +97,50 @@ class TestGeradorEmbeddingIndex(unittest.TestCase):
         self.assertEqual(chunks, self.test_chunks)
 
     def test_load_cache_local(self):
-        with patch('app.gerador_embedding_index.CACHE_FILE', self.cache_file):
+        # O cache JSON antigo é migrado para o SQLite na primeira abertura
+        with patch('app.gerador_embedding_index.CACHE_FILE', self.cache_db), \
+                patch('app.gerador_embedding_index.LEGACY_CACHE_FILE', self.cache_file):
             cache = load_cache()
-            self.assertEqual(cache, self.test_cache)
+            self.assertEqual(len(cache), 1)
+            self.assertIn("hash1", cache)
+            self.assertTrue(np.allclose(cache["hash1"], self.test_cache["hash1"], atol=1e-3))
+            cache.close()
+
+    def test_save_cache_compacts(self):
+        with patch('app.gerador_embedding_index.CACHE_FILE', self.cache_db), \
+                patch('app.gerador_embedding_index.LEGACY_CACHE_FILE', self.cache_file):
+            cache = load_cache()
+            cache.update({"hash2": np.ones(768), "hash3": np.zeros(768)})
+            save_cache(cache, {"hash2", "hash3"})
+            cache.close()
+            cache = load_cache()
+            self.assertEqual(len(cache), 2)
+            self.assertNotIn("hash1", cache)
+            cache.close()
 
     @patch('google.cloud.storage.Client')
     def test_load_cache_cloud_run(self, mock_storage_client):
         os.environ["CLOUD_RUN"] = "true"
         test_cache = {"hash1": [0.1, 0.2, 0.3] * 256}
-        
+
+        # Só o cache JSON antigo existe no bucket
+        blobs = {name: MagicMock() for name in ("embedding_cache.sqlite", "embedding_cache.json")}
+        blobs["embedding_cache.sqlite"].exists.return_value = False
+        blobs["embedding_cache.json"].exists.return_value = True
+        def download(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(test_cache, f)
+        blobs["embedding_cache.json"].download_to_filename.side_effect = download
         mock_bucket = MagicMock()
-        mock_blob = MagicMock()
-        mock_blob.exists.return_value = True
-        mock_blob.download_as_string.return_value = json.dumps(test_cache).encode('utf-8')
-        mock_bucket.blob.return_value = mock_blob
+        mock_bucket.blob.side_effect = lambda name: blobs[name]
         mock_storage_client.return_value.get_bucket.return_value = mock_bucket
 
-        cache = load_cache()
-        self.assertEqual(cache, test_cache)
+        with patch('app.gerador_embedding_index.CACHE_FILE', self.cache_db):
+            cache = load_cache()
+            self.assertTrue(np.allclose(cache["hash1"], test_cache["hash1"], atol=1e-3))
+            save_cache(cache)
+            cache.close()
+        blobs["embedding_cache.sqlite"].upload_from_filename.assert_called_once_with(self.cache_db)
 
     def test_get_chunk_hash(self):
         chunk = "Texto de teste"
@@ -124,16 +171,67 @@ class TestGeradorEmbeddingIndex(unittest.TestCase):
         mock_embed_content.assert_not_called()
 
     def test_generate_embeddings_gemini_api(self):
+        cache = {get_chunk_hash(self.test_chunks[0]): [0.5] * 768}
+        provider = FakeProvider(max_batch_size=2)
+        chunks = self.test_chunks + ["Texto novo", self.test_chunks[1]]
+        embeddings = generate_embeddings_gemini_api(chunks, cache, provider)
+        self.assertEqual(embeddings.shape, (5, 768))
+        self.assertTrue(np.allclose(embeddings[0], 0.5))
+        self.assertTrue(np.allclose(embeddings[1], embeddings[4]))
+        self.assertTrue(np.allclose(embeddings[3], len("Texto novo")))
+        # Três textos fora do cache (um repetido) em lotes de até 2
+        self.assertEqual(sorted(provider.calls), [[self.test_chunks[1], self.test_chunks[2]], ["Texto novo"]])
+        self.assertEqual(len(cache), 4)
+
+    def test_generate_embeddings_failed_batch_not_cached(self):
+        provider = FakeProvider(max_batch_size=1, fail_on="Texto de teste 2")
         cache = {}
-        chunks = self.test_chunks
-        
-        # Simular execução sequencial para evitar problemas com multiprocessing no teste
-        with patch('app.gerador_embedding_index.generate_embedding_single', mock_embedding):
-            # Substituir Pool por uma execução simples para o teste
-            embeddings_list = [mock_embedding(chunk, cache) for chunk in chunks]
-            embeddings = np.array(embeddings_list, dtype='float32')
-            self.assertEqual(embeddings.shape, (3, 768))
-            self.assertEqual(len(cache), 3)
+        # Sem vetores nulos: a falha é levantada e os embeddings que deram certo ficam no cache
+        with self.assertRaises(RuntimeError):
+            generate_embeddings_gemini_api(self.test_chunks, cache, provider)
+        self.assertNotIn(get_chunk_hash("Texto de teste 2"), cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_embed_missing_isolates_failed_texts_and_resumes(self):
+        journal = os.path.join(self.test_dir, "embedding_progress.json")
+        provider = FakeProvider(max_batch_size=3, fail_on="Texto de teste 2")
+        cache = {}
+        failed = embed_missing(self.test_chunks, cache, provider, journal_path=journal)
+        # O lote que falhou é refeito texto a texto: só o texto problemático fica de fora
+        self.assertEqual(list(failed), [get_chunk_hash("Texto de teste 2")])
+        self.assertEqual(provider.calls[1:], [[self.test_chunks[0]], [self.test_chunks[1]], [self.test_chunks[2]]])
+        with open(journal, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        self.assertEqual((state["total"], state["embedded"], state["failed"], state["finished"]), (3, 2, 1, True))
+
+        # Na execução seguinte, só o chunk que falhou volta ao provedor
+        provider = FakeProvider(max_batch_size=3)
+        self.assertEqual(embed_missing(self.test_chunks, cache, provider, journal_path=journal), {})
+        self.assertEqual(provider.calls, [["Texto de teste 2"]])
+
+    def test_generate_embeddings_offline_provider_keys(self):
+        # Vetores de outro provedor ficam sob o seu namespace e não colidem com os do Gemini
+        cache = {get_chunk_hash(self.test_chunks[0]): [0.5] * 768}
+        provider = HashingEmbeddingProvider(dimension=32)
+        embeddings = generate_embeddings_gemini_api(self.test_chunks, cache, provider)
+        self.assertEqual(embeddings.shape, (3, 32))
+        self.assertIn(f"hashing-32:{get_chunk_hash(self.test_chunks[0])}", cache)
+        self.assertTrue(np.allclose(embeddings, provider.embed(self.test_chunks)))
+
+    def test_write_retry_queue_counts_attempts(self):
+        queue_path = os.path.join(self.test_dir, "embedding_retry_queue.json")
+        failed = {get_chunk_hash("Texto de teste 2"): "falha simulada"}
+        sources = ["a.pdf", "b.pdf", "c.pdf"]
+        write_retry_queue(queue_path, self.test_chunks, sources, failed)
+        queue = write_retry_queue(queue_path, self.test_chunks, sources, failed)
+        self.assertEqual(queue, [{"hash": get_chunk_hash("Texto de teste 2"), "source": "b.pdf",
+                                  "error": "falha simulada", "attempts": 2}])
+        self.assertEqual(write_retry_queue(queue_path, self.test_chunks, sources, {}), [])
+
+    def test_batches_respect_limits(self):
+        texts = ["a" * 10, "b" * 10, "c" * 30, "d", "e"]
+        self.assertEqual(list(batches(texts, 3, 25)), [[0, 1], [2], [3, 4]])
+        self.assertEqual(list(batches(texts, 2)), [[0, 1], [2, 3], [4]])
 
     def test_build_index_cpu(self):
         os.environ.pop("USE_FAISS_GPU", None)
@@ -142,6 +240,107 @@ class TestGeradorEmbeddingIndex(unittest.TestCase):
         self.assertIsInstance(index, faiss.IndexFlatL2)
         self.assertEqual(index.ntotal, 10)
 
+    def test_build_index_hnsw(self):
+        embeddings = np.random.rand(50, 768).astype('float32')
+        index = build_index(embeddings, index_type="hnsw")
+        self.assertIsInstance(index, faiss.IndexHNSWFlat)
+        self.assertEqual(index.ntotal, 50)
+
+    def test_build_index_ivf_trained_on_sample(self):
+        embeddings = np.random.rand(400, 768).astype('float32')
+        index = build_index(embeddings, index_type="ivf_flat", train_sample=200, nlist=4)
+        self.assertIsInstance(index, faiss.IndexIVFFlat)
+        self.assertTrue(index.is_trained)
+        self.assertEqual(index.ntotal, 400)
+
+    def test_build_index_with_ids(self):
+        embeddings = np.random.rand(10, 768).astype('float32')
+        ids = np.arange(100, 110, dtype='int64')
+        index = build_index(embeddings, index_type="flat", ids=ids)
+        self.assertIsInstance(index, faiss.IndexIDMap2)
+        self.assertEqual(index.search(embeddings[3:4], 1)[1][0][0], 103)
+
+    def test_update_or_build_index_embeds_only_new_chunks(self):
+        embeddings = np.random.rand(3, 768).astype('float32')
+        old_ids = chunk_ids(self.test_chunks)
+        previous = (build_index(embeddings, index_type="flat", ids=old_ids), old_ids, embeddings)
+        chunks = self.test_chunks[1:] + ["Texto de teste 4"]
+        new_vector = np.random.rand(1, 768).astype('float32')
+        with patch('app.gerador_embedding_index.generate_embeddings_gemini_api', return_value=new_vector) as mock_generate:
+            index, new_embeddings = update_or_build_index(chunks, chunk_ids(chunks), {}, previous)
+        mock_generate.assert_called_once_with(["Texto de teste 4"], {})
+        self.assertEqual(index.ntotal, 3)
+        self.assertTrue(np.allclose(new_embeddings[:2], embeddings[1:]))
+
+    def test_update_or_build_index_rebuilds_hnsw(self):
+        embeddings = np.random.rand(3, 768).astype('float32')
+        old_ids = chunk_ids(self.test_chunks)
+        previous = (build_index(embeddings, index_type="hnsw", ids=old_ids), old_ids, embeddings)
+        chunks = self.test_chunks[:2]
+        with patch('app.gerador_embedding_index.generate_embeddings_gemini_api') as mock_generate:
+            index, _ = update_or_build_index(chunks, chunk_ids(chunks), {}, previous)
+        mock_generate.assert_not_called()
+        self.assertEqual(index.ntotal, 2)
+
+    def test_update_or_build_shards(self):
+        embeddings = np.random.rand(3, 768).astype('float32')
+        old_ids = chunk_ids(self.test_chunks)
+        with patch('app.gerador_embedding_index.generate_embeddings_gemini_api', return_value=embeddings):
+            shards, _ = update_or_build_shards(self.test_chunks, old_ids, {}, 2)
+        self.assertEqual(sum(shard.ntotal for shard in shards), 3)
+        chunks = self.test_chunks[1:] + ["Texto de teste 4"]
+        new_ids = chunk_ids(chunks)
+        new_vector = np.random.rand(1, 768).astype('float32')
+        with patch('app.gerador_embedding_index.generate_embeddings_gemini_api', return_value=new_vector) as mock_generate:
+            shards, _ = update_or_build_shards(chunks, new_ids, {}, 2, (shards, old_ids, embeddings))
+        mock_generate.assert_called_once_with(["Texto de teste 4"], {})
+        self.assertEqual(sum(shard.ntotal for shard in shards), 3)
+        owner = int(new_ids[2] % 2)
+        self.assertEqual(shards[owner].search(new_vector, 1)[1][0][0], new_ids[2])
+
+    def test_write_version_publishes_loadable_artifacts(self):
+        embeddings = np.random.rand(3, 768).astype('float32')
+        ids = chunk_ids(self.test_chunks)
+        version, manifest = write_version(self.test_dir, self.test_chunks, ids, embeddings,
+                                          build_index(embeddings, index_type="flat", ids=ids), self.chunks_json)
+        self.assertEqual(current_version(self.test_dir), version)
+        self.assertIn("chunks.json", manifest["files"])
+        engine = RetrievalEngine(self.test_dir, rerank=False)
+        self.assertEqual(engine.search_chunks(embeddings[1:2], top_k=1, threshold=1e-3), ["Texto de teste 2"])
+
+    def test_write_version_from_filtered_chunks(self):
+        chunks = self.test_chunks[:2]
+        embeddings = np.random.rand(2, 768).astype('float32')
+        ids = chunk_ids(chunks)
+        version, manifest = write_version(self.test_dir, chunks, ids, embeddings,
+                                          build_index(embeddings, index_type="flat", ids=ids), None,
+                                          ["a.pdf", "b.pdf"], [{"page": 1}, {}])
+        self.assertIn("chunks.store", manifest["files"])
+        self.assertIn("chunks.sources.json", manifest["files"])
+        engine = RetrievalEngine(self.test_dir, rerank=False)
+        self.assertEqual(len(engine.chunks), 2)
+        self.assertEqual(engine.search_chunks(embeddings[1:2], top_k=1, threshold=1e-3, filters={"source": "b.pdf"}),
+                         [chunks[1]])
+
+    def test_previous_version_reused_only_with_same_provider(self):
+        embeddings = np.random.rand(3, 768).astype('float32')
+        ids = chunk_ids(self.test_chunks)
+        provider = HashingEmbeddingProvider(768)
+        shards = [build_index(embeddings[rows], index_type="flat", ids=ids[rows]) for rows in shard_rows(ids, 2)]
+        for index in (build_index(embeddings, index_type="flat", ids=ids), shards):
+            with patch('app.gerador_embedding_index.get_embedding_provider', return_value=provider):
+                write_version(self.test_dir, self.test_chunks, ids, embeddings, index, self.chunks_json)
+            version_dir = resolve_data_dir(self.test_dir)
+            paths = (os.path.join(version_dir, "chunk_ids.npy"), os.path.join(version_dir, "embeddings.npy"))
+            if isinstance(index, list):
+                load = lambda p: load_previous_shards(2, os.path.join(version_dir, SHARDS_DIR), *paths, provider=p)
+            else:
+                load = lambda p: load_previous_index(os.path.join(version_dir, "index.faiss"), *paths, provider=p)
+            self.assertIsNotNone(load(HashingEmbeddingProvider(768)))
+            # Outro provedor com a mesma dimensão misturaria espaços; outra dimensão quebraria o índice
+            self.assertIsNone(load(FakeProvider()))
+            self.assertIsNone(load(HashingEmbeddingProvider(64)))
+
     def test_build_index_gpu(self):
         # Se a função GPU não estiver disponível, ignore o teste
         if not hasattr(faiss, "StandardGpuResources"):
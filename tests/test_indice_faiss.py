@@ -0,0 +1,99 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import faiss
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.indice_faiss import (
+    create_index, train_index, set_search_params, exact_neighbors,
+    recall_at_k, index_report, default_nlist, default_pq_m, rescore
+)
+
+
+class TestIndiceFaiss(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.random((2000, 32)).astype('float32')
+
+    def test_create_index_types(self):
+        self.assertIsInstance(create_index(32, "flat"), faiss.IndexFlatL2)
+        self.assertIsInstance(create_index(32, "hnsw"), faiss.IndexHNSWFlat)
+        self.assertIsInstance(create_index(32, "ivf_flat", n_vectors=2000), faiss.IndexIVFFlat)
+        self.assertIsInstance(create_index(32, "ivf_pq", n_vectors=2000), faiss.IndexIVFPQ)
+        with self.assertRaises(ValueError):
+            create_index(32, "lsh")
+
+    def test_defaults(self):
+        self.assertEqual(default_nlist(2000), 51)
+        self.assertEqual(default_nlist(10), 1)
+        self.assertEqual(default_pq_m(768), 64)
+        self.assertEqual(default_pq_m(32), 32)
+
+    def test_train_on_sample(self):
+        index = create_index(32, "ivf_flat", nlist=8)
+        train_index(index, self.embeddings, sample_size=500)
+        self.assertTrue(index.is_trained)
+        index.add(self.embeddings)
+        self.assertEqual(index.ntotal, 2000)
+
+    def test_set_search_params(self):
+        ivf = create_index(32, "ivf_flat", nlist=8)
+        set_search_params(ivf, nprobe=4, ef_search=50)
+        self.assertEqual(ivf.nprobe, 4)
+        hnsw = create_index(32, "hnsw")
+        set_search_params(hnsw, nprobe=4, ef_search=50)
+        self.assertEqual(hnsw.hnsw.efSearch, 50)
+
+    def test_full_probe_matches_exact(self):
+        index = create_index(32, "ivf_flat", nlist=8)
+        train_index(index, self.embeddings)
+        index.add(self.embeddings)
+        set_search_params(index, nprobe=8)
+        queries = self.embeddings[:20]
+        ground_truth = exact_neighbors(self.embeddings, queries, 5)
+        found = index.search(queries, 5)[1]
+        self.assertEqual(recall_at_k(found, ground_truth), 1.0)
+
+    def test_rescore_recovers_exact_ranking(self):
+        embeddings = np.random.default_rng(0).normal(size=(1000, 64)).astype('float32')
+        index = create_index(64, "pq", pq_m=8, pq_nbits=6)
+        train_index(index, embeddings)
+        index.add(embeddings)
+        queries = embeddings[:50]
+        ground_truth = exact_neighbors(embeddings, queries, 5)
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "embeddings.npy")
+            np.save(path, embeddings)
+            vectors = np.load(path, mmap_mode='r')
+
+            compressed_recall = recall_at_k(index.search(queries, 5)[1], ground_truth)
+            _, candidates = index.search(queries, 50)
+            distances, indices = rescore(queries, candidates, vectors, 5)
+            self.assertGreater(recall_at_k(indices, ground_truth), compressed_recall)
+            self.assertTrue(np.all(np.diff(distances, axis=1) >= 0))
+            self.assertTrue(np.allclose(distances[:, 0], 0, atol=1e-4))
+            del vectors
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    def test_index_report(self):
+        report = index_report(self.embeddings, [
+            {"index_type": "flat"},
+            {"index_type": "ivf_flat", "nlist": 16, "nprobe": 2},
+            {"index_type": "hnsw", "ef_search": 32},
+        ], k=5, n_queries=20)
+        self.assertEqual(len(report), 3)
+        self.assertEqual(report[0]["recall_at_5"], 1.0)
+        for result in report:
+            self.assertIn("latency_ms_p95", result)
+            self.assertGreaterEqual(result["build_seconds"], 0)
+        self.assertEqual(report[1]["nprobe"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,100 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import faiss
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.indice_incremental import (
+    chunk_ids, IdTranslator, diff_ids, align_embeddings, update_index,
+    write_index_atomically, save_npy_atomically, is_id_mapped
+)
+
+
+class TestIndiceIncremental(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.random((30, 8)).astype('float32')
+        self.chunks = [f"Chunk {i}" for i in range(30)]
+        self.sources = ["lei_14133.pdf"] * 20 + ["in_65.pdf"] * 10
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def build(self, embeddings, ids):
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(8))
+        index.add_with_ids(embeddings, ids)
+        return index
+
+    def test_chunk_ids_stable_and_unique(self):
+        ids = chunk_ids(self.chunks, self.sources)
+        self.assertEqual(len(set(ids.tolist())), 30)
+        self.assertTrue((ids >= 0).all())
+        # Reordenar os chunks não muda os ids
+        reordered = chunk_ids(self.chunks[::-1], self.sources[::-1])
+        self.assertEqual(sorted(reordered.tolist()), sorted(ids.tolist()))
+        # Textos repetidos no mesmo arquivo recebem ids distintos; a origem também entra no id
+        repeated = chunk_ids(["Art. 1", "Art. 1", "Art. 1"], ["a.pdf", "a.pdf", "b.pdf"])
+        self.assertEqual(len(set(repeated.tolist())), 3)
+
+    def test_translator(self):
+        translator = IdTranslator(np.array([50, 10, 30]))
+        positions = translator.to_positions(np.array([[30, 50, -1], [10, 99, 0]]))
+        self.assertEqual(positions.tolist(), [[2, 0, -1], [1, -1, -1]])
+        self.assertEqual(IdTranslator([]).to_positions(np.array([1])).tolist(), [-1])
+
+    def test_update_replaces_changed_source(self):
+        old_ids = chunk_ids(self.chunks, self.sources)
+        index = self.build(self.embeddings, old_ids)
+        # in_65.pdf foi alterado: seus 10 chunks saem e entram 5 novos
+        new_chunks = self.chunks[:20] + [f"Novo {i}" for i in range(5)]
+        new_sources = self.sources[:20] + ["in_65.pdf"] * 5
+        new_ids = chunk_ids(new_chunks, new_sources)
+        new_vectors = np.random.default_rng(1).random((5, 8)).astype('float32')
+        embedded = []
+
+        def embed(positions):
+            embedded.append(positions.tolist())
+            return new_vectors
+
+        embeddings, removed, added = align_embeddings(old_ids, self.embeddings, new_ids, embed)
+        self.assertEqual(embedded, [list(range(20, 25))])
+        self.assertEqual(len(removed), 10)
+        self.assertTrue(np.allclose(embeddings[:20], self.embeddings[:20]))
+        update_index(index, removed, new_ids, added, embeddings)
+        self.assertEqual(index.ntotal, 25)
+        _, found = index.search(new_vectors[2:3], 1)
+        self.assertEqual(IdTranslator(new_ids).to_positions(found)[0][0], 22)
+        _, found = index.search(self.embeddings[25:26], 1)
+        self.assertNotIn(found[0][0], old_ids[20:].tolist())
+
+    def test_diff_ids_no_changes(self):
+        ids = chunk_ids(self.chunks, self.sources)
+        removed, added = diff_ids(ids, ids[::-1])
+        self.assertEqual(len(removed), 0)
+        self.assertEqual(len(added), 0)
+
+    def test_hnsw_removal_unsupported(self):
+        index = faiss.IndexIDMap2(faiss.IndexHNSWFlat(8, 8))
+        ids = np.arange(30, dtype='int64')
+        index.add_with_ids(self.embeddings, ids)
+        with self.assertRaises(RuntimeError):
+            update_index(index, ids[:2], ids[2:], np.array([], dtype='int64'), self.embeddings[2:])
+
+    def test_atomic_writes(self):
+        ids = chunk_ids(self.chunks, self.sources)
+        index_path = os.path.join(self.tmp_dir, "index.faiss")
+        ids_path = os.path.join(self.tmp_dir, "chunk_ids.npy")
+        write_index_atomically(self.build(self.embeddings, ids), index_path)
+        save_npy_atomically(ids_path, ids)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), ["chunk_ids.npy", "index.faiss"])
+        self.assertTrue(is_id_mapped(faiss.read_index(index_path)))
+        self.assertTrue(np.array_equal(np.load(ids_path), ids))
+
+
+if __name__ == "__main__":
+    unittest.main()
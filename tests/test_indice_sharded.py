@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import faiss
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.indice_sharded import (
+    ShardedIndex, merge_results, shard_rows, shard_path, shards_dir_for, write_manifest
+)
+from app.indice_incremental import chunk_ids
+from app.recuperacao import RetrievalEngine
+
+
+def write_shards(shards_dir, embeddings, ids, n_shards):
+    os.makedirs(shards_dir, exist_ok=True)
+    shards = []
+    for shard_no, rows in enumerate(shard_rows(ids, n_shards)):
+        shard = faiss.IndexIDMap2(faiss.IndexFlatL2(embeddings.shape[1]))
+        shard.add_with_ids(embeddings[rows], ids[rows])
+        faiss.write_index(shard, shard_path(shards_dir, shard_no))
+        shards.append(shard)
+    write_manifest(shards_dir, shards, "flat")
+
+
+class TestIndiceSharded(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.random((60, 8)).astype('float32')
+        self.chunks = [f"Chunk {i}" for i in range(60)]
+        self.ids = chunk_ids(self.chunks)
+        write_shards(shards_dir_for(self.data_dir), self.embeddings, self.ids, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def exact(self, queries, k):
+        flat = faiss.IndexIDMap2(faiss.IndexFlatL2(8))
+        flat.add_with_ids(self.embeddings, self.ids)
+        return flat.search(queries, k)
+
+    def test_merge_results(self):
+        distances, ids = merge_results([
+            (np.array([[0.1, 0.5]], dtype='float32'), np.array([[1, 2]])),
+            (np.array([[0.3, 3.4e38]], dtype='float32'), np.array([[7, -1]])),
+        ], 3)
+        self.assertEqual(ids.tolist(), [[1, 7, 2]])
+        self.assertTrue(np.allclose(distances, [[0.1, 0.3, 0.5]]))
+        _, ids = merge_results([(np.array([[0.1, 3.4e38]], dtype='float32'), np.array([[4, -1]]))], 2)
+        self.assertEqual(ids.tolist(), [[4, -1]])
+
+    def test_scatter_gather_matches_single_index(self):
+        for backend in ("thread", "process"):
+            index = ShardedIndex(shards_dir_for(self.data_dir), backend=backend)
+            try:
+                self.assertEqual(index.ntotal, 60)
+                distances, ids = index.search(self.embeddings[[4, 33]], 5)
+                expected_distances, expected_ids = self.exact(self.embeddings[[4, 33]], 5)
+                self.assertEqual(ids.tolist(), expected_ids.tolist())
+                self.assertTrue(np.allclose(distances, expected_distances))
+                allowed = self.ids[40:]
+                _, ids = index.search(self.embeddings[[4, 45]], 3, allowed_ids=allowed)
+                self.assertTrue(np.isin(ids, allowed).all())
+                self.assertEqual(ids[1][0], self.ids[45])
+            finally:
+                index.close()
+
+    def test_engine_uses_shards(self):
+        with open(os.path.join(self.data_dir, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f)
+        np.save(os.path.join(self.data_dir, "chunk_ids.npy"), self.ids)
+        engine = RetrievalEngine(self.data_dir, rerank=False)
+        self.assertIsInstance(engine.index, ShardedIndex)
+        self.assertEqual(engine.search_chunks(self.embeddings[17:18], top_k=3, threshold=1e-6), ["Chunk 17"])
+        engine.set_search_params(nprobe=4)
+        engine.index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,7 +2,11 @@ import unittest
 from unittest.mock import patch, Mock
 import numpy as np
 import requests  # Import necessário
-from app.models import modelo_x_response, modelo_y_response, embed_query, generate_response
+from app.models import (
+    modelo_x_response, modelo_y_response, embed_query, generate_response, query_embedding_cache,
+    semantic_cache_x
+)
+from app.recuperacao import get_engine, RetrievalEngine
 
 class TestModels(unittest.TestCase):
 
@@ -36,7 +40,8 @@ class TestModels(unittest.TestCase):
         mock_response.json.return_value = self.valid_response
         mock_post.return_value = mock_response
 
-        result = modelo_x_response("Teste", [])
+        with patch('app.models.embed_query', return_value=np.ones((1, 768), dtype='float32')):
+            result = modelo_x_response("Teste", [])
         self.assertEqual(result, "Resposta mockada")
         mock_post.assert_called_once()
 
@@ -91,6 +96,49 @@ class TestModels(unittest.TestCase):
         print(f"Result returned: '{result}'")  # Para depuração
         self.assertEqual(result, "Erro: Request timeout")  # Deve corresponder ao retorno exato
         mock_post.assert_called_once()
+    @patch('requests.post')
+    def test_semantic_cache_paraphrase(self, mock_post):
+        # Teste: pergunta de abertura parafraseada (embedding próximo) reutiliza a resposta sem chamar o LLM
+        mock_response = Mock()
+        mock_response.raise_for_status = Mock(return_value=None)
+        mock_response.json.return_value = self.valid_response
+        mock_post.return_value = mock_response
+        semantic_cache_x.flush()
+        base = np.ones((1, 768), dtype='float32')
+        with patch('app.models.embed_query', return_value=base):
+            self.assertEqual(modelo_x_response("O que é dispensa de licitação?", []), "Resposta mockada")
+        with patch('app.models.embed_query', return_value=base * 1.01):
+            self.assertEqual(modelo_x_response("O que significa dispensa de licitação?", []), "Resposta mockada")
+        mock_post.assert_called_once()
+        # Perguntas com histórico não usam o cache semântico
+        with patch('app.models.embed_query', return_value=base) as mock_embed:
+            modelo_x_response("O que é dispensa de licitação?", [{'remetente': 'user', 'conteudo': 'Oi'}])
+            mock_embed.assert_not_called()
+        self.assertEqual(mock_post.call_count, 2)
+
+    def test_semantic_cache_y_flushed_on_reload(self):
+        from app.models import semantic_cache_y
+        # O módulo registra a limpeza no motor global; a recarga roda num motor local para não alterar o global
+        self.assertIn(semantic_cache_y.flush, get_engine()._reload_listeners)
+        semantic_cache_y.put(np.ones((1, 768), dtype='float32'), "Resposta antiga")
+        engine = RetrievalEngine(data_dir="inexistente")
+        engine.add_reload_listener(semantic_cache_y.flush)
+        with patch.object(engine, '_load_artifacts', return_value=Mock()):
+            engine.reload()
+        self.assertEqual(len(semantic_cache_y), 0)
+
+    @patch('google.generativeai.embed_content')
+    def test_embed_query_cache(self, mock_embed_content):
+        # Teste: consultas repetidas (mesmo texto normalizado) não chamam a API novamente
+        query_embedding_cache.clear()
+        mock_embed_content.return_value = {'embedding': [0.5] * 768}
+        first = embed_query("Dispensa de licitação")
+        second = embed_query("  dispensa de LICITAÇÃO ")
+        self.assertTrue(np.allclose(first, second))
+        self.assertEqual(second.shape, (1, 768))
+        mock_embed_content.assert_called_once()
+        self.assertEqual(query_embedding_cache.stats()["hits"], 1)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest.mock import patch
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.ocr_paginas import page_runs, ocr_pdf_pages
+
+
+def fake_convert(file_path, dpi, grayscale, first_page, last_page, output_folder, paths_only, thread_count):
+    """Grava uma "imagem" por página contendo o número da página (base 1)."""
+    paths = []
+    for page in range(first_page, last_page + 1):
+        path = os.path.join(output_folder, f"pagina-{page:04d}.ppm")
+        with open(path, "w") as f:
+            f.write(str(page))
+        paths.append(path)
+    return paths
+
+
+class TestOcrPaginas(unittest.TestCase):
+    def test_page_runs(self):
+        self.assertEqual(page_runs([5, 1, 2, 3, 7, 8, 2]), [(1, 3), (5, 5), (7, 8)])
+        self.assertEqual(page_runs([]), [])
+
+    @patch('app.ocr_paginas.pytesseract.image_to_string')
+    @patch('app.ocr_paginas.convert_from_path', side_effect=fake_convert)
+    def test_rasterizes_once_per_run_and_ocr_in_parallel(self, mock_convert, mock_ocr):
+        state = {"active": 0, "peak": 0}
+        lock = threading.Lock()
+
+        def ocr(path, lang):
+            with lock:
+                state["active"] += 1
+                state["peak"] = max(state["peak"], state["active"])
+            time.sleep(0.02)
+            with lock:
+                state["active"] -= 1
+            with open(path) as f:
+                page = f.read()
+            if page == "7":
+                raise RuntimeError("falha simulada")
+            return f"texto {page}"
+
+        mock_ocr.side_effect = ocr
+        texts, timings = ocr_pdf_pages("edital.pdf", [0, 1, 2, 5, 6, 7], dpi=150, grayscale=True, workers=3)
+        # Duas sequências contíguas: duas chamadas de rasterização em vez de uma por página
+        self.assertEqual([(c.kwargs["first_page"], c.kwargs["last_page"]) for c in mock_convert.call_args_list],
+                         [(1, 3), (6, 8)])
+        self.assertEqual(mock_convert.call_args.kwargs["dpi"], 150)
+        self.assertEqual(texts[0], "texto 1\n")
+        self.assertEqual(texts[7], "texto 8\n")
+        # Página com erro fica vazia e sem tempo registrado
+        self.assertEqual(texts[6], "")
+        self.assertEqual(sorted(timings), [0, 1, 2, 5, 7])
+        self.assertLessEqual(state["peak"], 3)
+        self.assertGreater(state["peak"], 1)
+
+    @patch('app.ocr_paginas.convert_from_path', side_effect=RuntimeError("pdftoppm ausente"))
+    def test_rasterization_failure(self, mock_convert):
+        texts, timings = ocr_pdf_pages("edital.pdf", [0, 1])
+        self.assertEqual(texts, {0: "", 1: ""})
+        self.assertEqual(timings, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
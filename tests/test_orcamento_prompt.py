@@ -0,0 +1,48 @@
+import os
+import sys
+import unittest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.orcamento_prompt import build_prompt, count_tokens, truncate_to_tokens
+
+
+class TestOrcamentoPrompt(unittest.TestCase):
+    def test_count_and_truncate(self):
+        self.assertEqual(count_tokens("Art. 75, dispensa"), 6)
+        self.assertEqual(count_tokens("licitações"), 2)
+        self.assertEqual(truncate_to_tokens("um dois três quatro", 2), "um dois")
+        self.assertEqual(truncate_to_tokens("um dois", 5), "um dois")
+
+    def test_everything_fits(self):
+        prompt = build_prompt("Instruções.", "O que é dispensa?", ["Chunk A", "Chunk B"],
+                              [("Usuário", "Oi"), ("Modelo Y", "Olá")], budget=1000)
+        self.assertIn("Chunk A\nChunk B", prompt.text)
+        self.assertIn("Usuário: Oi\nModelo Y: Olá", prompt.text)
+        self.assertTrue(prompt.text.startswith("Instruções."))
+        self.assertTrue(prompt.text.endswith("O que é dispensa?"))
+        self.assertEqual(prompt.truncated, {"chunks_dropped": 0, "turns_dropped": 0, "query_truncated": False})
+        self.assertEqual(prompt.tokens, count_tokens(prompt.text))
+
+    def test_priority_under_budget(self):
+        chunks = ["relevante " * 20, "grande " * 200, "curto"]
+        history = [("Usuário", "antigo " * 50), ("Modelo Y", "recente")]
+        prompt = build_prompt("Instruções.", "Pergunta?", chunks, history, budget=80)
+        self.assertLessEqual(prompt.tokens, 80)
+        self.assertIn("relevante", prompt.text)
+        self.assertIn("curto", prompt.text)
+        self.assertNotIn("grande", prompt.text)
+        self.assertIn("Modelo Y: recente", prompt.text)
+        self.assertNotIn("antigo", prompt.text)
+        self.assertEqual(prompt.truncated, {"chunks_dropped": 1, "turns_dropped": 1, "query_truncated": False})
+
+    def test_query_truncated_before_dropping_instructions(self):
+        prompt = build_prompt("Instruções.", "palavra " * 100, ["Chunk"], budget=30)
+        self.assertTrue(prompt.text.startswith("Instruções."))
+        self.assertTrue(prompt.truncated["query_truncated"])
+        self.assertEqual(prompt.truncated["chunks_dropped"], 1)
+        self.assertLessEqual(prompt.tokens, 30)
+
+
+if __name__ == "__main__":
+    unittest.main()
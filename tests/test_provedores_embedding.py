@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import threading
+import unittest
+from unittest.mock import patch
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.provedores_embedding import (
+    EmbeddingProvider, GeminiEmbeddingProvider, HashingEmbeddingProvider, embed_in_batches, get_embedding_provider
+)
+
+
+class SlowProvider(EmbeddingProvider):
+    """Provedor local que simula latência de rede e registra o pico de lotes simultâneos."""
+
+    name = "lento"
+    dimension = 4
+    max_batch_size = 3
+
+    def __init__(self):
+        self.active = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def embed(self, texts):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        if "erro" in texts:
+            raise RuntimeError("falha simulada")
+        return np.array([[float(t)] * self.dimension for t in texts], dtype='float32')
+
+
+class TestProvedoresEmbedding(unittest.TestCase):
+    def test_bounded_concurrency_and_order(self):
+        provider = SlowProvider()
+        texts = [str(i) for i in range(30)]
+        results = list(embed_in_batches(texts, provider, concurrency=3))
+        self.assertEqual(len(results), 10)
+        self.assertLessEqual(provider.peak, 3)
+        self.assertGreater(provider.peak, 1)
+        for positions, vectors in results:
+            self.assertEqual(vectors[:, 0].tolist(), [float(texts[i]) for i in positions])
+
+    def test_failed_batch_reported(self):
+        texts = ["1", "2", "3", "erro", "5"]
+        results = dict((tuple(p), r) for p, r in embed_in_batches(texts, SlowProvider(), concurrency=2))
+        self.assertIsInstance(results[(3, 4)], RuntimeError)
+        self.assertEqual(results[(0, 1, 2)].shape, (3, 4))
+
+    def test_hashing_provider_is_deterministic_and_normalized(self):
+        provider = HashingEmbeddingProvider(dimension=64)
+        texts = ["Dispensa de licitação", "DISPENSA de licitacao", "Pregão eletrônico", ""]
+        vectors = provider.embed(texts)
+        self.assertEqual(vectors.shape, (4, 64))
+        # Sem acentos e em minúsculas: as duas grafias viram o mesmo vetor
+        self.assertTrue(np.allclose(vectors[0], vectors[1]))
+        self.assertTrue(np.allclose(np.linalg.norm(vectors[:3], axis=1), 1.0))
+        self.assertFalse(np.any(vectors[3]))
+        self.assertTrue(np.array_equal(vectors, HashingEmbeddingProvider(dimension=64).embed(texts)))
+        self.assertEqual(provider.cache_namespace, "hashing-64")
+
+    @patch('app.provedores_embedding.genai.embed_content', return_value={'embedding': [[0.5] * 4]})
+    def test_gemini_client_retry_disabled(self, mock_embed_content):
+        # As novas tentativas são do controlador de taxa: o retry do cliente fica desligado com ou sem prazo
+        provider = GeminiEmbeddingProvider(api_key="fake_key")
+        provider.embed(["Dispensa de licitação"])
+        self.assertEqual(mock_embed_content.call_args.kwargs["request_options"], {"retry": None})
+        provider.embed(["Dispensa de licitação"], deadline=2.0)
+        self.assertEqual(mock_embed_content.call_args.kwargs["request_options"], {"retry": None, "timeout": 2.0})
+
+    def test_get_embedding_provider(self):
+        provider = get_embedding_provider("hashing")
+        self.assertIs(provider, get_embedding_provider("hashing"))
+        self.assertEqual(get_embedding_provider("gemini").cache_namespace, "")
+        with self.assertRaises(ValueError):
+            get_embedding_provider("inexistente")
+
+
+if __name__ == "__main__":
+    unittest.main()
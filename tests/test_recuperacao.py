@@ -0,0 +1,225 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+import numpy as np
+import faiss
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.recuperacao import RetrievalEngine, search_chunks, search_batch, get_query_embedding
+from app.provedores_embedding import HashingEmbeddingProvider
+from app.chunk_store import ChunkStore, write_chunk_store, write_chunk_sources, write_chunk_metadata
+from app.bm25 import BM25Index
+from app.indice_incremental import chunk_ids
+
+
+def write_artifacts(data_dir, embeddings, chunks):
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    faiss.write_index(index, os.path.join(data_dir, "index.faiss"))
+    with open(os.path.join(data_dir, "chunks.json"), "w", encoding="utf-8") as f:
+        json.dump(chunks, f, ensure_ascii=False)
+
+
+class TestRetrievalEngine(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.random((20, 8)).astype('float32')
+        self.chunks = [f"Chunk {i}" for i in range(20)]
+        write_artifacts(self.data_dir, self.embeddings, self.chunks)
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_query_embedding_offline_provider(self):
+        # Com um provedor local não há configuração do Gemini, nem GEMINI_API_KEY exigida
+        provider = HashingEmbeddingProvider(dimension=16)
+        with patch.dict(os.environ, {}, clear=False), \
+                patch('app.recuperacao.get_embedding_provider', return_value=provider), \
+                patch('google.generativeai.configure') as mock_configure:
+            os.environ.pop("GEMINI_API_KEY", None)
+            embedding = get_query_embedding("Dispensa de licitação")
+        self.assertEqual(embedding.shape, (1, 16))
+        mock_configure.assert_not_called()
+
+    def test_artifacts_loaded_once(self):
+        engine = RetrievalEngine(self.data_dir)
+        with patch('app.recuperacao.faiss.read_index', wraps=faiss.read_index) as mock_read:
+            for _ in range(3):
+                engine.search(self.embeddings[0:1], top_k=3)
+            self.assertEqual(mock_read.call_count, 1)
+
+    def test_search_chunks_returns_nearest(self):
+        engine = RetrievalEngine(self.data_dir)
+        result = engine.search_chunks(self.embeddings[5:6], top_k=3, threshold=1e-6)
+        self.assertEqual(result, ["Chunk 5"])
+
+    def test_reload_picks_up_new_artifacts(self):
+        engine = RetrievalEngine(self.data_dir).load()
+        self.assertEqual(engine.index.ntotal, 20)
+        write_artifacts(self.data_dir, self.embeddings[:5], self.chunks[:5])
+        self.assertEqual(engine.index.ntotal, 20)
+        engine.reload()
+        self.assertEqual(engine.index.ntotal, 5)
+        self.assertEqual(engine.chunks, self.chunks[:5])
+
+    def test_missing_artifacts(self):
+        engine = RetrievalEngine(os.path.join(self.data_dir, "inexistente"))
+        with self.assertRaises(FileNotFoundError):
+            engine.load()
+
+    def test_search_chunks_uses_shared_engine(self):
+        engine = RetrievalEngine(self.data_dir)
+        with patch('app.recuperacao.get_engine', return_value=engine), \
+                patch('app.models.embed_query', return_value=self.embeddings[2:3]):
+            result = search_chunks("consulta", top_k=1)
+        self.assertEqual(result, ["Chunk 2"])
+
+    def test_search_batch_matches_single_queries(self):
+        engine = RetrievalEngine(self.data_dir)
+        queries = self.embeddings[[1, 7, 13]]
+        batch = engine.search_batch(queries, top_k=4)
+        self.assertEqual(len(batch), 3)
+        for query, results in zip(queries, batch):
+            distances, indices = engine.search(query.reshape(1, -1), top_k=4)
+            self.assertEqual([r["id"] for r in results], indices[0].tolist())
+            self.assertTrue(np.allclose([r["distance"] for r in results], distances[0]))
+            self.assertEqual(results[0]["text"], self.chunks[results[0]["id"]])
+
+    def test_search_batch_embeds_queries_together(self):
+        engine = RetrievalEngine(self.data_dir)
+        with patch('app.recuperacao.get_engine', return_value=engine), \
+                patch('app.models.embed_queries', return_value=self.embeddings[[3, 4]]) as mock_embed:
+            batch = search_batch(["consulta 1", "consulta 2"], top_k=1)
+        mock_embed.assert_called_once_with(["consulta 1", "consulta 2"])
+        self.assertEqual([results[0]["id"] for results in batch], [3, 4])
+
+    def test_rescore_with_compressed_index(self):
+        index = faiss.IndexScalarQuantizer(8, faiss.ScalarQuantizer.QT_8bit)
+        index.train(self.embeddings)
+        index.add(self.embeddings)
+        faiss.write_index(index, os.path.join(self.data_dir, "index.faiss"))
+        np.save(os.path.join(self.data_dir, "embeddings.npy"), self.embeddings)
+        engine = RetrievalEngine(self.data_dir, rescore_factor=4)
+        self.assertIsInstance(engine.artifacts().vectors, np.memmap)
+        distances, indices = engine.search(self.embeddings[9:10], top_k=3)
+        self.assertEqual(indices[0][0], 9)
+        self.assertAlmostEqual(float(distances[0][0]), 0.0, places=5)
+
+    def test_prefers_binary_chunk_store(self):
+        write_chunk_store([f"Store {i}" for i in range(20)], os.path.join(self.data_dir, "chunks.store"))
+        engine = RetrievalEngine(self.data_dir)
+        self.assertIsInstance(engine.chunks, ChunkStore)
+        result = engine.search_chunks(self.embeddings[4:5], top_k=1, threshold=1e-6)
+        self.assertEqual(result, ["Store 4"])
+
+    def test_hybrid_search_fuses_lexical_results(self):
+        chunks = list(self.chunks)
+        chunks[11] = "Art. 75 trata da dispensa de licitação"
+        write_artifacts(self.data_dir, self.embeddings, chunks)
+        BM25Index.build(chunks).save(os.path.join(self.data_dir, "bm25.npz"))
+        engine = RetrievalEngine(self.data_dir)
+        result = engine.search_hybrid("art. 75", self.embeddings[6:7], top_k=2, threshold=1e-6)
+        self.assertEqual(set(result), {"Chunk 6", chunks[11]})
+
+    def test_lexical_fallback_without_embedding(self):
+        chunks = list(self.chunks)
+        chunks[3] = "Dispensa de licitação"
+        write_artifacts(self.data_dir, self.embeddings, chunks)
+        BM25Index.build(chunks).save(os.path.join(self.data_dir, "bm25.npz"))
+        engine = RetrievalEngine(self.data_dir, hybrid=False)
+        self.assertEqual(engine.search_hybrid("dispensa", np.zeros((1, 8), dtype='float32'), top_k=3), [chunks[3]])
+        self.assertEqual(engine.search_hybrid("dispensa", self.embeddings[0:1], top_k=1, threshold=1e-6), ["Chunk 0"])
+
+    def test_no_context_without_embedding_or_lexical_index(self):
+        engine = RetrievalEngine(self.data_dir)
+        self.assertEqual(engine.search_hybrid("dispensa", np.zeros((1, 8), dtype='float32')), [])
+
+    def test_id_mapped_index_translates_to_positions(self):
+        ids = chunk_ids(self.chunks)
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(8))
+        index.add_with_ids(self.embeddings, ids)
+        faiss.write_index(index, os.path.join(self.data_dir, "index.faiss"))
+        with self.assertRaises(FileNotFoundError):
+            RetrievalEngine(self.data_dir).load()
+        np.save(os.path.join(self.data_dir, "chunk_ids.npy"), ids)
+        engine = RetrievalEngine(self.data_dir)
+        distances, indices = engine.search(self.embeddings[7:8], top_k=2)
+        self.assertEqual(indices[0][0], 7)
+        self.assertEqual(engine.search_chunks(self.embeddings[7:8], top_k=2, threshold=1e-6), ["Chunk 7"])
+
+    def write_metadata(self):
+        chunks_json = os.path.join(self.data_dir, "chunks.json")
+        write_chunk_sources(["lei_14133.pdf"] * 10 + ["acordao_tcu.pdf"] * 10, chunks_json)
+        write_chunk_metadata([{"page": i + 1} for i in range(20)], chunks_json)
+
+    def test_filters_require_metadata(self):
+        engine = RetrievalEngine(self.data_dir, rerank=False)
+        with self.assertRaises(ValueError):
+            engine.search(self.embeddings[0:1], top_k=3, filters={"source": "*tcu*"})
+
+    def test_filtered_search_exact_subset_and_selector(self):
+        np.save(os.path.join(self.data_dir, "embeddings.npy"), self.embeddings)
+        self.write_metadata()
+        for exact_max in (100, 0):
+            engine = RetrievalEngine(self.data_dir, rerank=False, filter_exact_max=exact_max)
+            _, indices = engine.search(self.embeddings[3:4], top_k=5, filters={"source": "*tcu*"})
+            self.assertTrue(all(10 <= idx < 20 for idx in indices[0]))
+            _, expected = engine.search(self.embeddings[3:4], top_k=20)
+            self.assertEqual(indices[0].tolist(), [idx for idx in expected[0] if idx >= 10][:5])
+            result = engine.search_chunks(self.embeddings[3:4], top_k=3, threshold=1e-6, filters={"pages": (4, 4)})
+            self.assertEqual(result, ["Chunk 3"])
+
+    def test_filtered_search_ivf_and_id_mapped(self):
+        rng = np.random.default_rng(1)
+        embeddings = rng.random((200, 8)).astype('float32')
+        chunks = [f"Chunk {i}" for i in range(200)]
+        ids = chunk_ids(chunks)
+        quantizer = faiss.IndexFlatL2(8)
+        index = faiss.IndexIDMap2(faiss.IndexIVFFlat(quantizer, 8, 4))
+        index.train(embeddings)
+        index.add_with_ids(embeddings, ids)
+        faiss.write_index(index, os.path.join(self.data_dir, "index.faiss"))
+        np.save(os.path.join(self.data_dir, "chunk_ids.npy"), ids)
+        chunks_json = os.path.join(self.data_dir, "chunks.json")
+        with open(chunks_json, "w", encoding="utf-8") as f:
+            json.dump(chunks, f)
+        write_chunk_sources(["a.pdf"] * 100 + ["b.pdf"] * 100, chunks_json)
+        engine = RetrievalEngine(self.data_dir, rerank=False, nprobe=4)
+        _, indices = engine.search(embeddings[150:151], top_k=5, filters={"source": "b.pdf"})
+        self.assertEqual(indices[0][0], 150)
+        self.assertTrue(all(100 <= idx < 200 for idx in indices[0]))
+        _, indices = engine.search(embeddings[150:151], top_k=5, filters={"source": "a.pdf"})
+        self.assertTrue(all(0 <= idx < 100 for idx in indices[0]))
+
+    def test_hybrid_search_filters_lexical_results(self):
+        chunks = [f"Chunk {i} sobre dispensa" if i in (2, 15) else f"Chunk {i}" for i in range(20)]
+        write_artifacts(self.data_dir, self.embeddings, chunks)
+        BM25Index.build(chunks).save(os.path.join(self.data_dir, "bm25.npz"))
+        self.write_metadata()
+        engine = RetrievalEngine(self.data_dir, rerank=False)
+        result = engine.search_hybrid("dispensa", None, top_k=5, filters={"source": "*tcu*"})
+        self.assertEqual(result, ["Chunk 15 sobre dispensa"])
+
+    def test_rerank_shrinks_context(self):
+        np.save(os.path.join(self.data_dir, "embeddings.npy"), self.embeddings)
+        chunks = list(self.chunks)
+        base = " ".join(f"Sentença {i} da lei de licitações e contratos." for i in range(10))
+        for i in range(20):
+            chunks[i] = base + f" Complemento {i}."
+        write_artifacts(self.data_dir, self.embeddings, chunks)
+        engine = RetrievalEngine(self.data_dir, rerank=True, context_k=3, hybrid=False)
+        self.assertIsInstance(engine.artifacts().vectors, np.memmap)
+        result = engine.search_hybrid("licitações", self.embeddings[0:1], top_k=10, threshold=10.0)
+        self.assertEqual(len(result), 1)
+        without_rerank = RetrievalEngine(self.data_dir, rerank=False, hybrid=False)
+        self.assertEqual(len(without_rerank.search_hybrid("licitações", self.embeddings[0:1], top_k=10, threshold=10.0)), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.remove_duplicates import (
+    canonical_positions, unique_positions, merge_duplicates, remove_duplicates, shingle_hashes, jaccard
+)
+from app.chunk_store import write_chunk_sources, read_chunk_sources, write_chunk_metadata, read_chunk_metadata
+from app.filtros_metadados import ChunkMetadata
+
+
+def lei(variant=""):
+    return ("Art. 75. É dispensável a licitação para contratação que envolva valores inferiores a "
+            "100 mil reais, no caso de obras e serviços de engenharia ou de serviços de manutenção "
+            "de veículos automotores, conforme o regulamento aplicável e as normas vigentes" + variant)
+
+
+class TestRemoveDuplicates(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        vocabulary = [f"palavra{i}" for i in range(500)]
+        self.distinct = [" ".join(rng.choice(vocabulary, 60)) for _ in range(50)]
+
+    def test_jaccard(self):
+        a = shingle_hashes(lei())
+        self.assertEqual(jaccard(a, a), 1.0)
+        self.assertEqual(jaccard(a, shingle_hashes("")), 0.0)
+
+    def test_near_duplicates_grouped(self):
+        chunks = [lei(), "Texto sem relação com a lei de licitações e contratos administrativos."]
+        chunks += [lei(" (Redação dada pela Lei nº 14.770)."), lei(), lei().upper()]
+        canonical = canonical_positions(chunks, threshold=0.8)
+        self.assertEqual(canonical.tolist(), [0, 1, 0, 0, 0])
+        self.assertEqual(unique_positions(chunks, threshold=0.8).tolist(), [0, 1])
+
+    def test_distinct_chunks_kept(self):
+        self.assertEqual(len(unique_positions(self.distinct, threshold=0.8)), len(self.distinct))
+
+    def test_threshold_zero_removes_only_exact_copies(self):
+        chunks = [lei(), lei(" Parágrafo único."), lei()]
+        self.assertEqual(unique_positions(chunks, threshold=0).tolist(), [0, 1])
+
+    def test_shared_chunk_found_by_each_source(self):
+        shared = lei()
+        chunks = [shared, self.distinct[0], self.distinct[1], lei(" (Redação dada pela Lei nº 14.770)."), shared]
+        sources = ["lei_14133.pdf", "lei_14133.pdf", "decreto_11246.pdf", "decreto_11246.pdf", "lei_14133.pdf"]
+        metadata = [{"page": 3, "articles": ["75"]}, {"page": 4}, {"page": 1}, {"page": 7, "articles": ["75", "14770"]},
+                    {"page": 3}]
+        keep, merged = merge_duplicates(chunks, sources, metadata, threshold=0.8)
+        # A quase-duplicata do outro arquivo sai do índice; a cópia na mesma página não acrescenta nada
+        self.assertEqual(keep.tolist(), [0, 1, 2])
+        self.assertEqual(merged[0], {"page": 3, "articles": ["75", "14770"],
+                                     "copies": [{"source": "decreto_11246.pdf", "page": 7}]})
+        self.assertEqual(merged[1:], metadata[1:3])
+        index = ChunkMetadata([sources[i] for i in keep], merged)
+        kept_chunks = [chunks[i] for i in keep]
+        for filters in ({"source": "*14133*"}, {"source": "*11246*"}, {"pages": (7, 7)}, {"article": "14770"}):
+            self.assertIn(shared, [kept_chunks[i] for i in index.resolve(filters)], filters)
+        self.assertEqual(merge_duplicates(chunks)[1], None)
+
+    def test_remove_duplicates_keeps_sources(self):
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            input_path = os.path.join(tmp_dir, "chunks.json")
+            output_path = os.path.join(tmp_dir, "chunks_unique.json")
+            chunks = [lei(), self.distinct[0], lei(" Incluído pela Lei nº 14.770.")]
+            with open(input_path, "w", encoding="utf-8") as f:
+                json.dump(chunks, f)
+            write_chunk_sources(["lei.pdf", "outro.pdf", "lei_compilada.pdf"], input_path)
+            write_chunk_metadata([{"page": 2}, {"page": 1}, {"page": 9}], input_path)
+            remove_duplicates(input_path, output_path)
+            with open(output_path, "r", encoding="utf-8") as f:
+                self.assertEqual(json.load(f), chunks[:2])
+            self.assertEqual(read_chunk_sources(output_path), ["lei.pdf", "outro.pdf"])
+            self.assertEqual(read_chunk_metadata(output_path),
+                             [{"page": 2, "copies": [{"source": "lei_compilada.pdf", "page": 9}]}, {"page": 1}])
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.rerank import mmr, rerank, shingles, overlap_ratio
+
+
+class TestRerank(unittest.TestCase):
+    def setUp(self):
+        sentences = [f"Sentença número {i} sobre contratações públicas e licitações." for i in range(12)]
+        # Chunks 0 e 1 compartilham metade das sentenças, como na janela de sobreposição do chunker
+        self.chunks = [
+            " ".join(sentences[0:6]),
+            " ".join(sentences[3:9]),
+            "O pregão eletrônico é a modalidade preferencial para bens comuns.",
+            "A dispensa de licitação está prevista no art. 75 da Lei 14.133.",
+        ]
+
+    def test_overlap_ratio(self):
+        self.assertGreaterEqual(overlap_ratio(shingles(self.chunks[0]), shingles(self.chunks[1])), 0.4)
+        self.assertEqual(overlap_ratio(shingles(self.chunks[2]), shingles(self.chunks[3])), 0.0)
+        self.assertEqual(overlap_ratio(set(), shingles(self.chunks[3])), 0.0)
+
+    def test_mmr_prefers_diverse_candidates(self):
+        query = np.array([1.0, 0.0, 0.0])
+        candidates = np.array([[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7]])
+        self.assertEqual(mmr(query, candidates, 2, lambda_=0.5), [0, 2])
+        self.assertEqual(mmr(query, candidates, 2, lambda_=1.0), [0, 1])
+        self.assertEqual(mmr(query, np.zeros((0, 3)), 2), [])
+
+    def test_rerank_drops_overlapping_neighbours(self):
+        result = rerank([0, 1, 2, 3], self.chunks, k=4, overlap_threshold=0.4)
+        self.assertEqual(result, [0, 2, 3])
+
+    def test_rerank_drops_near_duplicate_vectors(self):
+        vectors = np.array([[1.0, 0.0], [0.999, 0.01], [0.0, 1.0], [0.6, 0.8]], dtype='float32')
+        result = rerank([0, 1, 2, 3], ["a", "b", "c", "d"], k=3, query_embedding=np.array([[1.0, 0.2]]), vectors=vectors)
+        self.assertEqual(len({0, 1} & set(result)), 1)
+        self.assertIn(result[0], (0, 1))
+        self.assertEqual(len(result), 3)
+
+    def test_rerank_limits_to_k(self):
+        self.assertEqual(rerank([3, 2], self.chunks, k=1), [3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -4,6 +4,7 @@ os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 import unittest
 import json
+from unittest.mock import patch
 from app.main import app, db, Conversa, MensagemX, MensagemY, Avaliacao, Proficiencia
 
 class TestRoutes(unittest.TestCase):
@@ -20,6 +21,14 @@ class TestRoutes(unittest.TestCase):
             db.session.remove()
             db.drop_all()
 
+    def test_admin_token_required(self):
+        with patch.dict(os.environ, {'ADMIN_TOKEN': 'segredo'}):
+            self.assertEqual(self.client.get('/admin/taxas').status_code, 403)
+            self.assertEqual(self.client.get('/admin/taxas', headers={'X-Admin-Token': 'errado'}).status_code, 403)
+            self.assertEqual(self.client.get('/admin/taxas', headers={'X-Admin-Token': 'segredo'}).status_code, 200)
+        with patch.dict(os.environ, {'ADMIN_TOKEN': ''}):
+            self.assertEqual(self.client.post('/admin/reload', headers={'X-Admin-Token': ''}).status_code, 403)
+
     def test_index_route(self):
         response = self.client.get('/')
         self.assertEqual(response.status_code, 200)
@@ -0,0 +1,116 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import faiss
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.versoes_artefatos import (
+    create_version_dir, write_version_manifest, publish_version, current_version, resolve_data_dir,
+    prune_versions, verify_version, version_dir_for, VersionWatcher
+)
+from app.recuperacao import RetrievalEngine
+from app.chunk_store import write_chunk_store
+
+
+def write_version(data_dir, embeddings, chunks, store=False):
+    version, version_dir = create_version_dir(data_dir)
+    index = faiss.IndexFlatL2(embeddings.shape[1])
+    index.add(embeddings)
+    faiss.write_index(index, os.path.join(version_dir, "index.faiss"))
+    if store:
+        write_chunk_store(chunks, os.path.join(version_dir, "chunks.store"))
+    else:
+        with open(os.path.join(version_dir, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False)
+    write_version_manifest(version_dir, version)
+    return version
+
+
+class TestVersoesArtefatos(unittest.TestCase):
+    def setUp(self):
+        self.data_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.embeddings = rng.random((20, 8)).astype('float32')
+        self.chunks = [f"Chunk {i}" for i in range(20)]
+
+    def tearDown(self):
+        shutil.rmtree(self.data_dir, ignore_errors=True)
+
+    def test_publish_and_resolve(self):
+        self.assertIsNone(current_version(self.data_dir))
+        self.assertEqual(resolve_data_dir(self.data_dir), self.data_dir)
+        version = write_version(self.data_dir, self.embeddings, self.chunks)
+        publish_version(self.data_dir, version)
+        self.assertEqual(current_version(self.data_dir), version)
+        self.assertEqual(resolve_data_dir(self.data_dir), version_dir_for(self.data_dir, version))
+
+    def test_incomplete_version_rejected(self):
+        version = write_version(self.data_dir, self.embeddings, self.chunks)
+        with open(os.path.join(version_dir_for(self.data_dir, version), "index.faiss"), "ab") as f:
+            f.write(b"parcial")
+        with self.assertRaises(ValueError):
+            verify_version(version_dir_for(self.data_dir, version))
+        with self.assertRaises(ValueError):
+            publish_version(self.data_dir, version)
+        self.assertIsNone(current_version(self.data_dir))
+
+    def test_prune_keeps_active_version(self):
+        versions = [write_version(self.data_dir, self.embeddings, self.chunks) for _ in range(4)]
+        publish_version(self.data_dir, versions[0])
+        removed = prune_versions(self.data_dir, keep=2)
+        self.assertEqual(removed, versions[1:2])
+        self.assertTrue(os.path.isdir(version_dir_for(self.data_dir, versions[0])))
+
+    def test_engine_swaps_version(self):
+        first = write_version(self.data_dir, self.embeddings, self.chunks)
+        publish_version(self.data_dir, first)
+        engine = RetrievalEngine(self.data_dir, rerank=False).load()
+        self.assertEqual(engine.version, first)
+        self.assertFalse(engine.reload_if_changed())
+        second = write_version(self.data_dir, self.embeddings[:5], [f"Novo {i}" for i in range(5)])
+        publish_version(self.data_dir, second)
+        self.assertTrue(engine.reload_if_changed())
+        self.assertEqual(engine.version, second)
+        self.assertEqual(engine.search_chunks(self.embeddings[3:4], top_k=1, threshold=1e-6), ["Novo 3"])
+
+    def test_old_version_freed_after_in_flight_search(self):
+        first = write_version(self.data_dir, self.embeddings, self.chunks, store=True)
+        publish_version(self.data_dir, first)
+        engine = RetrievalEngine(self.data_dir, rerank=False).load()
+        old_store = engine.chunks
+        with engine.using() as artifacts:
+            publish_version(self.data_dir, write_version(self.data_dir, self.embeddings, self.chunks, store=True))
+            engine.reload()
+            # A busca em andamento continua lendo a versão anterior
+            self.assertEqual(artifacts.chunks[2], "Chunk 2")
+        self.assertNotEqual(engine.version, first)
+        with self.assertRaises(ValueError):
+            old_store[2]
+
+    def test_reload_in_background(self):
+        publish_version(self.data_dir, write_version(self.data_dir, self.embeddings, self.chunks))
+        engine = RetrievalEngine(self.data_dir, rerank=False).load()
+        second = write_version(self.data_dir, self.embeddings[:3], self.chunks[:3])
+        publish_version(self.data_dir, second)
+        engine.reload_in_background().join(timeout=10)
+        self.assertEqual(engine.version, second)
+        self.assertEqual(engine.index.ntotal, 3)
+
+    def test_watcher_detects_new_version(self):
+        seen = []
+        watcher = VersionWatcher(self.data_dir, seen.append, interval=60)
+        self.assertFalse(watcher.check())
+        version = write_version(self.data_dir, self.embeddings, self.chunks)
+        publish_version(self.data_dir, version)
+        self.assertTrue(watcher.check())
+        self.assertFalse(watcher.check())
+        self.assertEqual(seen, [version])
+
+
+if __name__ == "__main__":
+    unittest.main()
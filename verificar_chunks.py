@@ -1,5 +1,8 @@
 # verificar_chunks.py
-import json
-with open("app/rag_data/chunks.json", "r", encoding="utf-8") as f:
-    chunks = json.load(f)
-print(f"Total de chunks: {len(chunks)}")
\ No newline at end of file
+import os
+from app.chunk_store import read_chunks, store_path_for
+
+CHUNKS_JSON = "app/rag_data/chunks.json"
+chunks_path = store_path_for(CHUNKS_JSON) if os.path.exists(store_path_for(CHUNKS_JSON)) else CHUNKS_JSON
+chunks = read_chunks(chunks_path)
+print(f"Total de chunks: {len(chunks)}")